@@ -0,0 +1,420 @@
+"""Time and memory-profile the hot paths on synthetic inputs of growing scale.
+
+Every run appends one JSON record per benchmark and scale to the history file and
+compares it with the median of the previous runs. Run from the project root, e.g.
+
+    python -m benchmarks.run_benchmarks --scales 1e3 1e4 1e5 --check
+
+"""
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import AbstractContextManager, ExitStack, contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from statistics import median
+
+import geopandas as gpd
+from crime_patterns import synthetic
+from crime_patterns.analysis import (
+    gwr,
+    hotspot_forecast,
+    point_patterns,
+    space_time_cube,
+    spatial_regression,
+)
+from crime_patterns.data_management import clean_data
+from shapely import box
+
+HISTORY_PATH = Path(__file__).parent / "results" / "history.jsonl"
+SCALES = [10**3, 10**4, 10**5, 10**6, 10**7]
+
+
+def _setup_evaluate_hotspots(n):
+    incidents = synthetic.make_crime_incidents(n)
+    region = synthetic.make_polygon_grid(100).to_crs("EPSG:4326")
+
+    return lambda: point_patterns.evaluate_hotspots(
+        longitudes=incidents["Longitude"],
+        latitudes=incidents["Latitude"],
+        region=region,
+    )
+
+
+def _setup_cluster_crime_incidents_dbscan(n):
+    incidents = synthetic.make_crime_incidents(n)
+
+    return lambda: point_patterns.cluster_crime_incidents_dbscan(
+        latitudes=incidents["Latitude"],
+        longitudes=incidents["Longitude"],
+        epsilon=1.5,
+        min_samples=max(10, n // 200),
+    )
+
+
+def _setup_ripley_functions(n):
+    incidents = synthetic.make_crime_incidents(n)
+    points = gpd.points_from_xy(
+        incidents["Longitude"],
+        incidents["Latitude"],
+        crs="EPSG:4326",
+    ).to_crs("EPSG:27700")
+    window = gpd.GeoSeries([box(*synthetic.LONDON_BOUNDS_BNG)], crs="EPSG:27700")
+
+    return lambda: point_patterns.ripley_functions(
+        x=points.x,
+        y=points.y,
+        window=window,
+        radii=range(25, 1001, 25),
+        simulations=99,
+        n_workers=None,
+        seed=0,
+    )
+
+
+def _setup_create_weights_matrix(n):
+    grid = synthetic.make_polygon_grid(n)
+
+    return lambda: spatial_regression.create_weights_matrix(grid, method="knn", k=8)
+
+
+def _setup_calculate_morans_I(n):
+    grid = synthetic.make_polygon_grid(n)
+    w = spatial_regression.create_weights_matrix(grid, method="knn", k=8)
+
+    return lambda: spatial_regression.calculate_morans_I(grid, "crime_count", w)
+
+
+def _setup_perform_spatial_regression(method):
+    def setup(n):
+        grid = synthetic.make_polygon_grid(n)
+
+        return lambda: spatial_regression.perform_spatial_regression(
+            db=grid,
+            y_var_name="crime_rate",
+            x_var_names=["EmpScore", "IncScore", "BHSScore"],
+            method=method,
+        )
+
+    return setup
+
+
+def _setup_fit_gwr(n):
+    grid = synthetic.make_polygon_grid(n)
+    grid["crime_rate"] = grid["crime_count"] / grid["pop_count"]
+
+    return lambda: gwr.fit_gwr(
+        grid,
+        "crime_rate",
+        ["EmpScore", "IncScore", "BHSScore"],
+        ID_col_name="ID",
+        n_workers=None,
+    )
+
+
+def _setup_backtest_hotspot_forecasts(n):
+    incidents = synthetic.make_crime_incidents(n)
+    points = gpd.points_from_xy(
+        incidents["Longitude"],
+        incidents["Latitude"],
+        crs="EPSG:4326",
+    ).to_crs("EPSG:27700")
+    cube = space_time_cube.build_incident_cube(
+        points.x,
+        points.y,
+        incidents["Month"],
+        incidents["Crime type"],
+        cell_size=250,
+    )
+
+    return lambda: hotspot_forecast.backtest_hotspot_forecasts(
+        cube,
+        bandwidth=500,
+        crime_type="Burglary",
+        warmup=1,
+    )
+
+
+def _setup_aggregate_regional_level_data(n):
+    lower = synthetic.make_polygon_grid(n).drop(columns="ID")
+    upper = synthetic.make_polygon_grid(max(1, n // 16))[["ID", "geometry"]]
+    upper = upper.rename(columns={"ID": "GSS_CODE"})
+
+    return lambda: clean_data.aggregate_regional_level_data(
+        lower_level_gdf=lower,
+        upper_level_gdf=upper,
+        ID_column_name="GSS_CODE",
+        crs="EPSG:27700",
+    )
+
+
+@contextmanager
+def _setup_ingest(n):
+    ## The CSV takes about 1 GB at 10**7 rows, it is removed after the timing.
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = Path(tmp_dir) / "2019-01-metropolitan-street.csv"
+        synthetic.make_crime_incidents(n).to_csv(path, index=False)
+
+        yield lambda: _ingest(path)
+
+
+def _ingest(path):
+    crime_data = clean_data.clean_monthly_crime_data(
+        crime_incidence_filepath=path,
+        crime_type="Burglary",
+        year="2019",
+        month="01",
+        columns_to_drop=[
+            "Crime ID",
+            "Falls within",
+            "Last outcome category",
+            "Context",
+        ],
+    )
+
+    return clean_data.convert_points_df_to_gdf(df=crime_data).to_crs("EPSG:27700")
+
+
+## Setup functions and the largest scale at which each benchmark is still feasible.
+BENCHMARKS = {
+    "evaluate_hotspots": (_setup_evaluate_hotspots, 10**5),
+    "cluster_crime_incidents_dbscan": (_setup_cluster_crime_incidents_dbscan, 10**6),
+    "ripley_functions": (_setup_ripley_functions, 10**5),
+    "create_weights_matrix": (_setup_create_weights_matrix, 10**6),
+    "calculate_morans_I": (_setup_calculate_morans_I, 10**6),
+    "perform_spatial_regression_OLS": (_setup_perform_spatial_regression("OLS"), 10**5),
+    ## ML_Lag computes a dense log-determinant, 10**4 units already take hours.
+    "perform_spatial_regression_ML_Lag": (
+        _setup_perform_spatial_regression("ML_Lag"),
+        10**3,
+    ),
+    ## The GM estimators only need sparse products with the weights matrix.
+    "perform_spatial_regression_GM_Lag": (
+        _setup_perform_spatial_regression("GM_Lag"),
+        10**5,
+    ),
+    "perform_spatial_regression_GM_Error": (
+        _setup_perform_spatial_regression("GM_Error"),
+        10**5,
+    ),
+    "perform_spatial_regression_GM_Combo": (
+        _setup_perform_spatial_regression("GM_Combo"),
+        10**5,
+    ),
+    "fit_gwr": (_setup_fit_gwr, 10**4),
+    "backtest_hotspot_forecasts": (_setup_backtest_hotspot_forecasts, 10**7),
+    "aggregate_regional_level_data": (_setup_aggregate_regional_level_data, 10**6),
+    "ingest": (_setup_ingest, 10**7),
+}
+
+
+def run_benchmark(name, scale, repeats=3, profile_memory=True):
+    """Time and memory-profile one benchmark at one scale.
+
+    Parameters:
+    -----------
+    name: str
+        Name of the benchmark, a key of `BENCHMARKS`.
+    scale: int
+        Number of incidents or polygons of the synthetic input.
+    repeats: int
+        Number of timed runs, the fastest one is reported.
+    profile_memory: bool
+        Whether to run once more under tracemalloc to measure the peak memory.
+
+    Returns:
+    --------
+    record: dict
+        Benchmark name, scale, seconds and peak memory in MB.
+
+    """
+    setup, _ = BENCHMARKS[name]
+    with ExitStack() as stack:
+        func = setup(scale)
+        ## Setups creating files are context managers removing them on exit.
+        if isinstance(func, AbstractContextManager):
+            func = stack.enter_context(func)
+
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+
+        peak_memory_mb = None
+        if profile_memory:
+            tracemalloc.start()
+            func()
+            peak_memory_mb = tracemalloc.get_traced_memory()[1] / 2**20
+            tracemalloc.stop()
+
+    return {
+        "benchmark": name,
+        "scale": scale,
+        "seconds": min(timings),
+        "peak_memory_mb": peak_memory_mb,
+    }
+
+
+def run_benchmarks(names, scales, repeats=3, profile_memory=True):
+    """Run benchmarks at every scale up to their feasible maximum.
+
+    Parameters:
+    -----------
+    names: list
+        Names of the benchmarks to run.
+    scales: list
+        Scales to run every benchmark at.
+    repeats: int
+        Number of timed runs per benchmark and scale.
+    profile_memory: bool
+        Whether to measure the peak memory.
+
+    Returns:
+    --------
+    records: list
+        List of benchmark records with run metadata.
+
+    """
+    metadata = {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "revision": _git_revision(),
+        "python": platform.python_version(),
+        "machine": platform.node(),
+    }
+
+    records = []
+    for name in names:
+        for scale in scales:
+            if scale > BENCHMARKS[name][1]:
+                continue
+            record = run_benchmark(name, scale, repeats, profile_memory)
+            records.append({**metadata, **record})
+
+    return records
+
+
+def read_history(path=HISTORY_PATH):
+    """Read all benchmark records stored in the history file."""
+    if not Path(path).is_file():
+        return []
+
+    with open(path) as stream:
+        return [json.loads(line) for line in stream if line.strip()]
+
+
+def append_history(records, path=HISTORY_PATH):
+    """Append benchmark records to the history file."""
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+
+    with open(path, "a") as stream:
+        for record in records:
+            stream.write(json.dumps(record) + "\n")
+
+
+def find_regressions(records, history, window=5, threshold=1.25):
+    """Compare records with the median of the previous runs of the same benchmark.
+
+    Parameters:
+    -----------
+    records: list
+        Records of the current run.
+    history: list
+        Records of the previous runs.
+    window: int
+        Number of previous runs the baseline is computed from.
+    threshold: float
+        Ratio to the baseline above which a record counts as a regression.
+
+    Returns:
+    --------
+    regressions: list
+        Records of the current run slower than the baseline, with the added keys
+        "baseline_seconds" and "ratio".
+
+    """
+    regressions = []
+    for record in records:
+        previous = [
+            old["seconds"]
+            for old in history
+            if old["benchmark"] == record["benchmark"]
+            and old["scale"] == record["scale"]
+            and old["machine"] == record["machine"]
+        ][-window:]
+
+        if not previous:
+            continue
+
+        baseline = median(previous)
+        ratio = record["seconds"] / baseline
+        if ratio > threshold:
+            regressions.append(
+                {**record, "baseline_seconds": baseline, "ratio": ratio},
+            )
+
+    return regressions
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--benchmarks", nargs="+", default=list(BENCHMARKS))
+    parser.add_argument("--scales", nargs="+", type=float, default=SCALES[:3])
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--no-memory", action="store_true")
+    parser.add_argument("--history", type=Path, default=HISTORY_PATH)
+    parser.add_argument("--threshold", type=float, default=1.25)
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="Exit with an error if any benchmark regressed.",
+    )
+    args = parser.parse_args(argv)
+
+    history = read_history(args.history)
+    records = run_benchmarks(
+        args.benchmarks,
+        [int(scale) for scale in args.scales],
+        repeats=args.repeats,
+        profile_memory=not args.no_memory,
+    )
+    append_history(records, args.history)
+
+    for record in records:
+        memory = record["peak_memory_mb"]
+        memory = "" if memory is None else f"{memory:10.1f} MB"
+        print(
+            f"{record['benchmark']:<36} {record['scale']:>10,} "
+            f"{record['seconds']:10.4f} s {memory}",
+        )
+
+    regressions = find_regressions(records, history, threshold=args.threshold)
+    for regression in regressions:
+        print(
+            f"REGRESSION {regression['benchmark']} at {regression['scale']:,}: "
+            f"{regression['seconds']:.4f} s vs. baseline "
+            f"{regression['baseline_seconds']:.4f} s ({regression['ratio']:.2f}x)",
+        )
+
+    return 1 if args.check and regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,6 +3,7 @@ import os
 import shutil
 
 import crime_patterns.config as config
+import crime_patterns.utilities as utils
 import pytask
 from pytask_latex import compilation_steps as cs
 
@@ -17,44 +18,74 @@ models_dir = bld / "python" / "models"
 plots_dir = bld / "python" / "figures"
 tables_dir = bld / "python" / "tables"
 
+## The presentation shows the results of a single year.
+data_info = utils.read_yaml(src / "data_management" / "data_info.yaml")
+report_year = data_info["report_year"]
+
 documents = ["crime_patterns_pres"]
 
 for document in documents:
 
     @pytask.mark.depends_on(
         {
-            "burglary_incidents": os.path.join(plots_dir, "burglary_incidents.png"),
-            "burglary_hotspots": os.path.join(plots_dir, "burglary_hotspots.png"),
-            "burglary_clusters": os.path.join(plots_dir, "burglary_clusters.png"),
+            "burglary_incidents": os.path.join(
+                plots_dir,
+                report_year,
+                "burglary_incidents.png",
+            ),
+            "burglary_hotspots": os.path.join(
+                plots_dir,
+                report_year,
+                "burglary_hotspots.png",
+            ),
+            "burglary_clusters": os.path.join(
+                plots_dir,
+                report_year,
+                "burglary_clusters.png",
+            ),
             "imd_scores_lsoa": os.path.join(plots_dir, "imd_scores_lsoa.png"),
             "imd_scores_ward": os.path.join(plots_dir, "imd_scores_ward.png"),
-            "burglary_ward": os.path.join(plots_dir, "burglary_ward.png"),
-            "moran_scatter": os.path.join(plots_dir, "moran_scatter.png"),
-            "moran_distribution": os.path.join(plots_dir, "moran_distribution.png"),
-            "burglary_ward_lag": os.path.join(plots_dir, "burglary_ward_lag.png"),
+            "burglary_ward": os.path.join(plots_dir, report_year, "burglary_ward.png"),
+            "moran_scatter": os.path.join(plots_dir, report_year, "moran_scatter.png"),
+            "moran_distribution": os.path.join(
+                plots_dir,
+                report_year,
+                "moran_distribution.png",
+            ),
+            "burglary_ward_lag": os.path.join(
+                plots_dir,
+                report_year,
+                "burglary_ward_lag.png",
+            ),
             "weights_matrix_ward": os.path.join(plots_dir, "weights_matrix_ward.png"),
             "summary_spatial_ols_tex": os.path.join(
                 tables_dir,
+                report_year,
                 "model_spatial_ols_summary.tex",
             ),
             "spat_diag_ols_tex": os.path.join(
                 tables_dir,
+                report_year,
                 "spat_diag_ols_tex.tex",
             ),
             "summary_spatial_ml_lag_tex": os.path.join(
                 tables_dir,
+                report_year,
                 "model_spatial_ml_lag_summary.tex",
             ),
             "summary_spatial_ml_error_tex": os.path.join(
                 tables_dir,
+                report_year,
                 "model_spatial_ml_error_summary.tex",
             ),
             "ml_lag_stats_tex": os.path.join(
                 tables_dir,
+                report_year,
                 "ml_lag_stats.tex",
             ),
             "ml_error_stats_tex": os.path.join(
                 tables_dir,
+                report_year,
                 "ml_error_stats.tex",
             ),
         },
@@ -0,0 +1,314 @@
+"""Geographically weighted regression with an adaptive bisquare kernel."""
+
+import os
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+import crime_patterns.utilities as utils
+
+## Maximum number of focal observations times neighbours fitted at once.
+PAIRS_PER_BATCH = 2**18
+
+## Fraction of the bracket kept by every step of the golden-section search.
+INVERSE_GOLDEN_RATIO = (np.sqrt(5) - 1) / 2
+
+## Design and nearest neighbours shared with the GWR workers.
+_GWR_STATE = {}
+
+
+def gwr_design(db, y_var_name, x_var_names):
+    """Function to extract the GWR design from a regression database.
+
+    Parameters:
+    -----------
+    db: geopandas.GeoDataFrame
+        GeoDataFrame as returned by `prepare_data_for_spatial_regression`, in a
+        projected CRS.
+    y_var_name: str
+        Name of the column containing the dependent variable.
+    x_var_names: list
+        List of names of the independent variables.
+
+    Returns:
+    --------
+    y: numpy.ndarray
+        Dependent variable of shape (n,).
+    x: numpy.ndarray
+        Design matrix of shape (n, p) with a constant in the first column.
+    coords: numpy.ndarray
+        Centroids of the observations of shape (n, 2).
+
+    """
+    y = db[y_var_name].to_numpy(dtype=float)
+    x = np.column_stack([np.ones(len(db)), db[x_var_names].to_numpy(dtype=float)])
+    centroids = db.geometry.centroid
+    coords = np.column_stack([centroids.x, centroids.y])
+
+    return y, x, coords
+
+
+def nearest_neighbours(coords, max_neighbours):
+    """Function to cache the nearest neighbours of every observation.
+
+    Parameters:
+    -----------
+    coords: numpy.ndarray
+        Coordinates of shape (n, 2).
+    max_neighbours: int
+        Number of neighbours to cache, the largest bandwidth that can be fitted.
+
+    Returns:
+    --------
+    distances: numpy.ndarray
+        Distances of shape (n, max_neighbours) to the neighbours, sorted in
+        increasing order and starting with the observation itself.
+    indices: numpy.ndarray
+        Indices of the neighbours of shape (n, max_neighbours).
+
+    """
+    max_neighbours = min(max_neighbours, len(coords))
+    distances, indices = cKDTree(coords).query(coords, k=max_neighbours)
+
+    return distances.reshape(len(coords), -1), indices.reshape(len(coords), -1)
+
+
+def select_gwr_bandwidth(
+    y,
+    x,
+    neighbours,
+    min_neighbours=None,
+    max_neighbours=None,
+    n_workers=1,
+):
+    """Function to select the adaptive bandwidth by golden-section search on AICc.
+
+    The bandwidth is the number of nearest neighbours with a positive weight. Every
+    candidate fits all local regressions, split into batches that are evaluated in
+    parallel together with the other new candidates of the step.
+
+    Parameters:
+    -----------
+    y: numpy.ndarray
+        Dependent variable of shape (n,).
+    x: numpy.ndarray
+        Design matrix of shape (n, p).
+    neighbours: tuple
+        Cached distances and indices of the nearest neighbours, see
+        `nearest_neighbours`.
+    min_neighbours: int
+        Smallest candidate, by default twice the number of columns of ``x`` plus
+        one, at least 20.
+    max_neighbours: int
+        Largest candidate, by default the number of cached neighbours.
+    n_workers: int
+        Number of processes fitting the batches. None uses all CPUs.
+
+    Returns:
+    --------
+    bandwidth: int
+        Number of neighbours minimising the AICc.
+    aicc: pandas.Series
+        AICc of every evaluated candidate.
+
+    """
+    n_cached = neighbours[1].shape[1]
+    max_neighbours = min(max_neighbours or n_cached, n_cached)
+    min_neighbours = min(min_neighbours or max(2 * x.shape[1] + 1, 20), max_neighbours)
+
+    aicc = {}
+    with _gwr_pool(y, x, neighbours, n_workers) as map_func:
+
+        def evaluate(candidates):
+            new = sorted({int(k) for k in candidates} - set(aicc))
+            if new:
+                aicc.update(zip(new, _aicc(map_func, new, len(y))))
+
+        lower, upper = min_neighbours, max_neighbours
+        while upper - lower > 3:
+            step = round(INVERSE_GOLDEN_RATIO * (upper - lower))
+            left, right = upper - step, lower + step
+            evaluate([left, right])
+            if aicc[left] <= aicc[right]:
+                upper = right
+            else:
+                lower = left
+
+        evaluate(range(lower, upper + 1))
+
+    aicc = pd.Series(aicc, name="AICc").rename_axis("bandwidth").sort_index()
+
+    return int(aicc.idxmin()), aicc
+
+
+def fit_gwr(
+    db,
+    y_var_name,
+    x_var_names,
+    bandwidth=None,
+    max_neighbours=1000,
+    ID_col_name="GSS_CODE",
+    n_workers=1,
+):
+    """Function to fit a geographically weighted regression.
+
+    Every observation gets its own weighted least squares fit, with adaptive
+    bisquare weights ``(1 - (d / d_k) ** 2) ** 2`` of its ``k`` nearest neighbours.
+    The neighbours are searched once and shared by the bandwidth search and the
+    final fit.
+
+    Parameters:
+    -----------
+    db: geopandas.GeoDataFrame
+        GeoDataFrame as returned by `prepare_data_for_spatial_regression`, in a
+        projected CRS.
+    y_var_name: str
+        Name of the column containing the dependent variable.
+    x_var_names: list
+        List of names of the independent variables.
+    bandwidth: int
+        Number of neighbours of every local regression. If None, it is selected by
+        `select_gwr_bandwidth`.
+    max_neighbours: int
+        Number of cached neighbours, the largest bandwidth searched.
+    ID_col_name: str
+        Name of the column containing the ID of the observations.
+    n_workers: int
+        Number of processes fitting the batches. None uses all CPUs.
+
+    Returns:
+    --------
+    gwr: geopandas.GeoDataFrame
+        Local coefficients, standard errors and t-values of every variable, the
+        local R-squared and the residual of every observation. The bandwidth, the
+        AICc, the trace of the hat matrix, the residual variance and the AICc of
+        the searched bandwidths are stored in ``gwr.attrs``.
+
+    """
+    y, x, coords = gwr_design(db, y_var_name, x_var_names)
+    neighbours = nearest_neighbours(coords, max(max_neighbours, bandwidth or 0))
+
+    if bandwidth is None:
+        bandwidth, aicc_curve = select_gwr_bandwidth(
+            y,
+            x,
+            neighbours,
+            n_workers=n_workers,
+        )
+    else:
+        aicc_curve = pd.Series(dtype=float, name="AICc")
+
+    with _gwr_pool(y, x, neighbours, n_workers) as map_func:
+        fits = map_func(
+            _fit_batch,
+            [(bandwidth, rows, True) for rows in _batches(len(y), bandwidth)],
+        )
+
+    betas = np.concatenate([fit["betas"] for fit in fits])
+    hat = np.concatenate([fit["hat"] for fit in fits])
+    variances = np.concatenate([fit["variances"] for fit in fits])
+    local_r2 = np.concatenate([fit["local_r2"] for fit in fits])
+
+    residuals = y - (x * betas).sum(axis=1)
+    rss = residuals @ residuals
+    trace = hat.sum()
+    sigma2 = rss / (len(y) - trace)
+    standard_errors = np.sqrt(sigma2 * variances)
+
+    names = ["CONSTANT", *x_var_names]
+    gwr = db[[ID_col_name, "geometry"]].copy()
+    for j, name in enumerate(names):
+        gwr[name] = betas[:, j]
+        gwr[f"se_{name}"] = standard_errors[:, j]
+        gwr[f"t_{name}"] = betas[:, j] / standard_errors[:, j]
+    gwr["local_r2"] = local_r2
+    gwr["residual"] = residuals
+
+    gwr.attrs = {
+        "bandwidth": bandwidth,
+        "aicc": _aicc_from_fit(rss, trace, len(y)),
+        "trace": trace,
+        "sigma2": sigma2,
+        "aicc_curve": aicc_curve.to_dict(),
+    }
+
+    return gwr
+
+
+def _gwr_pool(y, x, neighbours, n_workers):
+    return utils.process_pool(
+        n_workers=n_workers or os.cpu_count() or 1,
+        initializer=_init_gwr_worker,
+        initargs=(y, x, *neighbours),
+    )
+
+
+def _init_gwr_worker(y, x, distances, indices):
+    _GWR_STATE.clear()
+    _GWR_STATE.update({"y": y, "x": x, "distances": distances, "indices": indices})
+
+
+def _batches(n, bandwidth):
+    """Slices of the focal observations fitted together."""
+    size = max(1, PAIRS_PER_BATCH // bandwidth)
+
+    return [slice(start, min(start + size, n)) for start in range(0, n, size)]
+
+
+def _aicc(map_func, candidates, n):
+    """AICc of the candidate bandwidths, all batches mapped at once."""
+    tasks = [(k, rows, False) for k in candidates for rows in _batches(n, k)]
+    fits = map_func(_fit_batch, tasks)
+
+    rss, trace = dict.fromkeys(candidates, 0.0), dict.fromkeys(candidates, 0.0)
+    for (k, _, _), fit in zip(tasks, fits):
+        rss[k] += fit["rss"]
+        trace[k] += fit["hat"].sum()
+
+    return [_aicc_from_fit(rss[k], trace[k], n) for k in candidates]
+
+
+def _aicc_from_fit(rss, trace, n):
+    """Corrected Akaike information criterion of a GWR fit."""
+    log_likelihood = -n / 2 * (1 + np.log(2 * np.pi * rss / n))
+
+    return -2 * log_likelihood + 2 * n * (trace + 1) / (n - trace - 2)
+
+
+def _fit_batch(task):
+    """Fit the local regressions of a batch of focal observations."""
+    bandwidth, rows, full_output = task
+    y, x = _GWR_STATE["y"], _GWR_STATE["x"]
+    distances = _GWR_STATE["distances"][rows, :bandwidth]
+    indices = _GWR_STATE["indices"][rows, :bandwidth]
+
+    ## Adaptive bisquare kernel, the k-th neighbour has weight 0.
+    radius = distances[:, -1:]
+    weights = (1 - (distances / np.where(radius > 0, radius, 1)) ** 2) ** 2
+
+    x_local = x[indices]
+    y_local = y[indices]
+    xtwx = np.einsum("bk,bkp,bkq->bpq", weights, x_local, x_local)
+    xtwy = np.einsum("bk,bkp,bk->bp", weights, x_local, y_local)
+    xtwx_inv = np.linalg.inv(xtwx)
+    betas = np.einsum("bpq,bq->bp", xtwx_inv, xtwy)
+
+    ## Diagonal of the hat matrix, the focal observation has weight 1.
+    x_focal = x[rows]
+    hat = np.einsum("bp,bpq,bq->b", x_focal, xtwx_inv, x_focal)
+    residuals = y[rows] - (x_focal * betas).sum(axis=1)
+
+    if not full_output:
+        return {"rss": residuals @ residuals, "hat": hat}
+
+    ## Sandwich (X'WX)^-1 X'W^2X (X'WX)^-1, scaled by the residual variance later.
+    xtw2x = np.einsum("bk,bkp,bkq->bpq", weights**2, x_local, x_local)
+    variances = np.einsum("bpq,bqr,brp->bp", xtwx_inv, xtw2x, xtwx_inv)
+
+    local_residuals = y_local - np.einsum("bkp,bp->bk", x_local, betas)
+    weighted_mean = (weights * y_local).sum(axis=1) / weights.sum(axis=1)
+    total = (weights * (y_local - weighted_mean[:, None]) ** 2).sum(axis=1)
+    local_r2 = 1 - (weights * local_residuals**2).sum(axis=1) / total
+
+    return {"betas": betas, "hat": hat, "variances": variances, "local_r2": local_r2}
@@ -0,0 +1,254 @@
+"""Prospective hotspot forecasts from exponentially decayed kernel surfaces."""
+
+import numpy as np
+import shapely
+import xarray as xr
+from scipy import ndimage
+
+## Standard deviations after which the Gaussian kernel is truncated.
+KERNEL_TRUNCATE = 4.0
+
+## Shares of the study area at which the hit rates are evaluated by default.
+AREA_FRACTIONS = np.arange(1, 101) / 100
+
+
+def monthly_counts(cube, crime_type=None):
+    """Function to extract the monthly counts of a space-time cube.
+
+    Parameters:
+    -----------
+    cube: xarray.Dataset
+        Cube as returned by `space_time_cube.build_incident_cube`. The months are
+        expected to be consecutive.
+    crime_type: str or list
+        Crime type or list of crime types to count. If None, all crime types are
+        counted.
+
+    Returns:
+    --------
+    counts: xarray.DataArray
+        Loaded counts over the dimensions (month, x, y).
+
+    """
+    counts = cube["counts"]
+    if crime_type is not None:
+        counts = counts.sel(crime_type=np.atleast_1d(crime_type))
+
+    return counts.sum("crime_type").transpose("month", "x", "y").load()
+
+
+def update_surface(surface, counts, bandwidth_cells, decay):
+    """Function to add a month of counts to an exponentially decayed surface.
+
+    The kernel smoothing is linear, so decaying the previous surface and adding the
+    smoothed new counts equals smoothing the decayed counts of all months. Every
+    update therefore smooths a single month.
+
+    Parameters:
+    -----------
+    surface: numpy.ndarray
+        Surface of the previous months of shape (n_x, n_y), or None for the first
+        month.
+    counts: numpy.ndarray
+        Counts of the new month of shape (n_x, n_y).
+    bandwidth_cells: float
+        Standard deviation of the Gaussian kernel, in grid cells.
+    decay: float
+        Weight of the previous surface, between 0 and 1. A decay of 1 accumulates
+        all months with equal weights.
+
+    Returns:
+    --------
+    surface: numpy.ndarray
+        Updated surface of shape (n_x, n_y).
+
+    """
+    smoothed = ndimage.gaussian_filter(
+        np.asarray(counts, dtype=float),
+        sigma=bandwidth_cells,
+        mode="constant",
+        truncate=KERNEL_TRUNCATE,
+    )
+
+    if surface is None:
+        return smoothed
+
+    return decay * surface + smoothed
+
+
+def forecast_hotspots(cube, bandwidth, decay=0.7, crime_type=None):
+    """Function to forecast the hotspots of the month after every month of a cube.
+
+    Parameters:
+    -----------
+    cube: xarray.Dataset
+        Cube as returned by `space_time_cube.build_incident_cube`. The months are
+        expected to be consecutive.
+    bandwidth: float
+        Standard deviation of the Gaussian kernel, in the unit of the coordinates.
+    decay: float
+        Monthly weight of the previous surface, see `update_surface`.
+    crime_type: str or list
+        Crime type or list of crime types to forecast. If None, all crime types are
+        counted.
+
+    Returns:
+    --------
+    forecast: xarray.DataArray
+        Forecast over the dimensions (month, x, y), normalized to sum to 1 per
+        month. The surface of a month uses the counts up to and including that
+        month and forecasts the share of the incidents of the following month
+        falling into every cell.
+
+    """
+    counts = monthly_counts(cube, crime_type)
+    bandwidth_cells = bandwidth / cube.attrs["cell_size"]
+
+    surfaces = np.empty(counts.shape)
+    surface = None
+    for i, month_counts in enumerate(counts.to_numpy()):
+        surface = update_surface(surface, month_counts, bandwidth_cells, decay)
+        surfaces[i] = surface
+
+    total = surfaces.sum(axis=(1, 2), keepdims=True)
+    forecast = counts.copy(data=surfaces / np.where(total > 0, total, 1))
+    forecast.name = "forecast"
+    forecast.attrs = {"bandwidth": bandwidth, "decay": decay}
+
+    return forecast
+
+
+def hit_rate_curve(forecast, observed, area_fractions=AREA_FRACTIONS):
+    """Function to score a forecast by its hit rates and predictive accuracy index.
+
+    The cells are ranked by their forecast, and the hit rate at an area fraction is
+    the share of the observed incidents in the highest ranked cells covering that
+    fraction of the cells. The predictive accuracy index (PAI) divides the hit rate
+    by the area fraction, so a random ranking scores 1.
+
+    Parameters:
+    -----------
+    forecast: numpy.ndarray
+        Forecast of every cell.
+    observed: numpy.ndarray
+        Observed counts of every cell, in the order of ``forecast``.
+    area_fractions: array-like
+        Shares of the cells flagged as hotspots, between 0 and 1.
+
+    Returns:
+    --------
+    hit_rate: numpy.ndarray
+        Hit rate at every area fraction, NaN if nothing was observed.
+    pai: numpy.ndarray
+        Predictive accuracy index at every area fraction.
+
+    """
+    forecast = np.ravel(forecast)
+    observed = np.ravel(observed)
+
+    order = np.argsort(-forecast, kind="stable")
+    captured = np.cumsum(observed[order])
+    n_cells = np.clip(
+        np.ceil(np.asarray(area_fractions) * len(forecast)).astype(int),
+        1,
+        len(forecast),
+    )
+
+    if captured[-1] > 0:
+        hit_rate = captured[n_cells - 1] / captured[-1]
+    else:
+        hit_rate = np.full(len(n_cells), np.nan)
+
+    return hit_rate, hit_rate / (n_cells / len(forecast))
+
+
+def backtest_hotspot_forecasts(
+    cube,
+    bandwidth,
+    decay=0.7,
+    crime_type=None,
+    area_fractions=AREA_FRACTIONS,
+    window=None,
+    warmup=3,
+):
+    """Function to backtest the forecasts of `forecast_hotspots` month by month.
+
+    The surface is rolled forward over the cube and updated with a single month
+    at a time. Before every update it is scored against the counts of the month
+    that is about to enter it.
+
+    Parameters:
+    -----------
+    cube: xarray.Dataset
+        Cube as returned by `space_time_cube.build_incident_cube`. The months are
+        expected to be consecutive.
+    bandwidth: float
+        Standard deviation of the Gaussian kernel, in the unit of the coordinates.
+    decay: float
+        Monthly weight of the previous surface, see `update_surface`.
+    crime_type: str or list
+        Crime type or list of crime types to forecast. If None, all crime types are
+        counted.
+    area_fractions: array-like
+        Shares of the study area flagged as hotspots, between 0 and 1.
+    window: geopandas.GeoDataFrame
+        Study area in the CRS of the cube. Only cells with their centre inside are
+        ranked. If None, all cells of the cube are ranked.
+    warmup: int
+        Number of months entering the surface before the first scored month.
+
+    Returns:
+    --------
+    backtest: xarray.Dataset
+        Dataset with the hit rate and the PAI over the dimensions (month,
+        area_fraction) and the number of observed incidents per month. The month
+        is the forecast month.
+
+    """
+    counts = monthly_counts(cube, crime_type)
+    bandwidth_cells = bandwidth / cube.attrs["cell_size"]
+
+    if window is None:
+        inside = np.ones(counts.shape[1:], dtype=bool)
+    else:
+        window = shapely.union_all(window.geometry.values)
+        x, y = np.meshgrid(counts["x"], counts["y"], indexing="ij")
+        inside = shapely.contains_xy(window, x, y)
+
+    first = max(warmup, 1)
+    hit_rates, pais, incidents = [], [], []
+    surface = None
+    for i, month_counts in enumerate(counts.to_numpy()):
+        if i >= first:
+            hit_rate, pai = hit_rate_curve(
+                surface[inside],
+                month_counts[inside],
+                area_fractions,
+            )
+            hit_rates.append(hit_rate)
+            pais.append(pai)
+            incidents.append(month_counts[inside].sum())
+
+        surface = update_surface(surface, month_counts, bandwidth_cells, decay)
+
+    months = counts["month"].values[first:]
+    shape = (len(months), len(area_fractions))
+    backtest = xr.Dataset(
+        data_vars={
+            "hit_rate": (["month", "area_fraction"], np.reshape(hit_rates, shape)),
+            "pai": (["month", "area_fraction"], np.reshape(pais, shape)),
+            "incidents": (["month"], np.asarray(incidents, dtype=np.int64)),
+        },
+        coords={
+            "month": months,
+            "area_fraction": np.asarray(area_fractions, dtype=float),
+        },
+    )
+    backtest.attrs = {
+        "Description": "Rolling backtest of the decayed hotspot forecasts",
+        "bandwidth": bandwidth,
+        "decay": decay,
+        "warmup": warmup,
+    }
+
+    return backtest
@@ -0,0 +1,477 @@
+"""Gaussian kernel density estimation truncated at a cutoff radius.
+
+The bandwidth can be selected by cross-validation on binned points, see
+`select_bandwidth`.
+"""
+
+import os
+
+import numpy as np
+from scipy import ndimage
+from scipy import signal
+from scipy.spatial import cKDTree
+
+import crime_patterns.utilities as utils
+
+## Number of bandwidth classes, points of a class share a KD-tree and search radius.
+N_BANDWIDTH_CLASSES = 8
+
+## Maximum number of query-point pairs evaluated at once within a tile.
+PAIRS_PER_CHUNK = 2**21
+
+## Spacing of the pilot grid in units of the fixed bandwidth, and its maximum
+## number of nodes per axis.
+PILOT_SPACING = 0.25
+PILOT_MAX_NODES = 512
+
+## Spacing of the cross-validation grid as a fraction of the smallest candidate
+## bandwidth, and its maximum number of nodes per axis.
+CV_SPACING = 0.1
+CV_MAX_NODES = 1024
+
+## Truncation tolerance of the kernels convolved with the binned points.
+CV_RTOL = 1e-6
+
+## Offsets of the four grid nodes a point is binned to.
+_BIN_CORNERS = [(0, 0), (0, 1), (1, 0), (1, 1)]
+
+## Points, bandwidths and KD-trees shared with the tile workers.
+_KDE_STATE = {}
+
+## Binned points shared with the cross-validation workers.
+_CV_STATE = {}
+
+
+def bandwidth_factor(bandwidth, n, d=2):
+    """Function to compute the bandwidth factor of a rule of thumb.
+
+    Parameters
+    ----------
+    bandwidth : str or float
+        "scott", "silverman" or a scalar factor, which is returned as is.
+    n : int
+        Number of points.
+    d : int, optional
+        Number of dimensions, by default 2.
+
+    Returns:
+    -------
+    float
+        Factor scaling the standard deviations of the data to those of the kernel.
+
+    """
+    if bandwidth == "scott":
+        return n ** (-1 / (d + 4))
+    if bandwidth == "silverman":
+        return (n * (d + 2) / 4) ** (-1 / (d + 4))
+
+    return float(bandwidth)
+
+
+def kernel_covariance(values, bandwidth="scott"):
+    """Function to compute the covariance of the Gaussian kernel.
+
+    The kernel covariance is the data covariance scaled by the squared bandwidth
+    factor, as in `scipy.stats.gaussian_kde`.
+
+    Parameters
+    ----------
+    values : numpy.ndarray
+        Array of shape (2, n) with the coordinates of the points.
+    bandwidth : str or float, optional
+        Bandwidth factor, "scott", "silverman" or a scalar, by default "scott".
+
+    Returns:
+    -------
+    numpy.ndarray
+        Covariance matrix of shape (2, 2).
+
+    """
+    d, n = values.shape
+    factor = bandwidth_factor(bandwidth, n, d)
+
+    return np.atleast_2d(np.cov(values)) * factor**2
+
+
+def cv_scores(values, factors, method="lscv", n_workers=1):
+    """Function to compute a cross-validation criterion of Gaussian kernel estimates.
+
+    The points are linearly binned on a grid in whitened coordinates, so the
+    leave-one-out sums over all pairs reduce to FFT convolutions of the bin counts
+    with the kernel. The grid spacing is a tenth of the smallest bandwidth, up to
+    ``CV_MAX_NODES`` nodes per axis.
+
+    Parameters
+    ----------
+    values : numpy.ndarray
+        Array of shape (2, n) with the coordinates of the points.
+    factors : array-like
+        Candidate bandwidth factors, the kernel covariance is ``factor ** 2`` times
+        the data covariance as in `kernel_covariance`.
+    method : str, optional
+        "lscv" for least-squares cross-validation, to be minimized, or "lcv" for
+        likelihood cross-validation (mean leave-one-out log density), to be
+        maximized, by default "lscv".
+    n_workers : int, optional
+        Number of processes evaluating the candidates, by default 1. None uses all
+        CPUs.
+
+    Returns:
+    -------
+    numpy.ndarray
+        Criterion of every candidate factor.
+
+    """
+    if method not in ("lscv", "lcv"):
+        raise ValueError(f"Unknown cross-validation method {method!r}.")
+
+    values = np.atleast_2d(np.asarray(values, dtype=float))
+    factors = np.asarray(factors, dtype=float)
+
+    cholesky = np.linalg.cholesky(np.atleast_2d(np.cov(values)))
+    points = np.linalg.solve(cholesky, values).T
+
+    extent = (points.max(axis=0) - points.min(axis=0)).max()
+    spacing = max(factors.min() * CV_SPACING, extent / (CV_MAX_NODES - 2))
+    counts, base, weights = _bin_points(points, spacing)
+
+    n_workers = n_workers or os.cpu_count() or 1
+    with utils.process_pool(
+        n_workers=min(n_workers, len(factors)),
+        initializer=_init_cv_worker,
+        initargs=(counts, base, weights, spacing, method),
+    ) as map_func:
+        scores = np.array(map_func(_cv_score, factors))
+
+    ## Back from whitened to the original coordinates.
+    log_det = np.log(np.prod(np.diag(cholesky)))
+    if method == "lscv":
+        return scores / np.exp(log_det)
+
+    return scores - log_det
+
+
+def select_bandwidth(values, factors=None, method="lscv", n_workers=1):
+    """Function to select the bandwidth factor by cross-validation.
+
+    Both criteria favour ever smaller bandwidths when many points coincide, so a
+    factor at the low end of the candidates hints at duplicated coordinates.
+
+    Parameters
+    ----------
+    values : numpy.ndarray
+        Array of shape (2, n) with the coordinates of the points.
+    factors : array-like, optional
+        Candidate bandwidth factors, by default 25 factors log-spaced between a
+        twentieth and twice Scott's factor.
+    method : str, optional
+        Criterion passed to `cv_scores`, by default "lscv".
+    n_workers : int, optional
+        Number of processes evaluating the candidates, by default 1. None uses all
+        CPUs.
+
+    Returns:
+    -------
+    tuple
+        The selected factor, the candidate factors and their criterion.
+
+    """
+    values = np.atleast_2d(np.asarray(values, dtype=float))
+
+    if factors is None:
+        scott = bandwidth_factor("scott", values.shape[1], values.shape[0])
+        factors = np.geomspace(scott / 20, scott * 2, 25)
+    factors = np.asarray(factors, dtype=float)
+
+    scores = cv_scores(values, factors, method=method, n_workers=n_workers)
+    best = np.argmin(scores) if method == "lscv" else np.argmax(scores)
+
+    return float(factors[best]), factors, scores
+
+
+def truncated_kde(
+    values,
+    positions,
+    bandwidth="scott",
+    adaptive=False,
+    alpha=0.5,
+    rtol=1e-6,
+    n_workers=1,
+):
+    """Function to evaluate a Gaussian kernel density estimate truncated at a cutoff.
+
+    Every kernel is cut off where it falls below ``rtol`` times its peak, so only
+    the points within the cutoff radius of a position, found with a KD-tree, add to
+    its density. The positions are evaluated in tiles, in parallel.
+
+    With ``adaptive=True`` the bandwidth of every point is scaled by Abramson's
+    factor ``(pilot / g) ** -alpha``, where the pilot is the fixed bandwidth
+    estimate at the point and ``g`` the geometric mean of the pilot, so kernels
+    are narrower in dense areas and wider in sparse ones. The pilot is evaluated
+    on a grid a quarter bandwidth apart and interpolated at the points.
+
+    Parameters
+    ----------
+    values : numpy.ndarray
+        Array of shape (2, n) with the coordinates of the points.
+    positions : numpy.ndarray
+        Array of shape (2, m) with the coordinates to evaluate the density at.
+    bandwidth : str, float or numpy.ndarray, optional
+        Bandwidth factor passed to `kernel_covariance`, or the (2, 2) kernel
+        covariance itself, by default "scott".
+    adaptive : bool, optional
+        Whether to use Abramson's adaptive bandwidths, by default False.
+    alpha : float, optional
+        Sensitivity of the adaptive bandwidths to the pilot density, by default 0.5.
+    rtol : float, optional
+        Kernels are truncated below ``rtol`` times their peak, by default 1e-6.
+        The absolute error is at most ``rtol`` times the peak density of the
+        narrowest kernel.
+    n_workers : int, optional
+        Number of processes evaluating the tiles, by default 1. None uses all CPUs.
+
+    Returns:
+    -------
+    numpy.ndarray
+        Array of shape (m,) with the densities. With ``rtol=0`` and
+        ``adaptive=False`` they equal those of `scipy.stats.gaussian_kde`.
+
+    """
+    values = np.atleast_2d(np.asarray(values, dtype=float))
+    positions = np.atleast_2d(np.asarray(positions, dtype=float))
+    n = values.shape[1]
+
+    if isinstance(bandwidth, np.ndarray) and bandwidth.ndim == 2:
+        covariance = bandwidth
+    else:
+        covariance = kernel_covariance(values, bandwidth)
+
+    ## Whitened coordinates turn the kernel into a standard normal.
+    cholesky = np.linalg.cholesky(covariance)
+    points = np.linalg.solve(cholesky, values).T
+    queries = np.linalg.solve(cholesky, positions).T
+    norm = 1 / (n * 2 * np.pi * np.prod(np.diag(cholesky)))
+
+    radius = np.sqrt(-2 * np.log(rtol)) if rtol > 0 else np.inf
+    n_workers = n_workers or os.cpu_count() or 1
+
+    bandwidths = np.ones(n)
+    if adaptive:
+        pilot = norm * _pilot_kernel_sums(points, radius, n_workers)
+        geometric_mean = np.exp(np.mean(np.log(pilot)))
+        bandwidths = (pilot / geometric_mean) ** -alpha
+
+    return norm * _kernel_sums(points, bandwidths, queries, radius, n_workers)
+
+
+def _bin_points(points, spacing):
+    """Linear binning of the points on a grid with the given spacing.
+
+    Returns the bin counts, and the lower bin and weight of the upper bin of every
+    point along every axis.
+    """
+    fractional = (points - points.min(axis=0)) / spacing
+    base = np.floor(fractional).astype(np.int64)
+    weights = fractional - base
+    shape = tuple(base.max(axis=0) + 2)
+
+    counts = np.zeros(np.prod(shape))
+    for dx, dy in _BIN_CORNERS:
+        counts += np.bincount(
+            np.ravel_multi_index((base[:, 0] + dx, base[:, 1] + dy), shape),
+            weights=_corner_weights(weights, dx, dy),
+            minlength=counts.size,
+        )
+
+    return counts.reshape(shape), base, weights
+
+
+def _corner_weights(weights, dx, dy):
+    """Linear binning weights of the points for one corner of their bin."""
+    return np.abs(1 - dx - weights[:, 0]) * np.abs(1 - dy - weights[:, 1])
+
+
+def _init_cv_worker(counts, base, weights, spacing, method):
+    """Store the binned points."""
+    _CV_STATE.clear()
+    _CV_STATE.update(
+        {
+            "counts": counts,
+            "base": base,
+            "weights": weights,
+            "spacing": spacing,
+            "method": method,
+        },
+    )
+
+
+def _binned_kernel_sums(sd):
+    """Sum of the kernels with standard deviation ``sd`` of all points at every bin."""
+    counts = _CV_STATE["counts"]
+    spacing = _CV_STATE["spacing"]
+
+    half_width = int(
+        min(np.ceil(np.sqrt(-2 * np.log(CV_RTOL)) * sd / spacing), max(counts.shape)),
+    )
+    offsets = np.arange(-half_width, half_width + 1) * spacing
+    kernel = np.exp(-0.5 * (offsets / sd) ** 2)
+
+    return signal.fftconvolve(
+        counts,
+        np.outer(kernel, kernel) / (2 * np.pi * sd**2),
+        mode="same",
+    )
+
+
+def _cv_score(factor):
+    """Cross-validation criterion of one bandwidth factor in whitened coordinates."""
+    base = _CV_STATE["base"]
+    weights = _CV_STATE["weights"]
+    n = len(base)
+
+    ## Kernel sums interpolated back at the points, without the binned kernel of
+    ## the point itself, so no point ever sees its own mass.
+    pair_sums = _binned_kernel_sums(factor)
+    neighbour = np.exp(-0.5 * (_CV_STATE["spacing"] / factor) ** 2)
+    self_sums = np.prod(
+        weights**2 + (1 - weights) ** 2 + 2 * weights * (1 - weights) * neighbour,
+        axis=1,
+    ) / (2 * np.pi * factor**2)
+    leave_one_out = np.maximum(_interpolate(pair_sums, base, weights) - self_sums, 0)
+    leave_one_out /= n - 1
+
+    if _CV_STATE["method"] == "lscv":
+        squared_integral = (
+            _CV_STATE["counts"] * _binned_kernel_sums(np.sqrt(2) * factor)
+        ).sum()
+
+        return squared_integral / n**2 - 2 * leave_one_out.mean()
+
+    ## Densities below the round-off of the FFT convolution are not resolved.
+    noise_floor = np.finfo(float).eps * pair_sums.max() / (n - 1)
+
+    return np.log(np.maximum(leave_one_out, noise_floor)).mean()
+
+
+def _interpolate(grid, base, weights):
+    """Bilinear interpolation of grid values at binned points."""
+    return sum(
+        grid[base[:, 0] + dx, base[:, 1] + dy] * _corner_weights(weights, dx, dy)
+        for dx, dy in _BIN_CORNERS
+    )
+
+
+def _pilot_kernel_sums(points, radius, n_workers):
+    """Fixed bandwidth kernel sums at the points, interpolated from a grid."""
+    lower, upper = points.min(axis=0), points.max(axis=0)
+    shape = np.clip(
+        np.ceil((upper - lower) / PILOT_SPACING).astype(int) + 1,
+        2,
+        PILOT_MAX_NODES,
+    )
+    axes = [np.linspace(lo, hi, k) for lo, hi, k in zip(lower, upper, shape)]
+    nodes = np.stack(np.meshgrid(*axes, indexing="ij"), axis=-1).reshape(-1, 2)
+
+    grid_sums = _kernel_sums(points, np.ones(len(points)), nodes, radius, n_workers)
+
+    ## Fractional grid coordinates of the points for bilinear interpolation.
+    coordinates = (points - lower) / np.maximum(upper - lower, 1e-300) * (shape - 1)
+
+    return ndimage.map_coordinates(
+        grid_sums.reshape(shape),
+        coordinates.T,
+        order=1,
+        mode="nearest",
+    )
+
+
+def _kernel_sums(points, bandwidths, queries, radius, n_workers):
+    """Sum of the truncated kernels of all points at every query, tile by tile."""
+    if not np.isfinite(radius):
+        tiles = [np.arange(len(queries))]
+    else:
+        ## Tiles about as wide as a typical kernel support.
+        tile_size = radius * np.median(bandwidths)
+        cells = np.floor(queries / tile_size).astype(np.int64)
+        _, tile_index = np.unique(cells, axis=0, return_inverse=True)
+        order = np.argsort(tile_index.ravel(), kind="stable")
+        tiles = np.split(order, np.flatnonzero(np.diff(tile_index.ravel()[order])) + 1)
+
+    with utils.process_pool(
+        n_workers=min(n_workers, len(tiles)),
+        initializer=_init_kde_worker,
+        initargs=(points, bandwidths, radius),
+    ) as map_func:
+        tile_sums = map_func(_tile_kernel_sums, [queries[tile] for tile in tiles])
+
+    sums = np.empty(len(queries))
+    for tile, tile_sum in zip(tiles, tile_sums):
+        sums[tile] = tile_sum
+
+    return sums
+
+
+def _init_kde_worker(points, bandwidths, radius):
+    """Store the points and build one KD-tree per bandwidth class."""
+    ## Classes of similar bandwidths, so narrow kernels are not searched with the
+    ## radius of the widest one.
+    edges = np.unique(
+        np.quantile(bandwidths, np.linspace(0, 1, N_BANDWIDTH_CLASSES + 1)),
+    )
+    classes = np.clip(np.searchsorted(edges, bandwidths, side="right") - 1, 0, None)
+
+    _KDE_STATE.clear()
+    _KDE_STATE.update(
+        {
+            "points": points,
+            "bandwidths": bandwidths,
+            "radius": radius,
+            "classes": [
+                (
+                    cKDTree(points[index]),
+                    index,
+                    bandwidths[index].max(),
+                )
+                for index in [np.flatnonzero(classes == k) for k in np.unique(classes)]
+            ],
+        },
+    )
+
+
+def _tile_kernel_sums(queries):
+    """Sum of the truncated kernels at the queries of one tile."""
+    points = _KDE_STATE["points"]
+    bandwidths = _KDE_STATE["bandwidths"]
+    radius = _KDE_STATE["radius"]
+
+    ## Coordinates relative to the tile center keep the expanded squared
+    ## distances below free of cancellation.
+    center = (queries.min(axis=0) + queries.max(axis=0)) / 2
+    half_diagonal = np.linalg.norm(queries.max(axis=0) - queries.min(axis=0)) / 2
+    queries = queries - center
+    squared_norms = (queries**2).sum(axis=1)
+    sums = np.zeros(len(queries))
+
+    for tree, index, max_bandwidth in _KDE_STATE["classes"]:
+        if np.isfinite(radius):
+            candidates = index[
+                tree.query_ball_point(center, half_diagonal + radius * max_bandwidth)
+            ]
+        else:
+            candidates = index
+
+        n_chunks = max(1, len(candidates) * len(queries) // PAIRS_PER_CHUNK)
+        for chunk in np.array_split(candidates, n_chunks):
+            chunk_points = points[chunk] - center
+            h2 = bandwidths[chunk] ** 2
+            u = queries @ (-2 * chunk_points.T)
+            u += squared_norms[:, None]
+            u += (chunk_points**2).sum(axis=1)
+            u /= h2
+            np.maximum(u, 0, out=u)
+            u[u > radius**2] = np.inf
+            u *= -0.5
+            np.exp(u, out=u)
+            sums += u @ (1 / h2)
+
+    return sums
@@ -1,14 +1,41 @@
 """Functions for point analysis."""
 
+import os
+
 import numpy as np
+import pandas as pd
+import shapely
 import xarray as xr
-from scipy import stats
+from scipy.spatial import cKDTree
 from sklearn.cluster import DBSCAN
 
+import crime_patterns.utilities as utils
+from crime_patterns.analysis import kernel_density
+
+## Spatial pairs and time labels shared with the Monte Carlo workers.
+_KNOX_STATE = {}
+
+## Window, radii and simulation inputs shared with the Ripley workers.
+_RIPLEY_STATE = {}
 
-def evaluate_hotspots(longitudes, latitudes, region, crs="EPSG:4326"):
+
+def evaluate_hotspots(
+    longitudes,
+    latitudes,
+    region,
+    crs="EPSG:4326",
+    bandwidth="scott",
+    adaptive=False,
+    rtol=1e-6,
+    n_workers=1,
+):
     """Function to evaluate hotspots using kernel density estimation.
 
+    The Gaussian kernels are truncated where they fall below ``rtol`` times their
+    peak, see `kernel_density.truncated_kde`. With a cross-validated bandwidth the
+    criterion of every candidate is stored as ``cv_score`` along the
+    ``bandwidth_factor`` dimension.
+
     Parameters
     ----------
     longitudes : array-like
@@ -19,6 +46,18 @@ def evaluate_hotspots(longitudes, latitudes, region, crs="EPSG:4326"):
         GeoDataFrame containing the region of interest.
     crs : str, optional
         Coordinate reference system of the region of interest, by default "EPSG:4326"
+    bandwidth : str or float, optional
+        Bandwidth factor, "scott", "silverman", a scalar, or selected by "lscv"
+        or "lcv" cross-validation, by default "scott".
+    adaptive : bool, optional
+        Whether to adapt the bandwidth of every incident to the local density
+        (Abramson), so central London is smoothed less than the outskirts, by
+        default False.
+    rtol : float, optional
+        Truncation tolerance of the kernels, by default 1e-6.
+    n_workers : int, optional
+        Number of processes evaluating the grid tiles and the bandwidth candidates,
+        by default 1. None uses all CPUs.
 
     Returns:
     -------
@@ -28,30 +67,113 @@ def evaluate_hotspots(longitudes, latitudes, region, crs="EPSG:4326"):
     """
     xmin, ymin, xmax, ymax = region.to_crs(crs).total_bounds
 
-    X_coords, Y_coords = np.mgrid[xmin:xmax:100j, ymin:ymax:100j]
+    lon = np.linspace(xmin, xmax, 100)
+    lat = np.linspace(ymin, ymax, 100)
+    X_coords, Y_coords = np.meshgrid(lon, lat, indexing="ij")
 
     positions = np.vstack([X_coords.ravel(), Y_coords.ravel()])
     values = np.vstack([longitudes, latitudes])
 
-    kernel = stats.gaussian_kde(values)
+    cv_curve = None
+    if bandwidth in ("lscv", "lcv"):
+        factor, factors, scores = kernel_density.select_bandwidth(
+            values,
+            method=bandwidth,
+            n_workers=n_workers,
+        )
+        cv_curve = xr.DataArray(
+            data=scores,
+            dims=["bandwidth_factor"],
+            coords={"bandwidth_factor": factors},
+        )
+    else:
+        factor = kernel_density.bandwidth_factor(bandwidth, values.shape[1])
 
-    densities = np.reshape(kernel.evaluate(positions).T, X_coords.shape)
+    densities = kernel_density.truncated_kde(
+        values,
+        positions,
+        bandwidth=factor,
+        adaptive=adaptive,
+        rtol=rtol,
+        n_workers=n_workers,
+    ).reshape(X_coords.shape)
 
     ## Set very small densities to NaN.
     densities[np.abs(densities) <= 1] = np.nan
 
+    ## Grid axes are stored as 1-D coordinates, the 2-D mesh can be rebuilt on demand.
     da = xr.DataArray(
         data=densities,
-        dims=["x", "y"],
-        coords={
-            "lon": (["x", "y"], X_coords),
-            "lat": (["x", "y"], Y_coords),
-        },
+        dims=["lon", "lat"],
+        coords={"lon": lon, "lat": lat},
     )
 
     ds = da.to_dataset(name="densities")
+    if cv_curve is not None:
+        ds["cv_score"] = cv_curve
 
-    ds.attrs = {"Description": "Burglary Hotspots (Kernel Density Estimates)"}
+    ds.attrs = {
+        "Description": "Burglary Hotspots (Kernel Density Estimates)",
+        "bandwidth": str(bandwidth),
+        "bandwidth_factor": factor,
+        "adaptive": int(adaptive),
+        "rtol": rtol,
+    }
+
+    return ds
+
+
+def save_hotspots(ds, path, chunks=None, complevel=4):
+    """Function to write kernel density estimates to a chunked, compressed NetCDF4 file.
+
+    Parameters
+    ----------
+    ds : xarray.Dataset
+        Dataset containing the kernel density estimates.
+    path : str or pathlib.Path
+        Path of the NetCDF file to be written.
+    chunks : dict, optional
+        Chunk size per dimension, by default 256 along ``lon`` and ``lat`` and 1
+        along every other dimension (e.g. month or crime type).
+    complevel : int, optional
+        zlib compression level, by default 4.
+
+    Returns:
+    -------
+    str or pathlib.Path
+        Path of the written NetCDF file.
+
+    """
+    if chunks is None:
+        chunks = {"lon": 256, "lat": 256}
+
+    return utils.save_to_chunked_netcdf(ds, path, chunks=chunks, complevel=complevel)
+
+
+def open_hotspots(path, bbox=None):
+    """Function to lazily open kernel density estimates written by `save_hotspots`.
+
+    Only the metadata is read on opening, values are read from disk on access, so
+    selecting a window only reads the chunks overlapping it.
+
+    Parameters
+    ----------
+    path : str or pathlib.Path
+        Path of the NetCDF file.
+    bbox : tuple, optional
+        Window (xmin, ymin, xmax, ymax) to be selected, by default the full grid.
+
+    Returns:
+    -------
+    xarray.Dataset
+        Lazily loaded dataset containing the kernel density estimates.
+
+    """
+    ds = xr.open_dataset(path, engine="netcdf4")
+
+    if bbox is not None:
+        xmin, ymin, xmax, ymax = bbox
+        ds = ds.sel(lon=slice(xmin, xmax), lat=slice(ymin, ymax))
 
     return ds
 
@@ -102,3 +224,399 @@ def cluster_crime_incidents_dbscan(
 
     # return the cluster labels
     return dbscan
+
+
+def month_to_period(months):
+    """Function to convert "YYYY-MM" month labels to consecutive month numbers.
+
+    Parameters
+    ----------
+    months : array-like
+        Array of month labels as in the ``Month`` column of the crime data.
+
+    Returns:
+    -------
+    numpy.ndarray
+        Array of int16 month numbers (``12 * year + month - 1``), so differences are
+        in months.
+
+    """
+    ## Parse every distinct label once, e.g. the categories of a categorical.
+    codes, labels = pd.factorize(pd.Series(months))
+    labels = np.asarray(labels, dtype=str)
+    year = np.char.partition(labels, "-")[:, 0].astype(np.int16)
+    month = np.char.partition(labels, "-")[:, 2].astype(np.int16)
+
+    return (12 * year + month - 1)[codes]
+
+
+def knox_near_repeat(
+    x,
+    y,
+    t,
+    distance_bands,
+    time_bands,
+    permutations=99,
+    n_workers=1,
+    seed=None,
+):
+    """Function to perform a Knox test for near-repeat space-time interaction.
+
+    Pairs of incidents are counted per distance band and time band. Only the pairs
+    closer than the largest distance band are enumerated, using a KD-tree, so the
+    runtime grows with the number of close pairs rather than quadratically. The
+    null distribution is built by permuting the time labels, which leaves the
+    spatial pairs unchanged, so every permutation only recounts those pairs.
+
+    Parameters
+    ----------
+    x : array-like
+        Array of projected x coordinates.
+    y : array-like
+        Array of projected y coordinates, in the same unit as ``x``.
+    t : array-like
+        Array of times, e.g. month numbers from `month_to_period` or days.
+    distance_bands : array-like
+        Increasing edges of the distance bands, band k covers
+        ``[distance_bands[k], distance_bands[k + 1])``.
+    time_bands : array-like
+        Increasing edges of the time bands, in the unit of ``t``.
+    permutations : int, optional
+        Number of Monte Carlo permutations, by default 99.
+    n_workers : int, optional
+        Number of processes running the permutations, by default 1. None uses all
+        CPUs.
+    seed : int, optional
+        Seed of the permutations, by default None.
+
+    Returns:
+    -------
+    xarray.Dataset
+        Dataset with the observed and expected pair counts, the Knox ratio and the
+        pseudo p-value of every distance band and time band.
+
+    """
+    distance_bands = np.asarray(distance_bands, dtype=float)
+    time_bands = np.asarray(time_bands, dtype=float)
+    t = np.asarray(t, dtype=float)
+    xy = np.column_stack([x, y]).astype(float)
+
+    tree = cKDTree(xy)
+    pairs = tree.query_pairs(r=distance_bands[-1], output_type="ndarray")
+    distances = np.linalg.norm(xy[pairs[:, 0]] - xy[pairs[:, 1]], axis=1)
+    distance_index = _band_index(distances, distance_bands)
+    valid = distance_index >= 0
+    pairs, distance_index = pairs[valid], distance_index[valid]
+
+    state = {
+        "pairs": pairs,
+        "distance_index": distance_index,
+        "t": t,
+        "time_bands": time_bands,
+        "n_distance_bands": len(distance_bands) - 1,
+    }
+    observed = _knox_counts(t, state)
+
+    ## Every worker runs at least one permutation.
+    n_workers = max(1, min(n_workers or os.cpu_count() or 1, permutations))
+    chunks = np.array_split(np.arange(permutations), n_workers)
+    seeds = np.random.SeedSequence(seed).spawn(len(chunks))
+    with utils.process_pool(
+        n_workers=n_workers,
+        initializer=_init_knox_worker,
+        initargs=(state,),
+    ) as map_func:
+        simulated = map_func(
+            _simulate_knox_counts,
+            [(seed, len(chunk)) for seed, chunk in zip(seeds, chunks)],
+        )
+    simulated = np.concatenate(simulated)
+
+    expected = simulated.mean(axis=0)
+    p_value = (1 + (simulated >= observed).sum(axis=0)) / (permutations + 1)
+
+    dims = ["distance_band", "time_band"]
+    ds = xr.Dataset(
+        data_vars={
+            "observed": (dims, observed),
+            "expected": (dims, expected),
+            "knox_ratio": (dims, observed / np.where(expected > 0, expected, np.nan)),
+            "p_value": (dims, p_value),
+        },
+        coords={
+            "distance_band": _band_labels(distance_bands),
+            "time_band": _band_labels(time_bands),
+            "distance_lower": ("distance_band", distance_bands[:-1]),
+            "distance_upper": ("distance_band", distance_bands[1:]),
+            "time_lower": ("time_band", time_bands[:-1]),
+            "time_upper": ("time_band", time_bands[1:]),
+        },
+    )
+    ds.attrs = {
+        "Description": "Near-repeat space-time interaction (Knox test)",
+        "permutations": permutations,
+    }
+
+    return ds
+
+
+def _band_index(values, edges):
+    """Index of the half-open band containing each value, -1 outside all bands."""
+    index = np.searchsorted(edges, values, side="right") - 1
+    index[(index < 0) | (index >= len(edges) - 1)] = -1
+
+    return index
+
+
+def _band_labels(edges):
+    return [f"{lower:g}-{upper:g}" for lower, upper in zip(edges[:-1], edges[1:])]
+
+
+def _knox_counts(t, state):
+    """Count the close pairs per distance band and time band for time labels t."""
+    pairs = state["pairs"]
+    time_lags = np.abs(t[pairs[:, 0]] - t[pairs[:, 1]])
+    time_index = _band_index(time_lags, state["time_bands"])
+    valid = time_index >= 0
+    n_time_bands = len(state["time_bands"]) - 1
+
+    counts = np.bincount(
+        state["distance_index"][valid] * n_time_bands + time_index[valid],
+        minlength=state["n_distance_bands"] * n_time_bands,
+    )
+
+    return counts.reshape(state["n_distance_bands"], n_time_bands)
+
+
+def _init_knox_worker(state):
+    _KNOX_STATE.clear()
+    _KNOX_STATE.update(state)
+
+
+def _simulate_knox_counts(task):
+    """Knox counts for a number of permutations of the time labels."""
+    seed, n_permutations = task
+    rng = np.random.default_rng(seed)
+    t = _KNOX_STATE["t"]
+
+    return np.array(
+        [
+            _knox_counts(rng.permutation(t), _KNOX_STATE)
+            for _ in range(n_permutations)
+        ],
+    ).reshape(
+        n_permutations,
+        _KNOX_STATE["n_distance_bands"],
+        len(_KNOX_STATE["time_bands"]) - 1,
+    )
+
+
+def ripley_functions(
+    x,
+    y,
+    window,
+    radii,
+    envelope="csr",
+    simulations=99,
+    bandwidth="scott",
+    n_workers=1,
+    seed=None,
+):
+    """Function to estimate Ripley's K, L and pair correlation g with envelopes.
+
+    Pairs are counted with KD-trees up to the radii only, never with a distance
+    matrix. Edge effects are corrected with the border method: at radius r only the
+    points at least r from the window boundary serve as centres. The distance to the
+    boundary is taken to its vertices, densified to a tenth of the smallest radius.
+
+    The envelopes are the pointwise minimum and maximum of the functions of
+    ``simulations`` patterns with as many points, simulated in parallel.
+
+    Parameters
+    ----------
+    x : array-like
+        Array of projected x coordinates.
+    y : array-like
+        Array of projected y coordinates, in the same unit as ``x``.
+    window : geopandas.GeoDataFrame or geopandas.GeoSeries
+        Polygons of the observation window, in the CRS of the coordinates.
+    radii : array-like
+        Positive, increasing distances to evaluate the functions at.
+    envelope : str, optional
+        Null model of the envelopes, "csr" for complete spatial randomness or "ipp"
+        for an inhomogeneous Poisson process with the kernel density estimate of
+        the points as intensity, by default "csr".
+    simulations : int, optional
+        Number of simulated patterns, by default 99.
+    bandwidth : str or float, optional
+        Bandwidth factor of the intensity of the "ipp" envelope, see
+        `kernel_density.kernel_covariance`, by default "scott".
+    n_workers : int, optional
+        Number of processes running the simulations, by default 1. None uses all
+        CPUs.
+    seed : int, optional
+        Seed of the simulations, by default None.
+
+    Returns:
+    -------
+    xarray.Dataset
+        Dataset with K, L and g and their lower and upper envelopes along the
+        ``distance`` dimension. The pair correlation at a radius is the average
+        over the ring between the previous radius, or 0, and that radius.
+
+    """
+    if envelope not in ("csr", "ipp"):
+        raise ValueError(f"Unknown envelope {envelope!r}, use 'csr' or 'ipp'.")
+
+    xy = np.column_stack([x, y]).astype(float)
+    radii = np.asarray(radii, dtype=float)
+    window = shapely.union_all(window.geometry.values)
+    shapely.prepare(window)
+
+    boundary = shapely.segmentize(window.boundary, radii[0] / 10)
+    inner_window = window.buffer(-radii[-1])
+    shapely.prepare(inner_window)
+    state = {
+        "window": window,
+        "inner_window": inner_window,
+        "radii": radii,
+        "boundary_tree": cKDTree(shapely.get_coordinates(boundary)),
+        "n": len(xy),
+        "envelope": envelope,
+    }
+    if envelope == "ipp":
+        state["points"] = xy
+        state["kernel_cholesky"] = np.linalg.cholesky(
+            kernel_density.kernel_covariance(xy.T, bandwidth),
+        )
+
+    observed = _ripley_k(xy, state)
+
+    ## Every worker simulates at least one pattern.
+    n_workers = max(1, min(n_workers or os.cpu_count() or 1, simulations))
+    chunks = np.array_split(np.arange(simulations), n_workers)
+    seeds = np.random.SeedSequence(seed).spawn(len(chunks))
+    with utils.process_pool(
+        n_workers=n_workers,
+        initializer=_init_ripley_worker,
+        initargs=(state,),
+    ) as map_func:
+        simulated = map_func(
+            _simulate_ripley_k,
+            [(seed, len(chunk)) for seed, chunk in zip(seeds, chunks)],
+        )
+    simulated = np.concatenate(simulated)
+
+    ## g is the average over the ring between consecutive radii, from K(0) = 0.
+    ring_areas = np.pi * np.diff(radii**2, prepend=0)
+    functions = {
+        "K": lambda k: k,
+        "L": lambda k: np.sqrt(k / np.pi),
+        "g": lambda k: np.diff(k, axis=-1, prepend=0) / ring_areas,
+    }
+    data_vars = {}
+    for name, function in functions.items():
+        simulated_values = function(simulated)
+        data_vars[name] = ("distance", function(observed))
+        data_vars[f"{name}_lower"] = ("distance", simulated_values.min(axis=0))
+        data_vars[f"{name}_upper"] = ("distance", simulated_values.max(axis=0))
+
+    ds = xr.Dataset(data_vars=data_vars, coords={"distance": radii})
+    ds.attrs = {
+        "Description": "Ripley's K, L and pair correlation functions",
+        "edge_correction": "border",
+        "envelope": envelope,
+        "simulations": simulations,
+    }
+
+    return ds
+
+
+def _ripley_k(xy, state):
+    """Border corrected K function of a pattern at the radii."""
+    radii = state["radii"]
+    window = state["window"]
+
+    ## Only the points outside the window shrunk by the largest radius need their
+    ## distance to the boundary.
+    boundary_distance = np.full(len(xy), np.inf)
+    near = ~shapely.contains_xy(state["inner_window"], xy[:, 0], xy[:, 1])
+    boundary_distance[near], _ = state["boundary_tree"].query(xy[near])
+    boundary_distance[~shapely.contains_xy(window, xy[:, 0], xy[:, 1])] = 0
+
+    ## Points are centres for the radii up to their boundary distance.
+    n_radii = np.searchsorted(radii, boundary_distance, side="right")
+    centres = np.bincount(n_radii, minlength=len(radii) + 1)[::-1].cumsum()[::-1][1:]
+
+    ## Centres farther than the largest radius from the boundary count at every
+    ## radius, every centre is its own neighbour at distance 0.
+    tree = cKDTree(xy)
+    interior = n_radii == len(radii)
+    pair_counts = np.cumsum(
+        cKDTree(xy[interior]).count_neighbors(tree, radii, cumulative=False),
+    ) - interior.sum()
+
+    ## Pairs of the centres near the boundary count from the first radius reaching
+    ## the neighbour up to the boundary distance of the centre.
+    strip = np.flatnonzero(~interior & (n_radii > 0))
+    pairs = cKDTree(xy[strip]).sparse_distance_matrix(
+        tree,
+        radii[-1],
+        output_type="ndarray",
+    )
+    pairs = pairs[strip[pairs["i"]] != pairs["j"]]
+    first = np.searchsorted(radii, pairs["v"], side="left")
+    last = n_radii[strip[pairs["i"]]]
+    valid = first < last
+    pair_counts += np.cumsum(
+        np.bincount(first[valid], minlength=len(radii) + 1)
+        - np.bincount(last[valid], minlength=len(radii) + 1),
+    )[:-1]
+
+    intensity = len(xy) / window.area
+
+    return pair_counts / np.where(centres > 0, centres * intensity, np.nan)
+
+
+def _init_ripley_worker(state):
+    _RIPLEY_STATE.clear()
+    _RIPLEY_STATE.update(state)
+
+
+def _simulate_pattern(rng, state):
+    """Pattern of as many points as observed from the null model of the envelope."""
+    window = state["window"]
+    n = state["n"]
+    xmin, ymin, xmax, ymax = window.bounds
+
+    patterns, n_simulated = [], 0
+    while n_simulated < n:
+        if state["envelope"] == "csr":
+            candidates = rng.uniform((xmin, ymin), (xmax, ymax), size=(n, 2))
+        else:
+            ## Sampling from the kernel density estimate: a random point plus a
+            ## kernel distributed offset.
+            points = state["points"]
+            candidates = points[rng.integers(0, len(points), size=n)]
+            candidates += rng.standard_normal((n, 2)) @ state["kernel_cholesky"].T
+
+        candidates = candidates[
+            shapely.contains_xy(window, candidates[:, 0], candidates[:, 1])
+        ]
+        patterns.append(candidates)
+        n_simulated += len(candidates)
+
+    return np.concatenate(patterns)[:n]
+
+
+def _simulate_ripley_k(task):
+    """K functions of a number of simulated patterns."""
+    seed, n_simulations = task
+    rng = np.random.default_rng(seed)
+
+    return np.array(
+        [
+            _ripley_k(_simulate_pattern(rng, _RIPLEY_STATE), _RIPLEY_STATE)
+            for _ in range(n_simulations)
+        ],
+    ).reshape(n_simulations, len(_RIPLEY_STATE["radii"]))
@@ -0,0 +1,156 @@
+"""Functions for binning incidents into a space-time count cube."""
+
+import numpy as np
+import xarray as xr
+
+import crime_patterns.utilities as utils
+
+
+def build_incident_cube(x, y, months, crime_types, cell_size, bounds=None):
+    """Bin incidents into counts per grid cell, month and crime type.
+
+    All incidents are binned in a single pass over their integer cell, month and
+    crime type codes.
+
+    Parameters:
+    -----------
+    x: array-like
+        Array of projected x coordinates.
+    y: array-like
+        Array of projected y coordinates.
+    months: array-like
+        Array of month labels, e.g. the ``Month`` column of the crime data.
+    crime_types: array-like
+        Array of crime types, e.g. the ``Crime type`` column of the crime data.
+    cell_size: float
+        Edge length of the square grid cells, in the unit of the coordinates.
+    bounds: tuple
+        Extent (xmin, ymin, xmax, ymax) of the grid. Defaults to the extent of the
+        incidents. Incidents outside are dropped.
+
+    Returns:
+    --------
+    cube: xarray.Dataset
+        Dataset with the variable ``counts`` over the dimensions (x, y, month,
+        crime_type). The x and y coordinates are the cell centres.
+
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+
+    if bounds is None:
+        bounds = (x.min(), y.min(), x.max(), y.max())
+    xmin, ymin, xmax, ymax = bounds
+
+    n_x = max(1, int(np.ceil((xmax - xmin) / cell_size)))
+    n_y = max(1, int(np.ceil((ymax - ymin) / cell_size)))
+    month_labels, month_codes = np.unique(np.asarray(months), return_inverse=True)
+    type_labels, type_codes = np.unique(np.asarray(crime_types), return_inverse=True)
+
+    ix = np.floor((x - xmin) / cell_size).astype(np.int64)
+    iy = np.floor((y - ymin) / cell_size).astype(np.int64)
+    ## Incidents on the upper edge belong to the last cell.
+    ix[x == xmax] = n_x - 1
+    iy[y == ymax] = n_y - 1
+    inside = (ix >= 0) & (ix < n_x) & (iy >= 0) & (iy < n_y)
+
+    shape = (n_x, n_y, len(month_labels), len(type_labels))
+    flat_index = np.ravel_multi_index(
+        (ix[inside], iy[inside], month_codes[inside], type_codes[inside]),
+        shape,
+    )
+    counts = np.bincount(flat_index, minlength=np.prod(shape)).astype(np.int32)
+
+    cube = xr.Dataset(
+        data_vars={
+            "counts": (["x", "y", "month", "crime_type"], counts.reshape(shape)),
+        },
+        coords={
+            "x": xmin + (np.arange(n_x) + 0.5) * cell_size,
+            "y": ymin + (np.arange(n_y) + 0.5) * cell_size,
+            "month": month_labels.astype(str),
+            "crime_type": type_labels.astype(str),
+        },
+    )
+    cube.attrs = {
+        "Description": "Incident counts per grid cell, month and crime type",
+        "cell_size": cell_size,
+        "bounds": list(bounds),
+    }
+
+    return cube
+
+
+def coarsen_cube(cube, factor):
+    """Reaggregate a cube to cells ``factor`` times larger along x and y.
+
+    Parameters:
+    -----------
+    cube: xarray.Dataset
+        Cube as returned by `build_incident_cube`, or a slice of it.
+    factor: int
+        Number of cells merged along each axis. Incomplete cells at the upper edges
+        are padded.
+
+    Returns:
+    --------
+    cube: xarray.Dataset
+        Cube with the counts summed over the merged cells.
+
+    """
+    cell_size = cube.attrs["cell_size"]
+    coarse = cube.coarsen(x=factor, y=factor, boundary="pad").sum()
+
+    ## Cell centres of the coarse grid, also for padded cells at the edges.
+    coarse = coarse.assign_coords(
+        x=cube["x"].values[0] + ((np.arange(coarse.sizes["x"]) + 0.5) * factor - 0.5)
+        * cell_size,
+        y=cube["y"].values[0] + ((np.arange(coarse.sizes["y"]) + 0.5) * factor - 0.5)
+        * cell_size,
+    )
+    coarse.attrs = {**cube.attrs, "cell_size": cell_size * factor}
+
+    return coarse
+
+
+def save_incident_cube(cube, path, spatial_chunk=128):
+    """Write a cube to a NetCDF4 file chunked by month and crime type.
+
+    Parameters:
+    -----------
+    cube: xarray.Dataset
+        Cube as returned by `build_incident_cube`.
+    path: str or pathlib.Path
+        Path of the NetCDF file.
+    spatial_chunk: int
+        Chunk size along x and y. Every chunk holds a single month and crime type,
+        so monthly slices are read without touching the other months.
+
+    Returns:
+    --------
+    path: str or pathlib.Path
+        Path of the NetCDF file.
+
+    """
+    return utils.save_to_chunked_netcdf(
+        cube,
+        path,
+        chunks={"x": spatial_chunk, "y": spatial_chunk, "month": 1, "crime_type": 1},
+    )
+
+
+def open_incident_cube(path):
+    """Lazily open a cube written by `save_incident_cube`.
+
+    Parameters:
+    -----------
+    path: str or pathlib.Path
+        Path of the NetCDF file.
+
+    Returns:
+    --------
+    cube: xarray.Dataset
+        Lazily loaded cube, values are only read for the selected slices.
+
+    """
+    return xr.open_dataset(path, engine="netcdf4")
@@ -0,0 +1,245 @@
+"""Spatial cross-validation of the regression models."""
+
+import os
+
+import numpy as np
+import pandas as pd
+from libpysal.weights import WSP
+
+import crime_patterns.utilities as utils
+from crime_patterns.analysis import spatial_regression
+
+## Data and sliced weights shared with the fold workers.
+_CV_STATE = {}
+
+
+def spatial_folds(db, groups, buffer=0):
+    """Create leave-region-out folds, optionally buffered.
+
+    Every region, e.g. a borough, is held out once. With a buffer, the observations
+    within ``buffer`` of the held-out region are dropped from the training set, so
+    the test observations are not predicted from their immediate neighbours.
+
+    Parameters:
+    -----------
+    db: geopandas.GeoDataFrame
+        GeoDataFrame with the observations, in a projected CRS if ``buffer`` > 0.
+    groups: array-like
+        Region of every observation, in the order of ``db``.
+    buffer: float
+        Distance around the held-out region excluded from training, in the unit of
+        the CRS.
+
+    Returns:
+    --------
+    folds: list
+        List of (region, training positions, test positions) tuples.
+
+    """
+    groups = np.asarray(groups)
+    geometry = db.geometry.values
+
+    folds = []
+    for group in pd.unique(groups):
+        test = np.flatnonzero(groups == group)
+        excluded = np.zeros(len(db), dtype=bool)
+        excluded[test] = True
+
+        if buffer > 0:
+            _, neighbours = db.sindex.query(
+                geometry[test],
+                predicate="dwithin",
+                distance=buffer,
+            )
+            excluded[neighbours] = True
+
+        folds.append((group, np.flatnonzero(~excluded), test))
+
+    return folds
+
+
+def cross_validate_spatial_regression(
+    db,
+    y_var_name,
+    x_var_names,
+    folds,
+    methods=("OLS", "ML_Lag", "ML_Error"),
+    w=None,
+    ID_col_name="GSS_CODE",
+    n_workers=1,
+):
+    """Cross-validate the regression models of `perform_spatial_regression`.
+
+    The weights matrix is built or subset once for all observations, every fold
+    slices the training block out of its sparse matrix instead of rebuilding the
+    neighbours. The folds and methods are fitted concurrently.
+
+    The test observations are predicted from the estimated trend. The lag models
+    add ``rho`` times the spatial lag of the observed training values, the error
+    models ``lambda`` times the spatial lag of the training residuals, both
+    row-standardized over the training neighbours. "GM_Combo" adds both terms.
+
+    Parameters:
+    -----------
+    db: geopandas.GeoDataFrame
+        GeoDataFrame containing the data to be used for performing spatial regression.
+    y_var_name: str
+        Name of the column containing the dependent variable.
+    x_var_names: list
+        List of names of the independent variables.
+    folds: list
+        List of (name, training positions, test positions) tuples, see
+        `spatial_folds`.
+    methods: tuple
+        Methods of `perform_spatial_regression` to cross-validate.
+    w: libpysal.weights.weights.W
+        Weights matrix indexed by the ids in ``ID_col_name``. If None, a KNN weights
+        matrix with k=8 is created from ``db``.
+    ID_col_name: str
+        Name of the column containing the ID of the observations.
+    n_workers: int
+        Number of processes fitting the folds. None uses all CPUs.
+
+    Returns:
+    --------
+    fold_metrics: pandas.DataFrame
+        Size of the training and test set, RMSE, MAE and out-of-sample R-squared of
+        every fold and method.
+    fold_coefficients: pandas.DataFrame
+        Coefficients of every fold and method in long format.
+
+    """
+    if w is None:
+        W = spatial_regression.create_weights_matrix(db, method="knn", k=8)
+    else:
+        W = spatial_regression.subset_weights_matrix(w, db[ID_col_name])
+
+    data = pd.DataFrame(db[[ID_col_name, y_var_name, *x_var_names]])
+    state = {
+        "data": data.reset_index(drop=True),
+        "sparse": W.sparse.tocsr(),
+        "y_var_name": y_var_name,
+        "x_var_names": list(x_var_names),
+        "ID_col_name": ID_col_name,
+    }
+
+    tasks = [
+        (name, method, train, test)
+        for name, train, test in folds
+        for method in methods
+    ]
+
+    n_workers = n_workers or os.cpu_count() or 1
+    with utils.process_pool(
+        n_workers=min(n_workers, len(tasks)),
+        initializer=_init_cv_worker,
+        initargs=(state,),
+    ) as map_func:
+        results = map_func(_fit_fold, tasks)
+
+    fold_metrics = pd.DataFrame([metrics for metrics, _ in results])
+    fold_coefficients = pd.concat(
+        [coefficients for _, coefficients in results],
+        ignore_index=True,
+    )
+
+    return fold_metrics, fold_coefficients
+
+
+def get_coefficient_stability(fold_coefficients):
+    """Function to summarize the coefficients across the folds.
+
+    Parameters:
+    -----------
+    fold_coefficients: pandas.DataFrame
+        Coefficients of every fold and method, see
+        `cross_validate_spatial_regression`.
+
+    Returns:
+    --------
+    stability: pandas.DataFrame
+        Mean, standard deviation, minimum and maximum of every coefficient per
+        method, and the share of folds agreeing with the sign of the mean.
+
+    """
+    grouped = fold_coefficients.groupby(["method", "variable"], sort=False)[
+        "coefficient"
+    ]
+    stability = grouped.agg(["mean", "std", "min", "max"])
+    stability["sign_agreement"] = grouped.apply(
+        lambda values: (np.sign(values) == np.sign(values.mean())).mean(),
+    )
+
+    return stability
+
+
+def _row_standardized(sparse):
+    """Row-standardize a sparse weights matrix, rows without neighbours stay 0."""
+    row_sums = np.asarray(sparse.sum(axis=1)).ravel()
+
+    return sparse.multiply(1 / np.where(row_sums > 0, row_sums, 1)[:, None]).tocsr()
+
+
+def _init_cv_worker(state):
+    _CV_STATE.clear()
+    _CV_STATE.update(state)
+
+
+def _fit_fold(task):
+    """Fit one method on the training set of a fold and score it on the test set."""
+    name, method, train, test = task
+    data = _CV_STATE["data"]
+    sparse = _CV_STATE["sparse"]
+    y_var_name = _CV_STATE["y_var_name"]
+    x_var_names = _CV_STATE["x_var_names"]
+    ID_col_name = _CV_STATE["ID_col_name"]
+
+    train_data = data.iloc[train]
+    w_train = WSP(
+        sparse[train][:, train],
+        id_order=list(train_data[ID_col_name]),
+    ).to_W(silence_warnings=True)
+
+    model = spatial_regression.perform_spatial_regression(
+        train_data,
+        y_var_name,
+        x_var_names,
+        method=method,
+        w=w_train,
+        ID_col_name=ID_col_name,
+    )
+
+    y = data[y_var_name].to_numpy()
+    x = np.column_stack([np.ones(len(data)), data[x_var_names].to_numpy()])
+    betas = model.betas.ravel()[: x.shape[1]]
+    prediction = x[test] @ betas
+
+    if method != "OLS":
+        w_cross = _row_standardized(sparse[test][:, train])
+        if method in ["ML_Lag", "GM_Lag", "GM_Combo"]:
+            prediction += model.rho * (w_cross @ y[train])
+        if method in ["ML_Error", "GM_Error", "GM_Combo"]:
+            ## The GM estimators keep lambda as the last coefficient only.
+            lam = getattr(model, "lam", model.betas[-1])
+            prediction += lam * (w_cross @ model.u.ravel())
+
+    errors = y[test] - prediction
+    metrics = {
+        "fold": name,
+        "method": method,
+        "n_train": len(train),
+        "n_test": len(test),
+        "rmse": np.sqrt(np.mean(errors**2)),
+        "mae": np.mean(np.abs(errors)),
+        "r2": 1 - np.sum(errors**2) / np.sum((y[test] - y[test].mean()) ** 2),
+    }
+    coefficients = pd.DataFrame(
+        {
+            "fold": name,
+            "method": method,
+            "variable": getattr(model, "name_z", model.name_x),
+            "coefficient": model.betas.ravel(),
+        },
+    )
+
+    return metrics, coefficients
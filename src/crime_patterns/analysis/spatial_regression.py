@@ -2,9 +2,13 @@
 
 import numpy as np
 import pandas as pd
-from libpysal.weights import KNN, Queen, Rook
+from libpysal.weights import KNN, Queen, Rook, w_subset
 from pysal.explore import esda
-from spreg import OLS, ML_Error, ML_Lag
+from spreg import OLS, GM_Combo, GM_Error, GM_Lag, ML_Error, ML_Lag
+
+## Orders of the spatially lagged regressors W X, W^2 X, ... used as instruments
+## for the spatial lag by the generalized moments estimators.
+GM_W_LAGS = 2
 
 
 def create_weights_matrix(data, method="queen", k=5, **kwargs):
@@ -45,6 +49,26 @@ def create_weights_matrix(data, method="queen", k=5, **kwargs):
     return w
 
 
+def subset_weights_matrix(weights_matrix, ids):
+    """Select and order the observations of a weights matrix.
+
+    Parameters:
+    -----------
+    weights_matrix: libpysal.weights.weights.W
+        Weights matrix, e.g. created once for all wards and shared between years.
+    ids: list
+        List of ids of the observations to keep, in the order of the data.
+
+    Returns:
+    --------
+    w: libpysal.weights.weights.W
+        Weights matrix of the selected observations. Neighbours outside of ``ids``
+        are dropped.
+
+    """
+    return w_subset(weights_matrix, list(ids))
+
+
 def calculate_spatial_lag(
     data,
     y_col_name,
@@ -130,6 +154,71 @@ def calculate_morans_I(
     return moran
 
 
+def calculate_local_morans_I(
+    data,
+    y_col_name,
+    weights_matrix,
+    ID_column_name,
+    permutations=999,
+    significance=0.05,
+    transform="R",
+    seed=None,
+):
+    """Calculate local Moran's I and classify every observation.
+
+    Parameters:
+    -----------
+    data: geopandas.GeoDataFrame
+        GeoDataFrame containing the data to be used for calculating local Moran's I.
+    y_col_name: str
+        Name of the column containing the variable to be used for calculating local
+        Moran's I.
+    weights_matrix: libpysal.weights.weights.W
+        Weights matrix ordered like ``data``.
+    ID_column_name: str
+        Name of the column containing the ID of the observations.
+    permutations: int
+        Number of permutations for the pseudo p-values.
+    significance: float
+        Pseudo p-value below which an observation is classified by its quadrant.
+    transform: str
+        Transform to be applied to the weights matrix, see `calculate_spatial_lag`.
+    seed: int
+        Seed of the permutations.
+
+    Returns:
+    --------
+    lisa: pandas.DataFrame
+        DataFrame with the ID, local Moran's I, pseudo p-value and LISA class of
+        every observation. The classes are "HH", "LH", "LL" and "HL" for
+        significant observations and "ns" otherwise.
+
+    """
+    weights_matrix.transform = transform
+
+    moran_local = esda.moran.Moran_Local(
+        data[y_col_name].values,
+        weights_matrix,
+        permutations=permutations,
+        seed=seed,
+    )
+
+    quadrants = np.array(["HH", "LH", "LL", "HL"])[moran_local.q - 1]
+
+    return pd.DataFrame(
+        {
+            ID_column_name: data[ID_column_name].values,
+            "local_I": moran_local.Is,
+            "p_sim": moran_local.p_sim,
+            "lisa_class": np.where(
+                moran_local.p_sim < significance,
+                quadrants,
+                "ns",
+            ),
+        },
+    )
+
+
 def prepare_data_for_spatial_regression(
     crime_data,
     explanatory_data,
@@ -177,7 +266,7 @@ def prepare_data_for_spatial_regression(
         db[db_num.columns] = db_num
 
     # introduce "geometry" column
-    db = db.merge(explanatory_data[["GSS_CODE", "geometry"]], on="GSS_CODE")
+    db = db.merge(explanatory_data[[ID_col_name, "geometry"]], on=ID_col_name)
 
     return db
 
@@ -212,7 +301,14 @@ def perform_non_spatial_regression(db, y_var_name, x_var_names):
     )
 
 
-def perform_spatial_regression(db, y_var_name, x_var_names, method="OLS"):
+def perform_spatial_regression(
+    db,
+    y_var_name,
+    x_var_names,
+    method="OLS",
+    w=None,
+    ID_col_name="GSS_CODE",
+):
     """Perform spatial regression.
 
     Parameters:
@@ -230,6 +326,16 @@ def perform_spatial_regression(db, y_var_name, x_var_names, method="OLS"):
         - "OLS"
         - "ML_Lag"
         - "ML_Error"
+        - "GM_Lag": spatial two stage least squares
+        - "GM_Error": generalized moments estimator of Kelejian and Prucha (1998)
+        - "GM_Combo": spatial lag and error by generalized moments
+        The GM estimators only need sparse products with the weights matrix and
+        scale to many more observations than the ML estimators.
+    w: libpysal.weights.weights.W
+        Weights matrix indexed by the ids in ``ID_col_name``, e.g. shared between
+        years. If None, a KNN weights matrix with k=8 is created from ``db``.
+    ID_col_name: str
+        Name of the column containing the ID of the observations.
 
     Returns:
     --------
@@ -242,7 +348,10 @@ def perform_spatial_regression(db, y_var_name, x_var_names, method="OLS"):
         x_var_name in db.columns for x_var_name in x_var_names
     ), "All specified columns in 'x_var_name' are not found in the database."
 
-    W = create_weights_matrix(db, method="knn", k=8)
+    if w is None:
+        W = create_weights_matrix(db, method="knn", k=8)
+    else:
+        W = subset_weights_matrix(w, db[ID_col_name])
 
     # Row-standardize W
     W.transform = "r"
@@ -288,9 +397,45 @@ def perform_spatial_regression(db, y_var_name, x_var_names, method="OLS"):
             name_ds="Burglary_VS_IMDScores",
         )
 
+    elif method == "GM_Lag":
+        model = GM_Lag(
+            y=y,
+            x=x,
+            w=W,
+            w_lags=GM_W_LAGS,
+            name_y=y_var_name,
+            name_x=x_name,
+            name_w="W",
+            name_ds="Burglary_VS_IMDScores",
+        )
+
+    elif method == "GM_Error":
+        model = GM_Error(
+            y=y,
+            x=x,
+            w=W,
+            name_y=y_var_name,
+            name_x=x_name,
+            name_w="W",
+            name_ds="Burglary_VS_IMDScores",
+        )
+
+    elif method == "GM_Combo":
+        model = GM_Combo(
+            y=y,
+            x=x,
+            w=W,
+            w_lags=GM_W_LAGS,
+            name_y=y_var_name,
+            name_x=x_name,
+            name_w="W",
+            name_ds="Burglary_VS_IMDScores",
+        )
+
     else:
         raise ValueError(
-            "Invalid method. Valid options are: 'OLS', 'ML_Lag', 'ML_Error'.",
+            "Invalid method. Valid options are: 'OLS', 'ML_Lag', 'ML_Error', "
+            "'GM_Lag', 'GM_Error', 'GM_Combo'.",
         )
 
     return model
@@ -308,14 +453,22 @@ def get_reg_summary(model, method):
         - "OLS"
         - "ML_Lag"
         - "ML_Error"
+        - "GM_Lag"
+        - "GM_Error"
+        - "GM_Combo"
 
     Returns:
     --------
     reg_summary: pandas.DataFrame
-        Regression summary.
+        Regression summary. The GM error estimators give no inference on lambda,
+        its statistic and probability are missing.
 
     """
-    x_vars = pd.Series(data=model.name_x, name="Independent Variable")
+    ## The instrumented spatial lag of the GM estimators is listed in name_z only.
+    x_vars = pd.Series(
+        data=getattr(model, "name_z", model.name_x),
+        name="Independent Variable",
+    )
     betas = pd.Series(data=model.betas.ravel(), name="Coefficient")
 
     if method == "OLS":
@@ -323,7 +476,7 @@ def get_reg_summary(model, method):
         stat = pd.Series(data=list(tstat_temp), name="t-Statistic")
         prob = pd.Series(data=list(prob_temp), name="Probabilty")
 
-    elif method in ["ML_Error", "ML_Lag"]:
+    elif method in ["ML_Error", "ML_Lag", "GM_Lag", "GM_Error", "GM_Combo"]:
 
         zstat_temp, prob_temp = zip(*model.z_stat)
         stat = pd.Series(data=list(zstat_temp), name="z-Statistic")
@@ -384,23 +537,31 @@ def get_model_stats(model):
 
     Parameters:
     -----------
-    model: spreg.ols.ML_Lag or spreg.ols.ML_Error
+    model: spreg.ML_Lag, spreg.ML_Error, spreg.GM_Lag, spreg.GM_Error or spreg.GM_Combo
         Spatial regression model.
 
     Returns:
     --------
     model_stats_table: pandas.DataFrame
         Model statistics table. Contains the following metrics: Pseudo R-squared,  Spatial Pseudo R-squared, Log likelihood, Schwarz criterion.
+        The GM estimators have no likelihood, their log likelihood and Schwarz
+        criterion are missing.
 
     """
-    assert type(model) in [ML_Lag, ML_Error], "Invalid model type."
+    assert type(model) in [
+        ML_Lag,
+        ML_Error,
+        GM_Lag,
+        GM_Error,
+        GM_Combo,
+    ], "Invalid model type."
 
     stats_dict = {
         "Model": [model.title],
         "Pseudo R-squared": [model.pr2],
-        "Spatial Pseudo R-squared": [model.pr2],
-        "Log likelihood": [model.logll],
-        "Schwarz criterion": [model.schwarz],  # Lower the better
+        "Spatial Pseudo R-squared": [getattr(model, "pr2_e", model.pr2)],
+        "Log likelihood": [getattr(model, "logll", np.nan)],
+        "Schwarz criterion": [getattr(model, "schwarz", np.nan)],  # Lower the better
     }
     stats_table = pd.DataFrame(data=stats_dict).T
 
@@ -2,13 +2,13 @@
 #%%
 import os
 
-import geopandas as gpd
-import pandas as pd
 import pytask
 
 import crime_patterns.config as config
+import crime_patterns.data_management as dm
 import crime_patterns.utilities as utils
-from crime_patterns.analysis import point_patterns, spatial_regression
+from crime_patterns.data_management import boundaries
+from crime_patterns.instrumentation import instrument, track
 
 ## define paths
 src = config.SRC
@@ -18,205 +18,649 @@ data_clean = bld / "python" / "data"
 models_dir = bld / "python" / "models"
 results_dir = bld / "python" / "results"
 
-shapefiles_dir = (
-    data_raw
-    / "statistical-gis-boundaries-london"
-    / "statistical-gis-boundaries-london",
-    "ESRI",
-)
+data_info = config.read_data_info()
+years = data_info["crime_years"]
 
 #%%
+for year in years:
+
+    @pytask.mark.depends_on(
+        {
+            "scripts": ["point_patterns.py", "kernel_density.py"],
+            "crime_incidences": os.path.join(
+                data_clean,
+                f"city-of-london-burglaries-{year}-cleaned.csv",
+            ),
+            "london_greater_area": os.path.join(data_clean, "Greater_London_Area.shp"),
+        },
+    )
+    @pytask.mark.produces(
+        {
+            "densities": os.path.join(
+                results_dir,
+                year,
+                "kernel_density_estimates.nc",
+            ),
+            "dbscan_clusters": os.path.join(models_dir, year, "dbscan_clusters.pickle"),
+        },
+    )
+    @pytask.mark.task(id=year)
+    @instrument(name=f"task_point_patterns_analysis[{year}]")
+    def task_point_patterns_analysis(depends_on, produces):
+        """Perform point pattern analysis."""
+        import geopandas as gpd
+
+        from crime_patterns.analysis import point_patterns
+
+        ## Load data
+        london_greater_area = gpd.read_file(depends_on["london_greater_area"])
+        crime_incidences = dm.read_crime_data(
+            depends_on["crime_incidences"],
+            columns=["Longitude", "Latitude"],
+        )
+
+        with track("evaluate_hotspots", rows=len(crime_incidences)):
+            densities = point_patterns.evaluate_hotspots(
+                longitudes=crime_incidences["Longitude"],
+                latitudes=crime_incidences["Latitude"],
+                region=london_greater_area,
+                bandwidth="lscv",
+            )
+
+        with track("cluster_crime_incidents_dbscan", rows=len(crime_incidences)):
+            dbscan_clusters = point_patterns.cluster_crime_incidents_dbscan(
+                latitudes=crime_incidences["Latitude"],
+                longitudes=crime_incidences["Longitude"],
+                epsilon=1.5,  # km
+                min_samples=330,
+            )
+
+        point_patterns.save_hotspots(densities, produces["densities"])
+        utils.save_object_to_pickle(dbscan_clusters, produces["dbscan_clusters"])
+
+    @pytask.mark.depends_on(
+        {
+            "scripts": ["point_patterns.py"],
+            "crime_incidences": os.path.join(
+                data_clean,
+                f"city-of-london-burglaries-{year}-cleaned.csv",
+            ),
+        },
+    )
+    @pytask.mark.produces(os.path.join(results_dir, year, "near_repeat_knox.nc"))
+    @pytask.mark.task(id=year)
+    @instrument(name=f"task_near_repeat_analysis[{year}]")
+    def task_near_repeat_analysis(depends_on, produces):
+        """Perform the Knox near-repeat analysis of space-time interaction."""
+        import geopandas as gpd
+
+        from crime_patterns.analysis import point_patterns
+
+        crime_incidences = dm.read_crime_data(
+            depends_on["crime_incidences"],
+            columns=["Longitude", "Latitude", "Month"],
+        )
+        points = gpd.points_from_xy(
+            x=crime_incidences["Longitude"],
+            y=crime_incidences["Latitude"],
+            crs="EPSG:4326",
+        ).to_crs(config.CRS)
+
+        with track("knox_near_repeat", rows=len(crime_incidences)):
+            near_repeat = point_patterns.knox_near_repeat(
+                x=points.x,
+                y=points.y,
+                t=point_patterns.month_to_period(crime_incidences["Month"]),
+                distance_bands=[0, 200, 400, 600, 800, 1000],  # m
+                time_bands=[0, 1, 2, 3, 4],  # months
+                permutations=99,
+                n_workers=None,
+                seed=0,
+            )
+
+        near_repeat.to_netcdf(produces, mode="w", format="NETCDF4", engine="netcdf4")
+
+    @pytask.mark.depends_on(
+        {
+            "scripts": ["point_patterns.py", "kernel_density.py"],
+            "crime_incidences": os.path.join(
+                data_clean,
+                f"city-of-london-burglaries-{year}-cleaned.csv",
+            ),
+            "london_greater_area": os.path.join(data_clean, "Greater_London_Area.shp"),
+        },
+    )
+    @pytask.mark.produces(
+        {
+            envelope: os.path.join(results_dir, year, f"ripley_{envelope}.nc")
+            for envelope in ["csr", "ipp"]
+        },
+    )
+    @pytask.mark.task(id=year)
+    @instrument(name=f"task_ripley_analysis[{year}]")
+    def task_ripley_analysis(depends_on, produces):
+        """Estimate Ripley's K, L and g with CSR and inhomogeneous Poisson envelopes."""
+        import geopandas as gpd
+
+        from crime_patterns.analysis import point_patterns
+
+        london_greater_area = gpd.read_file(depends_on["london_greater_area"])
+        crime_incidences = dm.read_crime_data(
+            depends_on["crime_incidences"],
+            columns=["Longitude", "Latitude"],
+        )
+        points = gpd.points_from_xy(
+            x=crime_incidences["Longitude"],
+            y=crime_incidences["Latitude"],
+            crs="EPSG:4326",
+        ).to_crs(config.CRS)
+
+        for envelope, path in produces.items():
+            with track(f"ripley_functions_{envelope}", rows=len(crime_incidences)):
+                ripley = point_patterns.ripley_functions(
+                    x=points.x,
+                    y=points.y,
+                    window=london_greater_area.to_crs(config.CRS),
+                    radii=list(range(25, 1001, 25)),  # m
+                    envelope=envelope,
+                    simulations=99,
+                    n_workers=None,
+                    seed=0,
+                )
+
+            ripley.to_netcdf(path, mode="w", format="NETCDF4", engine="netcdf4")
+
+
+@pytask.mark.depends_on(
+    {
+        "scripts": ["space_time_cube.py"],
+        "crime_incidences": {
+            year: os.path.join(
+                data_clean,
+                f"city-of-london-burglaries-{year}-cleaned.csv",
+            )
+            for year in years
+        },
+    },
+)
+@pytask.mark.produces(os.path.join(results_dir, "incident_cube.nc"))
+@instrument
+def task_build_incident_cube(depends_on, produces):
+    """Bin the crime incidences of all years into a space-time count cube."""
+    import geopandas as gpd
+
+    from crime_patterns.analysis import space_time_cube
+
+    crime_incidences = dm.concat_crime_data(
+        [
+            dm.read_crime_data(
+                path,
+                columns=["Longitude", "Latitude", "Month", "Crime type"],
+            )
+            for path in depends_on["crime_incidences"].values()
+        ],
+    )
+    points = gpd.points_from_xy(
+        x=crime_incidences["Longitude"],
+        y=crime_incidences["Latitude"],
+        crs="EPSG:4326",
+    ).to_crs(config.CRS)
+
+    with track("build_incident_cube", rows=len(crime_incidences)):
+        cube = space_time_cube.build_incident_cube(
+            x=points.x,
+            y=points.y,
+            months=crime_incidences["Month"],
+            crime_types=crime_incidences["Crime type"],
+            cell_size=250,  # m
+        )
+
+    space_time_cube.save_incident_cube(cube, produces)
+
+
 @pytask.mark.depends_on(
     {
-        "scripts": ["point_patterns.py"],
-        "crime_incidences": os.path.join(
-            data_clean,
-            r"city-of-london-burglaries-2019-cleaned.csv",
-        ),
+        "scripts": ["hotspot_forecast.py"],
+        "incident_cube": os.path.join(results_dir, "incident_cube.nc"),
         "london_greater_area": os.path.join(data_clean, "Greater_London_Area.shp"),
     },
 )
 @pytask.mark.produces(
     {
-        "densities": os.path.join(results_dir, "kernel_density_estimates.nc"),
-        "dbscan_clusters": os.path.join(models_dir, "dbscan_clusters.pickle"),
+        "forecast": os.path.join(results_dir, "hotspot_forecast.nc"),
+        "backtest": os.path.join(results_dir, "hotspot_forecast_backtest.nc"),
     },
 )
-def task_point_patterns_analysis(depends_on, produces):
-    """Perform point pattern analysis."""
-    ## Load data
+@instrument
+def task_forecast_hotspots(depends_on, produces):
+    """Forecast the hotspots of the next month and backtest the monthly forecasts."""
+    import geopandas as gpd
+
+    from crime_patterns.analysis import hotspot_forecast, space_time_cube
+
     london_greater_area = gpd.read_file(depends_on["london_greater_area"])
-    crime_incidences = pd.read_csv(depends_on["crime_incidences"])
-    densities = point_patterns.evaluate_hotspots(
-        longitudes=crime_incidences["Longitude"],
-        latitudes=crime_incidences["Latitude"],
-        region=london_greater_area,
-    )
 
-    dbscan_clusters = point_patterns.cluster_crime_incidents_dbscan(
-        latitudes=crime_incidences["Latitude"],
-        longitudes=crime_incidences["Longitude"],
-        epsilon=1.5,  # km
-        min_samples=330,
-    )
+    with space_time_cube.open_incident_cube(depends_on["incident_cube"]) as cube:
+        with track("forecast_hotspots", rows=cube.sizes["month"]):
+            forecast = hotspot_forecast.forecast_hotspots(
+                cube,
+                bandwidth=500,  # m
+                decay=0.7,
+            )
+        with track("backtest_hotspot_forecasts", rows=cube.sizes["month"]):
+            backtest = hotspot_forecast.backtest_hotspot_forecasts(
+                cube,
+                bandwidth=500,  # m
+                decay=0.7,
+                window=london_greater_area.to_crs(config.CRS),
+            )
 
-    densities.to_netcdf(
-        produces["densities"],
+    ## The surface of the last month forecasts the month after the data.
+    forecast.isel(month=-1).to_netcdf(
+        produces["forecast"],
+        mode="w",
+        format="NETCDF4",
+        engine="netcdf4",
+    )
+    backtest.to_netcdf(
+        produces["backtest"],
         mode="w",
         format="NETCDF4",
         engine="netcdf4",
     )
-    utils.save_object_to_pickle(dbscan_clusters, produces["dbscan_clusters"])
 
 
 #%%
-
-
 @pytask.mark.depends_on(
     {
         "scripts": ["spatial_regression.py"],
-        "burglary_ward_shp_path": os.path.join(
-            data_clean,
-            r"MPS_Ward_Level_burglary_2019.shp",
-        ),
-    },
-)
-@pytask.mark.produces(
-    {
-        "weights_matrix_ward": os.path.join(models_dir, "weights_matrix_ward.pickle"),
-        "moran": os.path.join(models_dir, "moran.pickle"),
-        "burglary_ward_lag": os.path.join(results_dir, "burglary_ward_lag.shp"),
+        "london_ward": boundaries.boundary_cache_path("ward", config.CRS),
     },
 )
-def task_spatial_autocorrelation_analysis(depends_on, produces):
-    """Perform spatial autocorrelation analysis."""
-    ## Load data
-    burglary_ward = gpd.read_file(depends_on["burglary_ward_shp_path"])
+@pytask.mark.produces(os.path.join(models_dir, "weights_matrix_ward.pickle"))
+def task_create_weights_matrix(depends_on, produces):
+    """Create the ward weights matrix shared by all years."""
+    from crime_patterns.analysis import spatial_regression
+
+    london_wards = boundaries.load_boundary("ward", config.CRS)
 
-    ## Calculate weights matrix
     w_knn_8_ward = spatial_regression.create_weights_matrix(
-        burglary_ward,
+        london_wards,
         method="knn",
         k=8,
+        ids="GSS_CODE",
     )
 
-    ## Calculate spatial lag
-    burglary_ward_lag = spatial_regression.calculate_spatial_lag(
-        data=burglary_ward,
-        y_col_name="2019_total",
-        weights_matrix=w_knn_8_ward,
-        ID_column_name="GSS_CODE",
-    )
+    utils.save_object_to_pickle(w_knn_8_ward, produces)
+
 
-    ## Calculate Moran's I
-    moran = spatial_regression.calculate_morans_I(
-        data=burglary_ward,
-        y_col_name="2019_total",
-        weights_matrix=w_knn_8_ward,
-        transform="R",
+for year in years:
+
+    @pytask.mark.depends_on(
+        {
+            "scripts": ["spatial_regression.py"],
+            "burglary_ward_shp_path": os.path.join(
+                data_clean,
+                f"MPS_Ward_Level_burglary_{year}.shp",
+            ),
+            "weights_matrix_ward": os.path.join(
+                models_dir,
+                "weights_matrix_ward.pickle",
+            ),
+        },
+    )
+    @pytask.mark.produces(
+        {
+            "moran": os.path.join(models_dir, year, "moran.pickle"),
+            "burglary_ward_lag": os.path.join(
+                results_dir,
+                year,
+                "burglary_ward_lag.shp",
+            ),
+            "burglary_ward_lisa": os.path.join(
+                results_dir,
+                year,
+                "burglary_ward_lisa.csv",
+            ),
+        },
     )
+    @pytask.mark.task(id=year, kwargs={"year": year})
+    def task_spatial_autocorrelation_analysis(depends_on, produces, year):
+        """Perform spatial autocorrelation analysis."""
+        import geopandas as gpd
 
-    ## Save weights matrix and Moran
-    utils.save_object_to_pickle(w_knn_8_ward, produces["weights_matrix_ward"])
-    utils.save_object_to_pickle(moran, produces["moran"])
+        from crime_patterns.analysis import spatial_regression
 
-    ## Save spatial lags
-    burglary_ward_lag.to_file(produces["burglary_ward_lag"])
+        ## Load data
+        burglary_ward = gpd.read_file(depends_on["burglary_ward_shp_path"])
+        w_knn_8_ward = spatial_regression.subset_weights_matrix(
+            utils.load_object_from_pickle(depends_on["weights_matrix_ward"]),
+            burglary_ward["GSS_CODE"],
+        )
 
+        ## Calculate spatial lag
+        burglary_ward_lag = spatial_regression.calculate_spatial_lag(
+            data=burglary_ward,
+            y_col_name=f"{year}_total",
+            weights_matrix=w_knn_8_ward,
+            ID_column_name="GSS_CODE",
+        )
 
-@pytask.mark.depends_on(
-    {
-        "scripts": ["spatial_regression.py"],
-        "imd_ward_shp_path": os.path.join(data_clean, r"IMD_Ward_2019.shp"),
-        "burglary_ward_shp_path": os.path.join(
-            data_clean,
-            r"MPS_Ward_Level_burglary_2019.shp",
-        ),
-        "pop_ward_shp_path": os.path.join(data_clean, r"Population_Ward_2019.shp"),
-    },
-)
-@pytask.mark.produces(
-    {
-        "model_spatial_ols": os.path.join(models_dir, "model_spatial_ols.pickle"),
-        "model_spatial_ml_lag": os.path.join(models_dir, "model_spatial_ml_lag.pickle"),
-        "model_spatial_ml_error": os.path.join(
-            models_dir,
-            "model_spatial_ml_error.pickle",
-        ),
-        "summary_spatial_ols_csv": os.path.join(
-            results_dir,
-            "model_spatial_ols_summary.csv",
-        ),
-        "summary_spatial_ml_lag_csv": os.path.join(
-            results_dir,
-            "model_spatial_ml_lag_summary.csv",
-        ),
-        "summary_spatial_ml_error_csv": os.path.join(
-            results_dir,
-            "model_spatial_ml_error_summary.csv",
-        ),
-    },
-)
-def task_spatial_regression_analysis(depends_on, produces):
-    """Perform spatial regression analysis."""
-    ## Load data
-    imd_ward = gpd.read_file(depends_on["imd_ward_shp_path"])
-    burglary_ward = gpd.read_file(depends_on["burglary_ward_shp_path"])
-    pop_ward = gpd.read_file(depends_on["pop_ward_shp_path"])
-
-    ## Merge data
-    db = spatial_regression.prepare_data_for_spatial_regression(
-        crime_data=burglary_ward,
-        explanatory_data=imd_ward,
-        population=pop_ward,
-        crime_col_name="2019_total",
-        population_col_name="TotPop",
-        ID_col_name="GSS_CODE",
-        standardize=True,
-    )
-    db = db.rename(columns={"2019_total_rate": "burglaryRate2019"})
-
-    dependent_variable_name = "burglaryRate2019"
-    independent_variable_names = [
-        "IncScore",
-        "EmpScore",
-        "EnvScore",
-        "BHSScore",
-        "EduScore",
-    ]
-
-    ## Run spatial regression
-    model_ols = spatial_regression.perform_spatial_regression(
-        db,
-        dependent_variable_name,
-        independent_variable_names,
-        method="OLS",
-    )
-    model_ml_lag = spatial_regression.perform_spatial_regression(
-        db,
-        dependent_variable_name,
-        independent_variable_names,
-        method="ML_Lag",
+        ## Calculate Moran's I
+        moran = spatial_regression.calculate_morans_I(
+            data=burglary_ward,
+            y_col_name=f"{year}_total",
+            weights_matrix=w_knn_8_ward,
+            transform="R",
+        )
+
+        ## Calculate local Moran's I
+        lisa = spatial_regression.calculate_local_morans_I(
+            data=burglary_ward,
+            y_col_name=f"{year}_total",
+            weights_matrix=w_knn_8_ward,
+            ID_column_name="GSS_CODE",
+            transform="R",
+            seed=0,
+        )
+
+        ## Save Moran
+        utils.save_object_to_pickle(moran, produces["moran"])
+        lisa.to_csv(produces["burglary_ward_lisa"], index=False)
+
+        ## Save spatial lags
+        burglary_ward_lag.to_file(produces["burglary_ward_lag"])
+
+    @pytask.mark.depends_on(
+        {
+            "scripts": ["spatial_regression.py"],
+            "imd_ward_shp_path": os.path.join(data_clean, r"IMD_Ward_2019.shp"),
+            "burglary_ward_shp_path": os.path.join(
+                data_clean,
+                f"MPS_Ward_Level_burglary_{year}.shp",
+            ),
+            "pop_ward_shp_path": os.path.join(data_clean, r"Population_Ward_2019.shp"),
+            "weights_matrix_ward": os.path.join(
+                models_dir,
+                "weights_matrix_ward.pickle",
+            ),
+        },
     )
-    model_ml_error = spatial_regression.perform_spatial_regression(
-        db,
-        dependent_variable_name,
-        independent_variable_names,
-        method="ML_Error",
+    @pytask.mark.produces(
+        {
+            "model_spatial_ols": os.path.join(
+                models_dir,
+                year,
+                "model_spatial_ols.pickle",
+            ),
+            "model_spatial_ml_lag": os.path.join(
+                models_dir,
+                year,
+                "model_spatial_ml_lag.pickle",
+            ),
+            "model_spatial_ml_error": os.path.join(
+                models_dir,
+                year,
+                "model_spatial_ml_error.pickle",
+            ),
+            "summary_spatial_ols_csv": os.path.join(
+                results_dir,
+                year,
+                "model_spatial_ols_summary.csv",
+            ),
+            "summary_spatial_ml_lag_csv": os.path.join(
+                results_dir,
+                year,
+                "model_spatial_ml_lag_summary.csv",
+            ),
+            "summary_spatial_ml_error_csv": os.path.join(
+                results_dir,
+                year,
+                "model_spatial_ml_error_summary.csv",
+            ),
+        },
     )
+    @pytask.mark.task(id=year, kwargs={"year": year})
+    @instrument(name=f"task_spatial_regression_analysis[{year}]")
+    def task_spatial_regression_analysis(depends_on, produces, year):
+        """Perform spatial regression analysis."""
+        import geopandas as gpd
 
-    ## Save models
-    utils.save_object_to_pickle(model_ols, produces["model_spatial_ols"])
-    utils.save_object_to_pickle(model_ml_lag, produces["model_spatial_ml_lag"])
-    utils.save_object_to_pickle(model_ml_error, produces["model_spatial_ml_error"])
+        from crime_patterns.analysis import spatial_regression
 
-    ## Save summaries
-    spatial_regression.get_reg_summary(model_ols, "OLS").to_csv(
-        produces["summary_spatial_ols_csv"],
-    )
-    spatial_regression.get_reg_summary(model_ml_lag, "ML_Lag").to_csv(
-        produces["summary_spatial_ml_lag_csv"],
+        ## Load data
+        imd_ward = gpd.read_file(depends_on["imd_ward_shp_path"])
+        burglary_ward = gpd.read_file(depends_on["burglary_ward_shp_path"])
+        pop_ward = gpd.read_file(depends_on["pop_ward_shp_path"])
+        w_knn_8_ward = utils.load_object_from_pickle(depends_on["weights_matrix_ward"])
+
+        ## Merge data
+        db = spatial_regression.prepare_data_for_spatial_regression(
+            crime_data=burglary_ward,
+            explanatory_data=imd_ward,
+            population=pop_ward,
+            crime_col_name=f"{year}_total",
+            population_col_name="TotPop",
+            ID_col_name="GSS_CODE",
+            standardize=True,
+        )
+        db = db.rename(columns={f"{year}_total_rate": f"burglaryRate{year}"})
+
+        dependent_variable_name = f"burglaryRate{year}"
+        independent_variable_names = [
+            "IncScore",
+            "EmpScore",
+            "EnvScore",
+            "BHSScore",
+            "EduScore",
+        ]
+
+        ## Run spatial regression
+        with track("perform_spatial_regression_OLS", rows=len(db)):
+            model_ols = spatial_regression.perform_spatial_regression(
+                db,
+                dependent_variable_name,
+                independent_variable_names,
+                method="OLS",
+                w=w_knn_8_ward,
+            )
+        with track("perform_spatial_regression_ML_Lag", rows=len(db)):
+            model_ml_lag = spatial_regression.perform_spatial_regression(
+                db,
+                dependent_variable_name,
+                independent_variable_names,
+                method="ML_Lag",
+                w=w_knn_8_ward,
+            )
+        with track("perform_spatial_regression_ML_Error", rows=len(db)):
+            model_ml_error = spatial_regression.perform_spatial_regression(
+                db,
+                dependent_variable_name,
+                independent_variable_names,
+                method="ML_Error",
+                w=w_knn_8_ward,
+            )
+
+        ## Save models
+        utils.save_object_to_pickle(model_ols, produces["model_spatial_ols"])
+        utils.save_object_to_pickle(model_ml_lag, produces["model_spatial_ml_lag"])
+        utils.save_object_to_pickle(
+            model_ml_error,
+            produces["model_spatial_ml_error"],
+        )
+
+        ## Save summaries
+        spatial_regression.get_reg_summary(model_ols, "OLS").to_csv(
+            produces["summary_spatial_ols_csv"],
+        )
+        spatial_regression.get_reg_summary(model_ml_lag, "ML_Lag").to_csv(
+            produces["summary_spatial_ml_lag_csv"],
+        )
+        spatial_regression.get_reg_summary(model_ml_error, "ML_Error").to_csv(
+            produces["summary_spatial_ml_error_csv"],
+        )
+
+    @pytask.mark.depends_on(
+        {
+            "scripts": ["spatial_regression.py", "spatial_cv.py"],
+            "imd_ward_shp_path": os.path.join(data_clean, r"IMD_Ward_2019.shp"),
+            "burglary_ward_shp_path": os.path.join(
+                data_clean,
+                f"MPS_Ward_Level_burglary_{year}.shp",
+            ),
+            "pop_ward_shp_path": os.path.join(data_clean, r"Population_Ward_2019.shp"),
+            "weights_matrix_ward": os.path.join(
+                models_dir,
+                "weights_matrix_ward.pickle",
+            ),
+            "london_borough": boundaries.boundary_cache_path("borough", config.CRS),
+        },
     )
-    spatial_regression.get_reg_summary(model_ml_error, "ML_Error").to_csv(
-        produces["summary_spatial_ml_error_csv"],
+    @pytask.mark.produces(
+        {
+            "fold_metrics": os.path.join(results_dir, year, "spatial_cv_metrics.csv"),
+            "coefficient_stability": os.path.join(
+                results_dir,
+                year,
+                "spatial_cv_coefficient_stability.csv",
+            ),
+        },
     )
+    @pytask.mark.task(id=year, kwargs={"year": year})
+    @instrument(name=f"task_spatial_cross_validation[{year}]")
+    def task_spatial_cross_validation(depends_on, produces, year):
+        """Cross-validate the regression models, holding out one borough at a time."""
+        import geopandas as gpd
+
+        from crime_patterns.analysis import spatial_cv, spatial_regression
+
+        ## Load data
+        imd_ward = gpd.read_file(depends_on["imd_ward_shp_path"])
+        burglary_ward = gpd.read_file(depends_on["burglary_ward_shp_path"])
+        pop_ward = gpd.read_file(depends_on["pop_ward_shp_path"])
+        w_knn_8_ward = utils.load_object_from_pickle(depends_on["weights_matrix_ward"])
+        london_borough = boundaries.load_boundary("borough", config.CRS)
+
+        ## Merge data
+        db = spatial_regression.prepare_data_for_spatial_regression(
+            crime_data=burglary_ward,
+            explanatory_data=imd_ward,
+            population=pop_ward,
+            crime_col_name=f"{year}_total",
+            population_col_name="TotPop",
+            ID_col_name="GSS_CODE",
+            standardize=True,
+        )
+        db = gpd.GeoDataFrame(db, geometry="geometry", crs=imd_ward.crs).to_crs(
+            config.CRS,
+        )
+        db = db.rename(columns={f"{year}_total_rate": f"burglaryRate{year}"})
+
+        ## Borough of every ward, from the borough containing its representative point
+        ward_points = gpd.GeoDataFrame(geometry=db.representative_point())
+        boroughs = ward_points.sjoin(
+            london_borough[["NAME", "geometry"]],
+            how="left",
+            predicate="within",
+        )["NAME"]
+        boroughs = boroughs[~boroughs.index.duplicated()]
+
+        folds = spatial_cv.spatial_folds(db, boroughs.fillna("unknown"), buffer=500)
+
+        with track("cross_validate_spatial_regression", rows=len(db)):
+            fold_metrics, fold_coefficients = (
+                spatial_cv.cross_validate_spatial_regression(
+                    db,
+                    f"burglaryRate{year}",
+                    ["IncScore", "EmpScore", "EnvScore", "BHSScore", "EduScore"],
+                    folds,
+                    w=w_knn_8_ward,
+                    n_workers=None,
+                )
+            )
+
+        fold_metrics.to_csv(produces["fold_metrics"], index=False)
+        spatial_cv.get_coefficient_stability(fold_coefficients).to_csv(
+            produces["coefficient_stability"],
+        )
+
+
+## Ward and LSOA designs of the GWR, with the column of their ids.
+GWR_LEVELS = {"Ward": "GSS_CODE", "LSOA": "LSOA11CD"}
+
+for year in years:
+    for level, ID_col_name in GWR_LEVELS.items():
+
+        @pytask.mark.depends_on(
+            {
+                "scripts": ["spatial_regression.py", "gwr.py"],
+                "imd_shp_path": os.path.join(data_clean, f"IMD_{level}_2019.shp"),
+                "burglary_shp_path": os.path.join(
+                    data_clean,
+                    f"MPS_{level}_Level_burglary_{year}.shp",
+                ),
+                "pop_shp_path": os.path.join(
+                    data_clean,
+                    "Population_Ward_2019.shp"
+                    if level == "Ward"
+                    else "IMD_LSOA_2019.shp",
+                ),
+            },
+        )
+        @pytask.mark.produces(
+            {
+                "gwr": os.path.join(results_dir, year, f"gwr_{level.lower()}.parquet"),
+                "bandwidth_aicc": os.path.join(
+                    results_dir,
+                    year,
+                    f"gwr_{level.lower()}_bandwidth_aicc.csv",
+                ),
+            },
+        )
+        @pytask.mark.task(
+            id=f"{year}-{level.lower()}",
+            kwargs={"year": year, "ID_col_name": ID_col_name},
+        )
+        @instrument(name=f"task_gwr_analysis[{year}-{level.lower()}]")
+        def task_gwr_analysis(depends_on, produces, year, ID_col_name):
+            """Fit a geographically weighted regression of the burglary rate."""
+            import geopandas as gpd
+            import pandas as pd
+
+            from crime_patterns.analysis import gwr, spatial_regression
+
+            ## Load data, the LSOA files keep the lower case id of the IMD data
+            imd = gpd.read_file(depends_on["imd_shp_path"])
+            burglary = gpd.read_file(depends_on["burglary_shp_path"])
+            pop = gpd.read_file(depends_on["pop_shp_path"])
+            imd = imd.rename(columns={"lsoa11cd": ID_col_name})
+            pop = pop.rename(columns={"lsoa11cd": ID_col_name})
+
+            ## Merge data
+            db = spatial_regression.prepare_data_for_spatial_regression(
+                crime_data=burglary,
+                explanatory_data=imd.drop(columns="TotPop", errors="ignore"),
+                population=pop,
+                crime_col_name=f"{year}_total",
+                population_col_name="TotPop",
+                ID_col_name=ID_col_name,
+                standardize=True,
+            )
+            db = gpd.GeoDataFrame(db, geometry="geometry", crs=imd.crs).to_crs(
+                config.CRS,
+            )
+
+            with track("fit_gwr", rows=len(db)):
+                local_estimates = gwr.fit_gwr(
+                    db,
+                    f"{year}_total_rate",
+                    ["IncScore", "EmpScore", "EnvScore", "BHSScore", "EduScore"],
+                    ID_col_name=ID_col_name,
+                    n_workers=None,
+                )
+
+            pd.Series(
+                local_estimates.attrs["aicc_curve"],
+                name="AICc",
+            ).rename_axis("bandwidth").to_csv(produces["bandwidth_aicc"])
+            local_estimates.to_parquet(produces["gwr"])
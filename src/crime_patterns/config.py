@@ -1,7 +1,10 @@
 #%%
 """All the general configuration of the project."""
+import functools
 from pathlib import Path
 
+import crime_patterns.utilities as utils
+
 #%%
 SRC = Path(__file__).parent.resolve()
 BLD = SRC.joinpath("..", "..", "bld").resolve()
@@ -14,7 +17,34 @@ GROUPS = ["marital_status", "qualification"]
 # Setting default CRS to OSGB36 / British National Grid
 CRS = "EPSG:27700"
 
-__all__ = ["BLD", "SRC", "TEST_DIR", "GROUPS", "CRS"]
+DATA_INFO_PATH = SRC / "data_management" / "data_info.yaml"
+
+
+@functools.cache
+def read_data_info():
+    """Read ``data_info.yaml`` once per process.
+
+    Every task module needs the data info at collection, the parsed file is shared
+    between them. The returned dictionary must not be modified.
+
+    Returns:
+    --------
+    data_info: dict
+        The contents of ``data_info.yaml``.
+
+    """
+    return utils.read_yaml(DATA_INFO_PATH)
+
+
+__all__ = [
+    "BLD",
+    "SRC",
+    "TEST_DIR",
+    "GROUPS",
+    "CRS",
+    "DATA_INFO_PATH",
+    "read_data_info",
+]
 
 # %%
 
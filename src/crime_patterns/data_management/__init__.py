@@ -1,21 +1,37 @@
 """Functions for managing data."""
 
-from crime_patterns.data_management.clean_data import (
-    aggregate_regional_level_data,
-    clean_monthly_crime_data,
-    clean_regional_burglary_data,
-    convert_points_df_to_gdf,
-    convert_region_df_to_gdf,
-    dissolve_gdf_polygons,
-    extract_lsoa_imd_data,
-)
+import importlib
 
 __all__ = [
     "clean_monthly_crime_data",
+    "read_crime_data",
+    "concat_crime_data",
     "convert_points_df_to_gdf",
     "clean_regional_burglary_data",
+    "convert_regional_crime_data_to_long",
+    "read_regional_crime_data",
     "convert_region_df_to_gdf",
     "aggregate_regional_level_data",
     "extract_lsoa_imd_data",
+    "read_imd_data",
     "dissolve_gdf_polygons",
 ]
+
+
+def __getattr__(name):
+    """Import the functions of `clean_data` on first access.
+
+    Importing the package, e.g. to collect the tasks, does not import geopandas.
+
+    """
+    if name in __all__:
+        module = importlib.import_module("crime_patterns.data_management.clean_data")
+        globals()[name] = getattr(module, name)
+
+        return globals()[name]
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted({*globals(), *__all__})
@@ -0,0 +1,386 @@
+"""Registry of the London boundary layers, cached pre-projected as GeoParquet."""
+
+import functools
+import logging
+import os
+from pathlib import Path
+
+import numpy as np
+
+import crime_patterns.config as config
+import crime_patterns.utilities as utils
+
+## geopandas, shapely and pyproj are imported by the functions using them, so the
+## task modules compute the paths of the cached layers without importing them.
+
+logger = logging.getLogger(__name__)
+
+## Shapefiles of the statistical GIS boundary files for London.
+BOUNDARY_FILES = {
+    "lsoa": "LSOA_2011_London_gen_MHW.shp",
+    "msoa": "MSOA_2011_London_gen_MHW.shp",
+    "ward": "London_Ward.shp",
+    "borough": "London_Borough_Excluding_MHW.shp",
+}
+
+## Every layer is cached in these coordinate reference systems.
+CACHE_CRS = [config.CRS, "EPSG:4326"]
+
+## Simplification tolerances of the cached outlines, in metres.
+OUTLINE_TOLERANCES = [0, 10, 100]
+
+## Simplification tolerances of the cached level-of-detail variants of every layer,
+## in metres.
+LOD_TOLERANCES = [0, 5, 10, 25, 50, 100]
+
+## Largest tolerance used for a figure, as a fraction of the size of a pixel.
+LOD_PIXEL_FRACTION = 0.5
+
+BOUNDARIES_DIR = config.BLD / "python" / "data" / "boundaries"
+
+
+def boundary_cache_path(name, crs, cache_dir=None, tolerance=0):
+    """Path of the cached file of a boundary layer.
+
+    Parameters:
+    -----------
+    name: str
+        Name of the layer, one of the keys of `BOUNDARY_FILES`.
+    crs: str or pyproj.CRS
+        Coordinate reference system of the cached layer.
+    cache_dir: str or pathlib.Path
+        Directory of the cached layers, defaults to `BOUNDARIES_DIR`.
+    tolerance: float
+        Simplification tolerance of the layer in metres, 0 for the exact layer.
+
+    Returns:
+    --------
+    path: pathlib.Path
+        Path of the GeoParquet file.
+
+    """
+    if name not in BOUNDARY_FILES:
+        raise ValueError(
+            f"Unknown boundary layer {name!r}. Valid options are: "
+            f"{', '.join(map(repr, BOUNDARY_FILES))}.",
+        )
+
+    epsg = _epsg_code(crs)
+    suffix = f"_s{tolerance:g}" if tolerance else ""
+
+    return Path(cache_dir or BOUNDARIES_DIR) / f"{name}_{epsg}{suffix}.parquet"
+
+
+def lod_cache_paths(name, crs, cache_dir=None, tolerances=None):
+    """Paths of the cached level-of-detail variants of a boundary layer.
+
+    Parameters:
+    -----------
+    name: str
+        Name of the layer, one of the keys of `BOUNDARY_FILES`.
+    crs: str or pyproj.CRS
+        Coordinate reference system of the cached layer.
+    cache_dir: str or pathlib.Path
+        Directory of the cached layers, defaults to `BOUNDARIES_DIR`.
+    tolerances: list
+        Simplification tolerances in metres, defaults to `LOD_TOLERANCES`.
+
+    Returns:
+    --------
+    paths: dict
+        Dictionary mapping each tolerance to the path of the GeoParquet file.
+
+    """
+    return {
+        tolerance: boundary_cache_path(name, crs, cache_dir, tolerance)
+        for tolerance in tolerances or LOD_TOLERANCES
+    }
+
+
+def cache_boundaries(
+    shapefiles_dir,
+    cache_dir=None,
+    names=None,
+    crs_list=None,
+    tolerances=None,
+):
+    """Read every boundary shapefile once and cache it in every CRS.
+
+    Besides the exact layer, a variant simplified with `simplify_coverage` is cached
+    for every tolerance, so figures can plot a level of detail matching their
+    resolution.
+
+    Parameters:
+    -----------
+    shapefiles_dir: str or pathlib.Path
+        Directory containing the shapefiles listed in `BOUNDARY_FILES`.
+    cache_dir: str or pathlib.Path
+        Directory of the cached layers, defaults to `BOUNDARIES_DIR`.
+    names: list
+        Names of the layers to cache, defaults to all layers.
+    crs_list: list
+        Coordinate reference systems to cache the layers in, defaults to
+        `CACHE_CRS`.
+    tolerances: list
+        Simplification tolerances in metres, defaults to `LOD_TOLERANCES`.
+
+    Returns:
+    --------
+    paths: dict
+        Dictionary mapping each (name, crs) pair to the path of the cached exact
+        layer.
+
+    """
+    import geopandas as gpd
+
+    paths = {}
+
+    for name in names or BOUNDARY_FILES:
+        ## Simplify in the projected CRS, the tolerances are in metres.
+        layer = gpd.read_file(Path(shapefiles_dir) / BOUNDARY_FILES[name])
+        layer = layer.to_crs(config.CRS)
+
+        for tolerance in tolerances or LOD_TOLERANCES:
+            level = simplify_coverage(layer, tolerance) if tolerance else layer
+
+            for crs in crs_list or CACHE_CRS:
+                path = boundary_cache_path(name, crs, cache_dir, tolerance)
+                path.parent.mkdir(parents=True, exist_ok=True)
+                level.to_crs(crs).to_parquet(path)
+                if not tolerance:
+                    paths[name, crs] = path
+
+    return paths
+
+
+def simplify_coverage(layer, tolerance):
+    """Simplify the polygons of a layer without opening gaps or overlaps.
+
+    Parameters:
+    -----------
+    layer: geopandas.GeoDataFrame
+        Layer of polygons in a projected CRS. It is not modified.
+    tolerance: float
+        Simplification tolerance in the unit of the CRS, roughly the square root of
+        the area of the removed triangles.
+
+    Returns:
+    --------
+    layer: geopandas.GeoDataFrame
+        Layer with the simplified polygons. Shared edges are simplified once, so
+        neighbouring polygons still match. Falls back to simplifying every polygon
+        on its own if the polygons do not form a valid coverage.
+
+    """
+    import shapely
+
+    if shapely.coverage_is_valid(layer.geometry.values):
+        geometry = layer.geometry.simplify_coverage(tolerance)
+    else:
+        logger.warning("Polygons do not form a valid coverage, simplifying each.")
+        geometry = layer.geometry.simplify(tolerance, preserve_topology=True)
+
+    return layer.set_geometry(geometry)
+
+
+def select_tolerance(bounds, crs, figsize, dpi, tolerances=None):
+    """Largest simplification tolerance invisible at the resolution of a figure.
+
+    Parameters:
+    -----------
+    bounds: tuple
+        Extent (xmin, ymin, xmax, ymax) of the plotted layer.
+    crs: str or pyproj.CRS
+        Coordinate reference system of the bounds.
+    figsize: tuple
+        Size of the figure in inches.
+    dpi: int
+        Resolution of the saved figure.
+    tolerances: list
+        Available tolerances in metres, defaults to `LOD_TOLERANCES`.
+
+    Returns:
+    --------
+    tolerance: float
+        Largest tolerance not exceeding `LOD_PIXEL_FRACTION` of the size of a pixel,
+        assuming the layer fills the figure. 0 if none does.
+
+    """
+    from pyproj import CRS
+
+    xmin, ymin, xmax, ymax = bounds
+    width, height = xmax - xmin, ymax - ymin
+
+    if CRS.from_user_input(crs).is_geographic:
+        ## Metres per degree of longitude and latitude at the centre of the extent.
+        width *= 111_320 * np.cos(np.radians((ymin + ymax) / 2))
+        height *= 110_574
+
+    pixel_size = max(width / (figsize[0] * dpi), height / (figsize[1] * dpi))
+
+    return max(
+        [
+            tolerance
+            for tolerance in tolerances or LOD_TOLERANCES
+            if tolerance <= LOD_PIXEL_FRACTION * pixel_size
+        ],
+        default=0,
+    )
+
+
+def load_boundary(name, crs=config.CRS, cache_dir=None, tolerance=0):
+    """Load a cached boundary layer.
+
+    Parameters:
+    -----------
+    name: str
+        Name of the layer, one of the keys of `BOUNDARY_FILES`.
+    crs: str or pyproj.CRS
+        Coordinate reference system of the layer, one of `CACHE_CRS` unless the
+        layers were cached in other systems.
+    cache_dir: str or pathlib.Path
+        Directory of the cached layers, defaults to `BOUNDARIES_DIR`.
+    tolerance: float
+        Simplification tolerance in metres, one of the cached tolerances.
+
+    Returns:
+    --------
+    layer: geopandas.GeoDataFrame
+        The boundary layer with its spatial index built.
+
+    """
+    path = boundary_cache_path(name, crs, cache_dir, tolerance)
+    if not path.is_file():
+        raise FileNotFoundError(
+            f"{path} not found. Cache the boundary layers with `cache_boundaries`.",
+        )
+
+    return read_boundary_file(path)
+
+
+def load_outline(
+    name="ward",
+    dissolve_name="Greater London Area",
+    tolerance=0,
+    crs=config.CRS,
+    cache_dir=None,
+):
+    """Load the outline of a boundary layer, dissolving it only once.
+
+    The outline is dissolved with a coverage union and cached together with its
+    simplified variants, keyed by the hash of the cached layer.
+
+    Parameters:
+    -----------
+    name: str
+        Name of the layer, one of the keys of `BOUNDARY_FILES`.
+    dissolve_name: str
+        Name of the dissolved polygon.
+    tolerance: float
+        Simplification tolerance in metres, 0 for the exact outline. Tolerances in
+        `OUTLINE_TOLERANCES` are read from the cache, others are simplified from
+        the exact outline.
+    crs: str or pyproj.CRS
+        Coordinate reference system of the outline.
+    cache_dir: str or pathlib.Path
+        Directory of the cached layers, defaults to `BOUNDARIES_DIR`.
+
+    Returns:
+    --------
+    outline: geopandas.GeoDataFrame
+        GeoDataFrame with the single dissolved polygon and its ``NAME``.
+
+    """
+    from pyproj import CRS
+
+    source = boundary_cache_path(name, config.CRS, cache_dir)
+    digest = utils.hash_file(source)[:16]
+    path = source.with_name(f"{name}_outline_{digest}.parquet")
+
+    if not path.is_file():
+        _cache_outline(load_boundary(name, config.CRS, cache_dir), dissolve_name, path)
+
+    outlines = read_boundary_file(path)
+    if tolerance in OUTLINE_TOLERANCES:
+        outline = outlines[outlines["tolerance"] == tolerance]
+    else:
+        outline = outlines[outlines["tolerance"] == 0]
+        outline = outline.set_geometry(
+            outline.geometry.simplify(tolerance, preserve_topology=True),
+        )
+
+    outline = outline.drop(columns="tolerance").reset_index(drop=True)
+    outline["NAME"] = dissolve_name
+
+    return outline if outline.crs == CRS.from_user_input(crs) else outline.to_crs(crs)
+
+
+def _cache_outline(layer, dissolve_name, path):
+    """Dissolve a layer and write the outline and its simplified variants."""
+    import geopandas as gpd
+
+    from crime_patterns.data_management.clean_data import dissolve_gdf_polygons
+
+    outline = dissolve_gdf_polygons(layer, dissolve_name, method="coverage")
+    geometry = outline.geometry.iloc[0]
+
+    outlines = gpd.GeoDataFrame(
+        {"tolerance": OUTLINE_TOLERANCES},
+        geometry=[
+            geometry.simplify(tolerance, preserve_topology=True) if tolerance else geometry
+            for tolerance in OUTLINE_TOLERANCES
+        ],
+        crs=layer.crs,
+    )
+
+    ## Write atomically, tasks of several years may request the outline at once.
+    tmp_path = path.with_name(f"{path.stem}.{os.getpid()}.tmp")
+    outlines.to_parquet(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def read_boundary_file(path):
+    """Read a boundary file, reusing the layer if the file did not change.
+
+    Parameters:
+    -----------
+    path: str or pathlib.Path
+        Path of a GeoParquet file or of any file readable by `geopandas.read_file`.
+
+    Returns:
+    --------
+    layer: geopandas.GeoDataFrame
+        Shallow copy of the layer with its spatial index built. Columns may be
+        added or replaced without affecting other consumers; the geometries are
+        shared.
+
+    """
+    path = Path(path).resolve()
+
+    return _read_boundary_file(path, os.stat(path).st_mtime_ns).copy(deep=False)
+
+
+@functools.lru_cache(maxsize=32)
+def _read_boundary_file(path, mtime_ns):
+    """Read a boundary file and build its spatial index, cached per modification."""
+    import geopandas as gpd
+
+    if path.suffix == ".parquet":
+        layer = gpd.read_parquet(path)
+    else:
+        layer = gpd.read_file(path)
+
+    ## Build the spatial index once, the shallow copies share it.
+    layer.sindex
+
+    return layer
+
+
+def _epsg_code(crs):
+    """EPSG code of a CRS, "EPSG:<code>" strings are parsed without pyproj."""
+    if isinstance(crs, str) and crs.upper().startswith("EPSG:") and crs[5:].isdigit():
+        return int(crs[5:])
+
+    from pyproj import CRS
+
+    return CRS.from_user_input(crs).to_epsg()
@@ -1,14 +1,34 @@
 """Function(s) for cleaning the data set(s)."""
 
 import logging
+import re
 from os.path import isfile
 
 import geopandas as gpd
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import shapely
+from pandas.api.types import union_categoricals
 
 logger = logging.getLogger(__name__)
 
+## Compact dtypes of the police crime data. Repeated strings are categorical, so
+## every row only stores integer codes.
+CRIME_DATA_DTYPES = {
+    "Crime ID": "string[pyarrow]",
+    "Month": "category",
+    "Reported by": "category",
+    "Falls within": "category",
+    "Location": "category",
+    "LSOA code": "category",
+    "LSOA name": "category",
+    "Crime type": "category",
+    "Last outcome category": "category",
+    "Context": "category",
+}
+
 
 def clean_monthly_crime_data(
     crime_incidence_filepath,
@@ -16,6 +36,7 @@ def clean_monthly_crime_data(
     year,
     month,
     columns_to_drop,
+    coordinate_dtype=None,
 ):
     """Function to clean the monthly crime data.
 
@@ -31,11 +52,13 @@ def clean_monthly_crime_data(
         The year of the crime data.
     month: int
         The month of the crime data.
+    coordinate_dtype: str
+        The dtype of the coordinates, see `read_crime_data`.
 
     Returns:
     --------
         crime_data_monthly: pd.DataFrame
-            The cleaned monthly crime data.
+            The cleaned monthly crime data, with the string columns as categoricals.
 
     """
     if isfile(crime_incidence_filepath):
@@ -43,6 +66,7 @@ def clean_monthly_crime_data(
             crime_incidence_filepath,
             columns_to_drop,
             crime_type,
+            coordinate_dtype,
         )
 
     logger.warning(f"Filepath doesn't exist: {crime_incidence_filepath}")
@@ -51,7 +75,12 @@ def clean_monthly_crime_data(
     return pd.DataFrame()
 
 
-def _clean_monthly_crime_data(crime_incidence_filepath, columns_to_drop, crime_type):
+def _clean_monthly_crime_data(
+    crime_incidence_filepath,
+    columns_to_drop,
+    crime_type,
+    coordinate_dtype=None,
+):
     """Function to clean the monthly crime data.
 
     Parameters:
@@ -62,6 +91,8 @@ def _clean_monthly_crime_data(crime_incidence_filepath, columns_to_drop, crime_t
         List of columns to drop from the raw monthly crime data.
     crime_type: str
         The crime type to filter the data by.
+    coordinate_dtype: str
+        The dtype of the coordinates, see `read_crime_data`.
 
     Returns:
     --------
@@ -69,11 +100,11 @@ def _clean_monthly_crime_data(crime_incidence_filepath, columns_to_drop, crime_t
         The cleaned monthly crime data.
 
     """
-    crime_data_monthly = pd.read_csv(crime_incidence_filepath)
-
-    ## remove unnecessary columns
-    crime_data_monthly = crime_data_monthly.drop(
-        columns=columns_to_drop,
+    ## unnecessary columns are not parsed
+    crime_data_monthly = read_crime_data(
+        crime_incidence_filepath,
+        columns_to_drop=columns_to_drop,
+        coordinate_dtype=coordinate_dtype,
     )
 
     ## remove rows columns that don't contain any latitude/longitude information
@@ -92,7 +123,89 @@ def _clean_monthly_crime_data(crime_incidence_filepath, columns_to_drop, crime_t
     crime_data_monthly = crime_data_monthly.loc[london_city_extent_mask]
     crime_data_monthly = crime_data_monthly.query(f"`Crime type` == '{crime_type}'")
 
-    return crime_data_monthly
+    ## drop the categories of the filtered out rows
+    categorical_columns = crime_data_monthly.select_dtypes("category").columns
+
+    return crime_data_monthly.assign(
+        **{
+            column: crime_data_monthly[column].cat.remove_unused_categories()
+            for column in categorical_columns
+        },
+    )
+
+
+def read_crime_data(path, columns=None, columns_to_drop=None, coordinate_dtype=None):
+    """Function to read police crime data with compact dtypes.
+
+    Parameters:
+    -----------
+    path: str or pathlib.Path
+        The filepath to the raw monthly or the cleaned crime data.
+    columns: list
+        The columns to read. If None, all columns are read.
+    columns_to_drop: list
+        The columns not to read.
+    coordinate_dtype: str
+        The dtype of the coordinates, e.g. "float32" to halve their memory at a
+        precision of about half a metre. If None, they are read as float64.
+
+    Returns:
+    --------
+    crime_data: pd.DataFrame
+        The crime data with the string columns of `CRIME_DATA_DTYPES` as
+        categoricals.
+
+    """
+    columns_to_drop = set(columns_to_drop or [])
+
+    def usecols(column):
+        if columns is not None and column not in columns:
+            return False
+        return column not in columns_to_drop
+
+    dtype = dict(CRIME_DATA_DTYPES)
+    if coordinate_dtype is not None:
+        dtype.update({"Longitude": coordinate_dtype, "Latitude": coordinate_dtype})
+
+    return pd.read_csv(path, usecols=usecols, dtype=dtype)
+
+
+def concat_crime_data(crime_data):
+    """Function to concatenate crime data keeping the categorical columns compact.
+
+    `pd.concat` falls back to object dtype for categoricals with different
+    categories, so the categories are unioned first.
+
+    Parameters:
+    -----------
+    crime_data: list
+        List of pd.DataFrame with the same columns. Empty frames without columns
+        are skipped.
+
+    Returns:
+    --------
+    crime_data: pd.DataFrame
+        The concatenated crime data with a new range index.
+
+    """
+    crime_data = [df for df in crime_data if len(df.columns)]
+    if not crime_data:
+        return pd.DataFrame()
+
+    columns = crime_data[0].columns
+    categorical_columns = crime_data[0].select_dtypes("category").columns
+
+    concatenated = pd.concat(
+        [df.drop(columns=categorical_columns) for df in crime_data],
+        ignore_index=True,
+    )
+    for column in categorical_columns:
+        concatenated[column] = union_categoricals(
+            [df[column] for df in crime_data],
+            sort_categories=True,
+        )
+
+    return concatenated[columns]
 
 
 def convert_points_df_to_gdf(
@@ -182,6 +295,122 @@ def clean_regional_burglary_data(
     return regional_cat_crime.reset_index()
 
 
+def convert_regional_crime_data_to_long(
+    csv_path,
+    output_path,
+    id_columns=(
+        "LSOA Code",
+        "LSOA Name",
+        "Borough",
+        "Major Category",
+        "Minor Category",
+    ),
+):
+    """Convert the wide regional crime table to a long Parquet file.
+
+    Every row of the output holds the count of one region, crime category and
+    month. The text columns are stored as categoricals and the file has one row
+    group per year and major category, so that `read_regional_crime_data` only
+    reads the slice it needs.
+
+    Parameters:
+    -----------
+    csv_path: str or pathlib.Path
+        The path to the wide table with one column per month, named YYYYMM.
+    output_path: str or pathlib.Path
+        The path to the Parquet file.
+    id_columns: tuple
+        The columns identifying the region and the crime category.
+
+    Returns:
+    --------
+    output_path: str or pathlib.Path
+        The path to the Parquet file.
+
+    """
+    id_columns = list(id_columns)
+    wide = pd.read_csv(csv_path, dtype={col: "category" for col in id_columns})
+    month_columns = [col for col in wide.columns if re.fullmatch(r"\d{6}", col)]
+
+    long = wide.melt(
+        id_vars=id_columns,
+        value_vars=month_columns,
+        var_name="month",
+        value_name="count",
+    )
+    period = long["month"].astype(np.int32)
+    long["year"] = (period // 100).astype(np.int16)
+    long["month"] = (period % 100).astype(np.int8)
+    long["count"] = long["count"].fillna(0).astype(np.int32)
+    long = long[[*id_columns, "year", "month", "count"]]
+
+    ## One row group per year and major category, their statistics let readers
+    ## skip every other slice.
+    schema = pa.Schema.from_pandas(long, preserve_index=False)
+    with pq.ParquetWriter(output_path, schema) as writer:
+        for _, group in long.groupby(["year", "Major Category"], observed=True):
+            writer.write_table(
+                pa.Table.from_pandas(group, schema=schema, preserve_index=False),
+            )
+
+    return output_path
+
+
+def read_regional_crime_data(
+    path,
+    crime_year="2019",
+    crime_major_category="Burglary",
+    ID_column_name="LSOA Code",
+    columns_to_keep=("LSOA Name", "Borough", "Major Category"),
+):
+    """Read the monthly and yearly crime counts of one year and major category.
+
+    Parameters:
+    -----------
+    path: str or pathlib.Path
+        The path to the Parquet file written by
+        `convert_regional_crime_data_to_long`.
+    crime_year: str
+        The year of the crime data.
+    crime_major_category: str
+        The major category of the crime data.
+    ID_column_name: str
+        The name of the column containing the ID of the regions.
+    columns_to_keep: tuple
+        The attribute columns of the regions to keep.
+
+    Returns:
+    --------
+    regional_cat_crime: pd.DataFrame
+        The crime counts per region summed over the minor categories, with one
+        column per month, named YYYYMM, and the yearly total.
+
+    """
+    columns_to_keep = list(columns_to_keep)
+    long = pd.read_parquet(
+        path,
+        columns=[ID_column_name, *columns_to_keep, "month", "count"],
+        filters=[
+            ("year", "==", int(crime_year)),
+            ("Major Category", "==", crime_major_category),
+        ],
+    )
+
+    long["month"] = crime_year + long["month"].map("{:02d}".format)
+    counts = (
+        long.groupby([ID_column_name, "month"], observed=True)["count"]
+        .sum()
+        .unstack(fill_value=0)
+    )
+    attributes = long.groupby(ID_column_name, observed=True)[columns_to_keep].first()
+
+    regional_cat_crime = attributes.astype(str).join(counts)
+    regional_cat_crime[f"{crime_year}_total"] = counts.sum(1)
+    regional_cat_crime.index = regional_cat_crime.index.astype(str)
+
+    return regional_cat_crime.reset_index()
+
+
 def convert_region_df_to_gdf(df, region_gdf, common_column_mapper, crs=None):
     """Function to convert a dataframe of regions to a geodataframe.
 
@@ -277,7 +506,7 @@ def aggregate_regional_level_data(
         )
 
     else:
-        agg_gdf = agg_gdf_groups.sum()
+        agg_gdf = agg_gdf_groups.sum(numeric_only=True)
 
     agg_gdf = agg_gdf.reset_index()
 
@@ -291,6 +520,66 @@ def aggregate_regional_level_data(
     return agg_gdf
 
 
+def read_imd_data(
+    path,
+    bbox=None,
+    where=None,
+    lsoa_codes=None,
+    columns=None,
+    ignore_geometry=False,
+    ID_column_name="lsoa11cd",
+):
+    """Function to read a subset of the national imd data.
+
+    The bounding box, attribute filter and column selection are applied while
+    reading, so rows and columns outside of them are never loaded.
+
+    Parameters:
+    -----------
+    path: str or pathlib.Path
+        The path to the imd shapefile.
+    bbox: tuple or gpd.GeoSeries or gpd.GeoDataFrame
+        Only rows intersecting the bounding box are read. A GeoSeries or
+        GeoDataFrame is reprojected to the CRS of the file and its total bounds
+        are used.
+    where: str
+        SQL WHERE clause on the attribute columns, e.g. "IMDScore > 40".
+    lsoa_codes: list-like
+        The codes of the LSOAs to keep. They are matched after the filtered read,
+        since a long IN clause is evaluated row by row and is slower than reading
+        the bounding box.
+    columns: list
+        The attribute columns to read, defaults to all columns.
+    ignore_geometry: bool
+        Whether to skip reading the geometries and return a pd.DataFrame.
+    ID_column_name: str
+        The name of the column containing the LSOA codes.
+
+    Returns:
+    --------
+    imd_data: gpd.GeoDataFrame or pd.DataFrame
+        The imd data of the selected LSOAs.
+
+    """
+    if columns is not None and lsoa_codes is not None:
+        columns = [ID_column_name, *[col for col in columns if col != ID_column_name]]
+
+    imd_data = gpd.read_file(
+        path,
+        bbox=bbox,
+        where=where,
+        columns=columns,
+        ignore_geometry=ignore_geometry,
+    )
+
+    if lsoa_codes is not None:
+        imd_data = imd_data[imd_data[ID_column_name].isin(lsoa_codes)].reset_index(
+            drop=True,
+        )
+
+    return imd_data
+
+
 def extract_lsoa_imd_data(imd_data, lsoa, columns_to_keep, ID_column_name="LSOA11CD"):
     """Function to extract the imd data for the lsoa.
 
@@ -319,17 +608,24 @@ def extract_lsoa_imd_data(imd_data, lsoa, columns_to_keep, ID_column_name="LSOA1
     return imd_lsoa
 
 
-def dissolve_gdf_polygons(gdf, dissolve_name, dissolve_key=None):
+def dissolve_gdf_polygons(gdf, dissolve_name, dissolve_key=None, method="unary"):
     """Function to dissolve polygons in a geodataframe.
 
     Parameters:
     -----------
     gdf: gpd.GeoDataFrame
-        The geodataframe containing the polygons.
+        The geodataframe containing the polygons. It is not modified.
     dissolve_name: str
         The name of the dissolved polygon.
     dissolve_key: str
-        The name of the column to use for dissolving.
+        The name of the column to use for dissolving. If None, all polygons are
+        dissolved into one.
+    method: str
+        The union algorithm, see `gpd.GeoDataFrame.dissolve`. Options are:
+        - "unary"
+        - "coverage": much faster for polygons forming a valid coverage, i.e.
+          sharing their edges without overlaps, such as administrative boundaries.
+          Falls back to "unary" if the polygons do not form a valid coverage.
 
     Returns:
     --------
@@ -338,10 +634,14 @@ def dissolve_gdf_polygons(gdf, dissolve_name, dissolve_key=None):
 
     """
     if dissolve_key is None:
+        dissolve_key = "dissolve_key"
+        gdf = gdf.assign(dissolve_key="dissolve")
 
-        gdf["dissolve_key"] = "dissolve"
+    if method == "coverage" and not shapely.coverage_is_valid(gdf.geometry.values):
+        logger.warning("Polygons do not form a valid coverage, using unary union.")
+        method = "unary"
 
-    gdf_dissolved = gdf.dissolve(by="dissolve_key")
+    gdf_dissolved = gdf.dissolve(by=dissolve_key, method=method)
     gdf_dissolved.loc[:, "NAME"] = dissolve_name
 
     return gdf_dissolved
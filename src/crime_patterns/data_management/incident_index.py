@@ -0,0 +1,325 @@
+"""Persisted index of the cleaned incidents for bounding box and month queries.
+
+The incidents are partitioned by month and sorted by the Morton (Z-order) key of
+their coordinates within every month. Each column is stored as a ``.npy`` file, so
+a query memory-maps the columns and only reads the row ranges whose keys overlap
+the bounding box.
+"""
+
+import json
+from pathlib import Path
+
+import numpy as np
+
+## pandas is imported by the functions using it, so the task modules read
+## `METADATA_FILE` without importing it.
+
+## Bits per axis of the Morton key, a grid of 65536 x 65536 cells.
+MORTON_BITS = 16
+
+## Maximum number of key ranges a bounding box is decomposed into.
+MAX_KEY_RANGES = 64
+
+METADATA_FILE = "index.json"
+
+
+def build_incident_index(
+    df,
+    index_dir,
+    x_column="Longitude",
+    y_column="Latitude",
+    month_column="Month",
+    columns=None,
+):
+    """Write the incidents to a month partitioned, Morton sorted index.
+
+    Parameters:
+    -----------
+    df: pandas.DataFrame
+        Incidents, e.g. the cleaned crime data.
+    index_dir: str or pathlib.Path
+        Directory the columns and the metadata are written to.
+    x_column, y_column: str
+        Names of the coordinate columns.
+    month_column: str
+        Name of the column the incidents are partitioned by.
+    columns: list
+        Columns to store, defaults to all columns except ``geometry``. String
+        columns are stored as categorical codes.
+
+    Returns:
+    --------
+    path: pathlib.Path
+        Path of the metadata file of the index.
+
+    """
+    import pandas as pd
+
+    index_dir = Path(index_dir)
+    index_dir.mkdir(parents=True, exist_ok=True)
+
+    if columns is None:
+        columns = [column for column in df.columns if column != "geometry"]
+    columns = list(dict.fromkeys([*columns, x_column, y_column, month_column]))
+
+    x = df[x_column].to_numpy(dtype=float)
+    y = df[y_column].to_numpy(dtype=float)
+    bounds = [float(x.min()), float(y.min()), float(x.max()), float(y.max())]
+    keys = morton_keys(*_quantize(x, y, bounds))
+
+    months = pd.Categorical(df[month_column].astype(str))
+    month_codes = months.codes.astype(np.int16)
+    order = np.lexsort((keys, month_codes))
+    month_offsets = np.searchsorted(
+        month_codes[order],
+        np.arange(len(months.categories) + 1),
+    )
+
+    categorical_columns = []
+    for column in columns:
+        values = df[column]
+        if not pd.api.types.is_numeric_dtype(values):
+            values = pd.Categorical(values)
+            np.save(
+                index_dir / f"{column}.categories.npy",
+                values.categories.to_numpy(dtype=str),
+            )
+            categorical_columns.append(column)
+            values = values.codes
+        np.save(index_dir / f"{column}.npy", np.asarray(values)[order])
+
+    np.save(index_dir / "_morton.npy", keys[order])
+    np.save(index_dir / "_row.npy", order.astype(np.int64))
+
+    metadata = {
+        "n_rows": len(df),
+        "bounds": bounds,
+        "x_column": x_column,
+        "y_column": y_column,
+        "month_column": month_column,
+        "columns": columns,
+        "categorical_columns": categorical_columns,
+        "months": months.categories.astype(str).tolist(),
+        "month_offsets": month_offsets.tolist(),
+    }
+    path = index_dir / METADATA_FILE
+    with open(path, "w") as stream:
+        json.dump(metadata, stream, indent=2)
+
+    return path
+
+
+def query_incident_index(
+    index_dir,
+    bbox=None,
+    months=None,
+    crime_types=None,
+    columns=None,
+    crime_type_column="Crime type",
+):
+    """Read the incidents within a bounding box, months and crime types.
+
+    Parameters:
+    -----------
+    index_dir: str or pathlib.Path
+        Directory of the index written by `build_incident_index`.
+    bbox: tuple
+        Bounding box (xmin, ymin, xmax, ymax) in the coordinates of the index,
+        defaults to all incidents.
+    months: list
+        Months to select, e.g. ["2019-01", "2019-02"], defaults to all months.
+    crime_types: list
+        Crime types to select, defaults to all crime types.
+    columns: list
+        Columns to read, defaults to all stored columns.
+    crime_type_column: str
+        Name of the crime type column.
+
+    Returns:
+    --------
+    df: pandas.DataFrame
+        Matching incidents indexed by their row in the indexed data frame and
+        sorted by it. String columns are categoricals of the categories occurring
+        in the selection.
+
+    """
+    import pandas as pd
+
+    index_dir = Path(index_dir)
+    with open(index_dir / METADATA_FILE) as stream:
+        metadata = json.load(stream)
+
+    columns = list(columns or metadata["columns"])
+    x_column, y_column = metadata["x_column"], metadata["y_column"]
+    offsets = metadata["month_offsets"]
+
+    ## Contiguous row range of every selected month.
+    selected_months = range(len(metadata["months"]))
+    if months is not None:
+        months = set(map(str, months))
+        selected_months = [
+            i for i, month in enumerate(metadata["months"]) if month in months
+        ]
+    month_ranges = [(offsets[i], offsets[i + 1]) for i in selected_months]
+
+    if bbox is None:
+        row_ranges = month_ranges
+    else:
+        keys = np.load(index_dir / "_morton.npy", mmap_mode="r")
+        key_ranges = _bbox_key_ranges(bbox, metadata["bounds"])
+        row_ranges = [
+            (start + lo, start + hi)
+            for start, stop in month_ranges
+            for lo, hi in zip(
+                np.searchsorted(keys[start:stop], key_ranges[:, 0], side="left"),
+                np.searchsorted(keys[start:stop], key_ranges[:, 1], side="right"),
+            )
+            if hi > lo
+        ]
+
+    rows = np.concatenate(
+        [np.arange(start, stop) for start, stop in row_ranges] or [np.empty(0, int)],
+    )
+
+    def read(column):
+        return np.load(index_dir / f"{column}.npy", mmap_mode="r")[rows]
+
+    ## Key ranges cover whole cells, keep only the incidents inside the box.
+    mask = np.ones(len(rows), dtype=bool)
+    if bbox is not None:
+        xmin, ymin, xmax, ymax = bbox
+        x, y = read(x_column), read(y_column)
+        mask &= (x >= xmin) & (x <= xmax) & (y >= ymin) & (y <= ymax)
+    if crime_types is not None:
+        categories = np.load(index_dir / f"{crime_type_column}.categories.npy")
+        type_codes = np.flatnonzero(np.isin(categories, list(crime_types)))
+        mask &= np.isin(read(crime_type_column), type_codes)
+    rows = rows[mask]
+
+    data = {}
+    for column in columns:
+        values = read(column)
+        if column in metadata["categorical_columns"]:
+            values = _decode_categories(index_dir, column, values)
+        data[column] = values
+
+    row_ids = np.load(index_dir / "_row.npy", mmap_mode="r")[rows]
+    df = pd.DataFrame(data, index=pd.Index(row_ids, name="row"))
+
+    return df.sort_index()
+
+
+def morton_keys(ix, iy):
+    """Interleave the bits of integer cell coordinates into Morton keys.
+
+    Parameters:
+    -----------
+    ix, iy: numpy.ndarray
+        Integer cell coordinates below ``2**MORTON_BITS``.
+
+    Returns:
+    --------
+    keys: numpy.ndarray
+        Morton keys as unsigned 64 bit integers, the bits of ``ix`` at the even
+        positions.
+
+    """
+    return _spread_bits(ix) | (_spread_bits(iy) << np.uint64(1))
+
+
+def _spread_bits(values):
+    """Insert a zero bit between the lower 32 bits of every value."""
+    values = np.asarray(values).astype(np.uint64) & np.uint64(0xFFFFFFFF)
+    for shift, mask in [
+        (16, 0x0000FFFF0000FFFF),
+        (8, 0x00FF00FF00FF00FF),
+        (4, 0x0F0F0F0F0F0F0F0F),
+        (2, 0x3333333333333333),
+        (1, 0x5555555555555555),
+    ]:
+        values = (values | (values << np.uint64(shift))) & np.uint64(mask)
+
+    return values
+
+
+def _quantize(x, y, bounds):
+    """Integer cell coordinates of points within the bounds of the index."""
+    xmin, ymin, xmax, ymax = bounds
+    n_cells = 2**MORTON_BITS
+
+    def to_cells(values, low, high):
+        scale = n_cells / (high - low) if high > low else 0.0
+        cells = np.floor((np.asarray(values, dtype=float) - low) * scale)
+        return np.clip(cells, 0, n_cells - 1).astype(np.int64)
+
+    return to_cells(x, xmin, xmax), to_cells(y, ymin, ymax)
+
+
+def _bbox_key_ranges(bbox, bounds, max_ranges=MAX_KEY_RANGES):
+    """Decompose a bounding box into sorted, merged ranges of Morton keys.
+
+    The quadtree of the key space is refined level by level. Cells inside the box
+    are emitted as a whole; once refining would exceed ``max_ranges`` cells, the
+    partially covered cells are emitted as a whole too.
+    """
+    (ix0, ix1), (iy0, iy1) = _quantize(bbox[0::2], bbox[1::2], bounds)
+
+    def overlaps(x, y, size):
+        return x <= ix1 and x + size > ix0 and y <= iy1 and y + size > iy0
+
+    def inside(x, y, size):
+        return x >= ix0 and x + size - 1 <= ix1 and y >= iy0 and y + size - 1 <= iy1
+
+    ranges = []
+    ## Partially covered cells of the current level as (x, y, size) in finest cells.
+    partial = [(0, 0, 2**MORTON_BITS)]
+
+    while partial:
+        children = []
+        for x, y, size in partial:
+            if inside(x, y, size) or size == 1:
+                ranges.append(_cell_key_range(x, y, size))
+            else:
+                half = size // 2
+                children += [
+                    (x + dx, y + dy, half)
+                    for dy in (0, half)
+                    for dx in (0, half)
+                    if overlaps(x + dx, y + dy, half)
+                ]
+
+        if len(ranges) + len(children) > max_ranges:
+            ranges += [_cell_key_range(*cell) for cell in children]
+            break
+        partial = children
+
+    ranges.sort()
+    merged = []
+    for start, stop in ranges:
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], stop)
+        else:
+            merged.append([start, stop])
+
+    return np.array(merged, dtype=np.uint64).reshape(-1, 2)
+
+
+def _cell_key_range(x, y, size):
+    """First and last Morton key of an aligned quadtree cell."""
+    start = int(morton_keys(np.array([x]), np.array([y]))[0])
+
+    return start, start + size * size - 1
+
+
+def _decode_categories(index_dir, column, codes):
+    """Categorical of the codes, reading only the categories which occur."""
+    import pandas as pd
+
+    used, codes = np.unique(codes, return_inverse=True)
+    categories = np.load(index_dir / f"{column}.categories.npy", mmap_mode="r")
+
+    ## Missing values have the code -1, which sorts first.
+    if len(used) and used[0] == -1:
+        return pd.Categorical.from_codes(codes - 1, categories=categories[used[1:]])
+
+    return pd.Categorical.from_codes(codes, categories=categories[used])
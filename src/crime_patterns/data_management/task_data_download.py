@@ -4,7 +4,6 @@ import logging
 import os
 import shutil
 
-import numpy as np
 import pytask
 
 import crime_patterns.config as config
@@ -18,16 +17,17 @@ data_raw = src / "data"
 data_clean = bld / "python" / "data"
 downloads_dir = src / "data" / "downloads"
 
-data_info = utils.read_yaml(src / "data_management" / "data_info.yaml")
-year = data_info["crime_year"]
+data_info = config.read_data_info()
+years = data_info["crime_years"]
 
-months = ["%.2d" % i for i in np.arange(1, 13, 1)]
+months = ["%.2d" % i for i in range(1, 13)]
 crime_data_filepaths_london_police = {
     f"{year}-{month}-london": os.path.join(
         data_raw / data_info["data_raw_dirs"]["uk_crime_data_2019"],
         f"{year}-{month}",
         f"{year}-{month}-city-of-london-street.csv",
     )
+    for year in years
     for month in months
 }
 
@@ -37,6 +37,7 @@ crime_data_filepaths_metropoliton_police = {
         f"{year}-{month}",
         f"{year}-{month}-metropolitan-street.csv",
     )
+    for year in years
     for month in months
 }
 crime_data_filepaths = (
@@ -122,10 +123,10 @@ def task_data_unzip(depends_on, produces):
         if key == "uk_crime_data_2019":
             # Selective extraction is performed
             # to avoid extraction of crime data
-            # from other years (2017 and 2018)
-            # that is also available in the downloaded archive.
+            # from years that are not processed
+            # but also available in the downloaded archive.
             subset = True
-            startswith = data_info["crime_year"]
+            startswith = tuple(years)
 
         else:
             subset = False
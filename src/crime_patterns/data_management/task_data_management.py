@@ -2,196 +2,302 @@
 #%%
 import os
 
-import geopandas as gpd
-import numpy as np
-import pandas as pd
 import pytask
 
 import crime_patterns.config as config
 import crime_patterns.data_management as dm
-import crime_patterns.utilities as utils
+from crime_patterns.data_management import boundaries, incident_index
+from crime_patterns.instrumentation import instrument, track
 
 src = config.SRC
 bld = config.BLD
 data_raw = src / "data"
 data_clean = bld / "python" / "data"
 
-data_info = utils.read_yaml(src / "data_management" / "data_info.yaml")
-year = data_info["crime_year"]
+data_info = config.read_data_info()
+years = data_info["crime_years"]
 
-months = ["%.2d" % i for i in np.arange(1, 13, 1)]
-crime_data_filepaths_london_police = {
-    f"{year}-{month}-london": os.path.join(
-        data_raw / data_info["data_raw_dirs"]["uk_crime_data_2019"],
-        f"{year}-{month}",
-        f"{year}-{month}-city-of-london-street.csv",
-    )
-    for month in months
-}
+shapefiles_dir = (
+    data_raw
+    / data_info["data_raw_dirs"]["statistical_gis_boundaries_london"]
+    / data_info["data_raw_dirs"]["statistical_gis_boundaries_london"]
+    / "ESRI"
+)
+
+months = ["%.2d" % i for i in range(1, 13)]
+crime_data_filepaths = {}
+for year in years:
+    crime_data_filepaths_london_police = {
+        f"{year}-{month}-london": os.path.join(
+            data_raw / data_info["data_raw_dirs"]["uk_crime_data_2019"],
+            f"{year}-{month}",
+            f"{year}-{month}-city-of-london-street.csv",
+        )
+        for month in months
+    }
 
-crime_data_filepaths_metropoliton_police = {
-    f"{year}-{month}-metropoliton": os.path.join(
-        data_raw / data_info["data_raw_dirs"]["uk_crime_data_2019"],
-        f"{year}-{month}",
-        f"{year}-{month}-metropolitan-street.csv",
+    crime_data_filepaths_metropoliton_police = {
+        f"{year}-{month}-metropoliton": os.path.join(
+            data_raw / data_info["data_raw_dirs"]["uk_crime_data_2019"],
+            f"{year}-{month}",
+            f"{year}-{month}-metropolitan-street.csv",
+        )
+        for month in months
+    }
+    crime_data_filepaths[year] = (
+        crime_data_filepaths_london_police | crime_data_filepaths_metropoliton_police
     )
-    for month in months
+
+## Boundary layers cached by `task_cache_boundaries`, in the project CRS.
+boundary_paths = {
+    name: boundaries.boundary_cache_path(name, config.CRS)
+    for name in boundaries.BOUNDARY_FILES
 }
-crime_data_filepaths = (
-    crime_data_filepaths_london_police | crime_data_filepaths_metropoliton_police
-)
 
 #%%
 @pytask.mark.depends_on(
     {
-        "scripts": ["clean_data.py"],
-        "data_info": src / "data_management" / "data_info.yaml",
-        "london_ward_shp": data_raw
-        / data_info["data_raw_dirs"]["statistical_gis_boundaries_london"]
-        / data_info["data_raw_dirs"]["statistical_gis_boundaries_london"]
-        / "ESRI"
-        / "London_Ward.shp",
-        "crime_data_filepaths": crime_data_filepaths,
+        "scripts": ["boundaries.py"],
+        "shapefiles": {
+            name: shapefiles_dir / filename
+            for name, filename in boundaries.BOUNDARY_FILES.items()
+        },
     },
 )
 @pytask.mark.produces(
     {
-        "greater_london_area": data_clean / "Greater_London_Area.shp",
-        "cleaned_shp": data_clean / "city-of-london-burglaries-2019-cleaned.shp",
-        "cleaned_csv": data_clean / "city-of-london-burglaries-2019-cleaned.csv",
+        f"{name}_{crs}_{tolerance}": path
+        for name in boundaries.BOUNDARY_FILES
+        for crs in boundaries.CACHE_CRS
+        for tolerance, path in boundaries.lod_cache_paths(name, crs).items()
     },
 )
-def task_clean_crime_incidences_data(depends_on, produces):
-    """Clean and combine monthly crime incidences data to yearly datafile."""
-    crime_data_monthly = [
-        dm.clean_monthly_crime_data(
-            crime_incidence_filepath=depends_on["crime_data_filepaths"][key],
-            year=key.split("-")[0],
-            month=key.split("-")[1],
-            crime_type=data_info["crime_type"],
-            columns_to_drop=data_info["uk_crime_data_2019_columns_to_drop"],
+@instrument
+def task_cache_boundaries(depends_on, produces):
+    """Cache the boundary layers pre-projected in every CRS and level of detail."""
+    boundaries.cache_boundaries(shapefiles_dir)
+
+
+@pytask.mark.depends_on(
+    {
+        "scripts": ["clean_data.py", "boundaries.py"],
+        "london_ward": boundary_paths["ward"],
+    },
+)
+@pytask.mark.produces(data_clean / "Greater_London_Area.shp")
+@instrument
+def task_create_greater_london_area(depends_on, produces):
+    """Dissolve the London wards into one polygon shared by all years."""
+    ## Dissolved once per version of the ward boundaries and cached
+    with track("load_outline"):
+        london_ward_dissolved = boundaries.load_outline(
+            "ward",
+            dissolve_name="Greater London Area",
+            crs=config.CRS,
         )
-        for key in depends_on["crime_data_filepaths"]
-    ]
-    crime_data_yearly = pd.concat(crime_data_monthly)
 
-    ## Drop duplicate points
-    crime_data_yearly = crime_data_yearly.drop_duplicates(
-        subset=["Longitude", "Latitude"],
-        keep="first",
-    )
+    london_ward_dissolved.to_file(filename=produces)
 
-    crime_data_yearly_gdf = dm.convert_points_df_to_gdf(df=crime_data_yearly).to_crs(
-        config.CRS,
-    )
 
-    ## Dissolve the London wards into one polygon
-    london_wards = gpd.read_file(depends_on["london_ward_shp"]).to_crs(config.CRS)
-    london_ward_dissolved = dm.dissolve_gdf_polygons(
-        gdf=london_wards,
-        dissolve_name="Greater London Area",
-    )
+for year in years:
 
-    ## Filter points that are within Greater London Area only
-    crime_data_yearly_gdf = gpd.sjoin(
-        crime_data_yearly_gdf,
-        london_ward_dissolved,
-        how="inner",
+    @pytask.mark.depends_on(
+        {
+            "scripts": ["clean_data.py"],
+            "data_info": src / "data_management" / "data_info.yaml",
+            "greater_london_area": data_clean / "Greater_London_Area.shp",
+            "crime_data_filepaths": crime_data_filepaths[year],
+        },
+    )
+    @pytask.mark.produces(
+        {
+            "cleaned_shp": data_clean / f"city-of-london-burglaries-{year}-cleaned.shp",
+            "cleaned_csv": data_clean / f"city-of-london-burglaries-{year}-cleaned.csv",
+        },
     )
+    @pytask.mark.task(id=year, kwargs={"year": year})
+    @instrument(name=f"task_clean_crime_incidences_data[{year}]")
+    def task_clean_crime_incidences_data(depends_on, produces, year):
+        """Clean and combine monthly crime incidences data to yearly datafile."""
+        import geopandas as gpd
+
+        with track("clean_monthly_crime_data") as record:
+            crime_data_monthly = [
+                dm.clean_monthly_crime_data(
+                    crime_incidence_filepath=depends_on["crime_data_filepaths"][key],
+                    year=year,
+                    month=key.split("-")[1],
+                    crime_type=data_info["crime_type"],
+                    columns_to_drop=data_info["uk_crime_data_2019_columns_to_drop"],
+                )
+                for key in depends_on["crime_data_filepaths"]
+            ]
+            crime_data_yearly = dm.concat_crime_data(crime_data_monthly)
+            record["rows"] = len(crime_data_yearly)
+
+        ## Drop duplicate points
+        crime_data_yearly = crime_data_yearly.drop_duplicates(
+            subset=["Longitude", "Latitude"],
+            keep="first",
+        )
+
+        with track("convert_points_df_to_gdf", rows=len(crime_data_yearly)):
+            crime_data_yearly_gdf = dm.convert_points_df_to_gdf(
+                df=crime_data_yearly,
+            ).to_crs(config.CRS)
+
+        london_ward_dissolved = gpd.read_file(depends_on["greater_london_area"])
+
+        ## Filter points that are within Greater London Area only
+        with track("sjoin", rows=len(crime_data_yearly_gdf)):
+            crime_data_yearly_gdf = gpd.sjoin(
+                crime_data_yearly_gdf,
+                london_ward_dissolved,
+                how="inner",
+            )
 
-    # Save the data
-    london_ward_dissolved.to_file(filename=produces["greater_london_area"])
-    crime_data_yearly_gdf.to_file(filename=produces["cleaned_shp"])
-    crime_data_yearly_gdf.to_csv(produces["cleaned_csv"], index=False)
+        # Save the data
+        crime_data_yearly_gdf.to_file(filename=produces["cleaned_shp"])
+        crime_data_yearly_gdf.to_csv(produces["cleaned_csv"], index=False)
+
+
+for year in years:
+
+    @pytask.mark.depends_on(
+        {
+            "scripts": ["incident_index.py"],
+            "cleaned_csv": data_clean / f"city-of-london-burglaries-{year}-cleaned.csv",
+        },
+    )
+    @pytask.mark.produces(
+        data_clean / "incident_index" / year / incident_index.METADATA_FILE,
+    )
+    @pytask.mark.task(id=year)
+    @instrument(name=f"task_build_incident_index[{year}]")
+    def task_build_incident_index(depends_on, produces):
+        """Index the cleaned incidents by month and Morton key of their location."""
+        crime_incidences = dm.read_crime_data(depends_on["cleaned_csv"])
+        incident_index.build_incident_index(crime_incidences, produces.parent)
 
 
 # %%
 @pytask.mark.depends_on(
     {
         "scripts": ["clean_data.py"],
-        "data_info": src / "data_management" / "data_info.yaml",
-        "london_lsoa_shp": data_raw
-        / data_info["data_raw_dirs"]["statistical_gis_boundaries_london"]
-        / data_info["data_raw_dirs"]["statistical_gis_boundaries_london"]
-        / "ESRI"
-        / "LSOA_2011_London_gen_MHW.shp",
-        "london_ward_shp": data_raw
-        / data_info["data_raw_dirs"]["statistical_gis_boundaries_london"]
-        / data_info["data_raw_dirs"]["statistical_gis_boundaries_london"]
-        / "ESRI"
-        / "London_Ward.shp",
         "lsoa_crime_data": data_raw
         / data_info["data_raw_dirs"]["lsoa_level_crime"]
         / "MPS LSOA Level Crime (Historical).csv",
     },
 )
-@pytask.mark.produces(
-    {
-        "lsoa_crime_data_cleaned": data_clean / "MPS_LSOA_Level_burglary_2019.shp",
-        "ward_crime_data_cleaned": data_clean / "MPS_Ward_Level_burglary_2019.shp",
-    },
-)
-def task_prepare_ward_level_crime_data(depends_on, produces):
-    """Prepare ward level crime data from LSOA level crime data."""
-    common_column_mapper = {"df": "LSOA Code", "gdf": "LSOA11CD"}
+@pytask.mark.produces(data_clean / "MPS_LSOA_Level_Crime_long.parquet")
+@instrument
+def task_convert_lsoa_crime_data(depends_on, produces):
+    """Convert the wide LSOA level crime table once to a long Parquet file."""
+    dm.convert_regional_crime_data_to_long(depends_on["lsoa_crime_data"], produces)
 
-    ## load
-    london_lsoa = gpd.read_file(depends_on["london_lsoa_shp"])
-    london_wards = gpd.read_file(depends_on["london_ward_shp"])
-    lsoa_crime_data = pd.read_csv(depends_on["lsoa_crime_data"])
-
-    mps_lsoa_burglary_2019 = dm.clean_regional_burglary_data(
-        df=lsoa_crime_data,
-        columns_to_keep=[
-            "LSOA Code",
-            "LSOA Name",
-            "Borough",
-            "Major Category",
-            "Minor Category",
-        ],
-        ID_column_name="LSOA Code",
-        crime_year="2019",
-        crime_major_category="Burglary",
-    )
 
-    mps_lsoa_burglary_2019_gdf = dm.convert_region_df_to_gdf(
-        region_gdf=london_lsoa,
-        df=mps_lsoa_burglary_2019,
-        common_column_mapper=common_column_mapper,
-    )
+for year in years:
 
-    mps_ward_burglary_2019_gdf = dm.aggregate_regional_level_data(
-        lower_level_gdf=mps_lsoa_burglary_2019_gdf,
-        upper_level_gdf=london_wards,
-        ID_column_name="GSS_CODE",
-        crs=config.CRS,
+    @pytask.mark.depends_on(
+        {
+            "scripts": ["clean_data.py"],
+            "data_info": src / "data_management" / "data_info.yaml",
+            "london_lsoa": boundary_paths["lsoa"],
+            "london_ward": boundary_paths["ward"],
+            "lsoa_crime_data": data_clean / "MPS_LSOA_Level_Crime_long.parquet",
+        },
+    )
+    @pytask.mark.produces(
+        {
+            "lsoa_crime_data_cleaned": data_clean
+            / f"MPS_LSOA_Level_burglary_{year}.shp",
+            "ward_crime_data_cleaned": data_clean
+            / f"MPS_Ward_Level_burglary_{year}.shp",
+        },
     )
+    @pytask.mark.task(id=year, kwargs={"year": year})
+    def task_prepare_ward_level_crime_data(depends_on, produces, year):
+        """Prepare ward level crime data from LSOA level crime data."""
+        common_column_mapper = {"df": "LSOA Code", "gdf": "LSOA11CD"}
 
-    # Save to disk
-    mps_lsoa_burglary_2019_gdf.to_file(produces["lsoa_crime_data_cleaned"])
-    mps_ward_burglary_2019_gdf.to_file(produces["ward_crime_data_cleaned"])
+        ## load
+        london_lsoa = boundaries.load_boundary("lsoa", config.CRS)
+        london_wards = boundaries.load_boundary("ward", config.CRS)
+
+        ## Only the row groups of the year and category are read
+        mps_lsoa_burglary = dm.read_regional_crime_data(
+            depends_on["lsoa_crime_data"],
+            crime_year=year,
+            crime_major_category="Burglary",
+            ID_column_name="LSOA Code",
+        )
+
+        mps_lsoa_burglary_gdf = dm.convert_region_df_to_gdf(
+            region_gdf=london_lsoa,
+            df=mps_lsoa_burglary,
+            common_column_mapper=common_column_mapper,
+        )
+
+        mps_ward_burglary_gdf = dm.aggregate_regional_level_data(
+            lower_level_gdf=mps_lsoa_burglary_gdf,
+            upper_level_gdf=london_wards,
+            ID_column_name="GSS_CODE",
+            crs=config.CRS,
+        )
+
+        # Save to disk
+        mps_lsoa_burglary_gdf.to_file(produces["lsoa_crime_data_cleaned"])
+        mps_ward_burglary_gdf.to_file(produces["ward_crime_data_cleaned"])
 
 
 # %%
 @pytask.mark.depends_on(
     {
         "scripts": ["clean_data.py"],
-        "data_info": src / "data_management" / "data_info.yaml",
-        "london_lsoa_shp": data_raw
-        / data_info["data_raw_dirs"]["statistical_gis_boundaries_london"]
-        / data_info["data_raw_dirs"]["statistical_gis_boundaries_london"]
-        / "ESRI"
-        / "LSOA_2011_London_gen_MHW.shp",
-        "london_ward_shp": data_raw
-        / data_info["data_raw_dirs"]["statistical_gis_boundaries_london"]
-        / data_info["data_raw_dirs"]["statistical_gis_boundaries_london"]
-        / "ESRI"
-        / "London_Ward.shp",
+        "london_lsoa": boundary_paths["lsoa"],
         "lsoa_uk_imd_shp": data_raw
         / data_info["data_raw_dirs"]["imd_lsoa_shp"]
         / "IMD_2019.shp",
     },
 )
+@pytask.mark.produces(data_clean / "IMD_LSOA_2019_London.parquet")
+@instrument
+def task_extract_london_imd_data(depends_on, produces):
+    """Cache the national IMD data within the bounding box of London.
+
+    Only the LSOAs intersecting the bounding box are read. The subset also keeps
+    the LSOAs just outside London, since they are joined to the border wards when
+    aggregating the population.
+
+    """
+    london_lsoa = boundaries.load_boundary("lsoa", config.CRS)
+
+    with track("read_imd_data") as record:
+        imd_london = dm.read_imd_data(
+            depends_on["lsoa_uk_imd_shp"],
+            bbox=london_lsoa.geometry,
+        )
+        record["rows"] = len(imd_london)
+
+    score_col_names = list(
+        imd_london.columns[imd_london.columns.str.contains("Score")],
+    )
+    imd_london = imd_london[
+        ["lsoa11cd", "lsoa11nm", "TotPop", *score_col_names, "geometry"]
+    ]
+
+    imd_london.to_parquet(produces)
+
+
+@pytask.mark.depends_on(
+    {
+        "scripts": ["clean_data.py"],
+        "data_info": src / "data_management" / "data_info.yaml",
+        "london_lsoa": boundary_paths["lsoa"],
+        "london_ward": boundary_paths["ward"],
+        "imd_london": data_clean / "IMD_LSOA_2019_London.parquet",
+    },
+)
 @pytask.mark.produces(
     {
         "lsoa_imd_data_cleaned": data_clean / "IMD_LSOA_2019.shp",
@@ -199,15 +305,20 @@ def task_prepare_ward_level_crime_data(depends_on, produces):
         "ward_pop_data_cleaned": data_clean / "Population_Ward_2019.shp",
     },
 )
+@instrument
 def task_prepare_ward_level_IMD_data(depends_on, produces):
     """Prepare ward level IMD data from LSOA level IMD data."""
+    import geopandas as gpd
+
     ## load
-    london_lsoa = gpd.read_file(depends_on["london_lsoa_shp"])
-    london_wards = gpd.read_file(depends_on["london_ward_shp"])
-    imd_uk_lsoa = gpd.read_file(depends_on["lsoa_uk_imd_shp"])
+    with track("read_file") as record:
+        london_lsoa = boundaries.load_boundary("lsoa", config.CRS)
+        london_wards = boundaries.load_boundary("ward", config.CRS)
+        imd_london = gpd.read_parquet(depends_on["imd_london"])
+        record["rows"] = len(imd_london)
 
     score_col_names = list(
-        imd_uk_lsoa.columns[imd_uk_lsoa.columns.str.contains("Score")],
+        imd_london.columns[imd_london.columns.str.contains("Score")],
     )
     columns_to_keep = [
         "lsoa11cd",
@@ -217,27 +328,30 @@ def task_prepare_ward_level_IMD_data(depends_on, produces):
         *list(score_col_names),
     ]
 
-    imd_london_lsoa_2019 = dm.extract_lsoa_imd_data(
-        imd_data=imd_uk_lsoa,
-        lsoa=london_lsoa,
-        columns_to_keep=columns_to_keep,
-        ID_column_name="LSOA11CD",
-    )
+    with track("extract_lsoa_imd_data", rows=len(imd_london)):
+        imd_london_lsoa_2019 = dm.extract_lsoa_imd_data(
+            imd_data=imd_london,
+            lsoa=london_lsoa,
+            columns_to_keep=columns_to_keep,
+            ID_column_name="LSOA11CD",
+        )
 
-    imd_london_ward_2019 = dm.aggregate_regional_level_data(
-        lower_level_gdf=imd_london_lsoa_2019,
-        upper_level_gdf=london_wards,
-        ID_column_name="GSS_CODE",
-        crs=config.CRS,
-        weights_dict={"values_col": score_col_names, "weights_col": "TotPop"},
-    )
+    with track("aggregate_regional_level_data_imd", rows=len(imd_london_lsoa_2019)):
+        imd_london_ward_2019 = dm.aggregate_regional_level_data(
+            lower_level_gdf=imd_london_lsoa_2019,
+            upper_level_gdf=london_wards,
+            ID_column_name="GSS_CODE",
+            crs=config.CRS,
+            weights_dict={"values_col": score_col_names, "weights_col": "TotPop"},
+        )
 
-    pop_london_ward_2019 = dm.aggregate_regional_level_data(
-        lower_level_gdf=imd_uk_lsoa,
-        upper_level_gdf=london_wards,
-        ID_column_name="GSS_CODE",
-        crs=config.CRS,
-    )[["GSS_CODE", "TotPop", "geometry"]]
+    with track("aggregate_regional_level_data_pop", rows=len(imd_london)):
+        pop_london_ward_2019 = dm.aggregate_regional_level_data(
+            lower_level_gdf=imd_london[["lsoa11cd", "TotPop", "geometry"]],
+            upper_level_gdf=london_wards,
+            ID_column_name="GSS_CODE",
+            crs=config.CRS,
+        )[["GSS_CODE", "TotPop", "geometry"]]
 
     # Save to disk
     imd_london_lsoa_2019.to_file(produces["lsoa_imd_data_cleaned"])
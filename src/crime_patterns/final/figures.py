@@ -0,0 +1,144 @@
+"""Builders of the figures rendered by `rendering.render_figures`.
+
+Every builder is called as ``builder(base_layers, inputs, **params)``, loads its own
+data from the paths in ``inputs`` and returns the figure.
+"""
+import geopandas as gpd
+import matplotlib.pyplot as plt
+
+import crime_patterns.config as config
+import crime_patterns.data_management as dm
+import crime_patterns.utilities as utils
+from crime_patterns.analysis import point_patterns
+from crime_patterns.final import plotting
+from crime_patterns.final.rendering import get_base_layer
+
+
+def burglary_incidents(base_layers, inputs, title, figsize=(8, 6), dpi=300):
+    """Plot all crime incidences on top of the borough boundaries."""
+    crime_incidences = dm.read_crime_data(
+        inputs["crime_incidences"],
+        columns=["Longitude", "Latitude"],
+    )
+
+    fig, ax = plotting.plot_crime_incidents(
+        crime_incidences["Longitude"],
+        crime_incidences["Latitude"],
+        get_base_layer(base_layers, "london_borough", "EPSG:4326", figsize, dpi),
+        figsize=figsize,
+        dpi=dpi,
+    )
+    plt.suptitle(title)
+
+    return fig
+
+
+def burglary_hotspots(base_layers, inputs, title, figsize=(8, 6), dpi=300):
+    """Plot the kernel density estimates on top of the borough boundaries."""
+    with point_patterns.open_hotspots(inputs["densities"]) as densities:
+        X_coords, Y_coords, densities = (
+            densities["lon"].to_numpy(),
+            densities["lat"].to_numpy(),
+            densities["densities"].to_numpy(),
+        )
+
+    fig, ax, cbar = plotting.plot_hotspots(
+        X_coords,
+        Y_coords,
+        densities,
+        get_base_layer(base_layers, "london_borough", "EPSG:4326", figsize, dpi),
+        figsize=figsize,
+    )
+
+    cbar.ax.get_yaxis().labelpad = 15
+    cbar.ax.set_ylabel("Density (KDE)", rotation=270)
+
+    plt.suptitle(title)
+
+    return fig
+
+
+def burglary_clusters(base_layers, inputs, title, figsize=(8, 6), dpi=300):
+    """Plot the DBSCAN clusters on top of the borough boundaries."""
+    crime_incidences = dm.read_crime_data(
+        inputs["crime_incidences"],
+        columns=["Longitude", "Latitude"],
+    )
+    dbscan_clusters = utils.load_object_from_pickle(inputs["dbscan_clusters"])
+
+    fig, ax = plotting.plot_dbscan_clusters(
+        crime_incidences,
+        dbscan_clusters.labels_,
+        get_base_layer(base_layers, "london_borough", "EPSG:4326", figsize, dpi),
+        figsize=figsize,
+        dpi=dpi,
+    )
+
+    ax.legend(bbox_to_anchor=(0, 0.5))
+    plt.suptitle(title)
+
+    return fig
+
+
+def choropleth_with_boroughs(
+    base_layers,
+    inputs,
+    column_name,
+    title,
+    choropleth_kwds=None,
+    figsize=(8, 6),
+    dpi=300,
+):
+    """Plot a choropleth map of ``inputs["region"]`` with the borough boundaries."""
+    region = gpd.read_file(inputs["region"])
+
+    fig, ax = plotting.plot_choropleth_map(
+        region=region,
+        column_name=column_name,
+        figsize=figsize,
+        choropleth_kwds=choropleth_kwds,
+        dpi=dpi,
+    )
+
+    boroughs = get_base_layer(base_layers, "london_borough", region.crs, figsize, dpi)
+    boroughs.plot(ax=ax, fc="None")
+
+    ax.set_title(title)
+    ax.set_axis_off()
+
+    return fig
+
+
+def moran_scatter(base_layers, inputs, xlabel, ylabel):
+    """Plot the Moran scatter plot."""
+    moran = utils.load_object_from_pickle(inputs["moran"])
+
+    fig, ax = plotting.plot_moran_scatter(moran)
+
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
+
+    return fig
+
+
+def moran_distribution(base_layers, inputs):
+    """Plot the reference distribution of Moran's I."""
+    moran = utils.load_object_from_pickle(inputs["moran"])
+
+    fig, ax = plotting.plot_moran_distribution(moran)
+
+    return fig
+
+
+def weights_matrix(base_layers, inputs, figsize=(8, 6), dpi=300):
+    """Plot the spatial weights matrix on top of the ward boundaries."""
+    w = utils.load_object_from_pickle(inputs["weights_matrix"])
+    wards = get_base_layer(base_layers, "london_ward", config.CRS, figsize, dpi)
+
+    fig, ax = plotting.plot_weights_matrix(
+        wards.set_index("GSS_CODE"),
+        w,
+        figsize=figsize,
+    )
+
+    return fig
@@ -1,11 +1,32 @@
 """Functions plotting results."""
+from itertools import cycle
+
 import matplotlib.pyplot as plt
 import numpy as np
 import seaborn as sns
-from cycler import cycler
+from matplotlib.collections import LineCollection
+from matplotlib.colors import LinearSegmentedColormap, LogNorm, to_rgba_array
 from pysal.lib import weights
 from spreg import OLS
 
+from crime_patterns.data_management import boundaries
+
+## Number of points above which points are binned to pixels instead of scattered.
+RASTER_POINT_THRESHOLD = 100_000
+
+
+def _reproject(region, crs):
+    """Reproject the region only if it is not already in ``crs``.
+
+    Base layers are usually projected once up front (see `rendering`), so plotting
+    them must not pay for another reprojection and copy.
+
+    """
+    if region.crs == crs:
+        return region
+
+    return region.to_crs(crs)
+
 
 def plot_hotspots(
     X_coords,
@@ -20,11 +41,13 @@ def plot_hotspots(
     Parameters:
     -----------
     X_coords: numpy.ndarray
-        Array containing the X coordinates of the hotspots.
+        Array containing the X coordinates of the hotspots, either as a 2-D mesh or as
+        the 1-D grid axis.
     Y_coords: numpy.ndarray
-        Array containing the Y coordinates of the hotspots.
+        Array containing the Y coordinates of the hotspots, either as a 2-D mesh or as
+        the 1-D grid axis.
     densities: numpy.ndarray
-        Array containing the densities of the hotspots.
+        Array containing the densities of the hotspots, indexed as (x, y).
     region: geopandas.GeoDataFrame
         GeoDataFrame containing the region to be plotted.
     crs: str
@@ -42,21 +65,98 @@ def plot_hotspots(
         Colorbar of the plot.
 
     """
+    if np.ndim(X_coords) == 1:
+        X_coords, Y_coords = np.meshgrid(X_coords, Y_coords, indexing="ij")
+
     fig, ax = plt.subplots(figsize=figsize)
 
     contours = plt.contourf(X_coords, Y_coords, densities, 7, cmap="Reds")
     cbar = plt.colorbar(contours)
 
-    region.to_crs(crs).plot(ax=ax, fc="None")
+    _reproject(region, crs).plot(ax=ax, fc="None")
 
     plt.axis(False)
 
     return fig, ax, cbar
 
 
-def plot_crime_incidents(X_coords, Y_coords, region, crs="EPSG:4326", figsize=(8, 6)):
+def bin_points_to_pixels(X_coords, Y_coords, extent, shape, labels=None):
+    """Count points per pixel of a regular grid, optionally per label.
+
+    Parameters:
+    -----------
+    X_coords: numpy.ndarray
+        Array containing the X coordinates of the points.
+    Y_coords: numpy.ndarray
+        Array containing the Y coordinates of the points.
+    extent: tuple
+        Extent (xmin, xmax, ymin, ymax) of the grid.
+    shape: tuple
+        Number of pixels (rows, columns) of the grid.
+    labels: numpy.ndarray
+        Array containing the integer code of each point in ``range(n_labels)``. If
+        None, all points are counted together.
+
+    Returns:
+    --------
+    counts: numpy.ndarray
+        Array of shape (rows, columns), or (n_labels, rows, columns) if labels are
+        given, containing the number of points per pixel. Row 0 is the bottom row.
+
+    """
+    xmin, xmax, ymin, ymax = extent
+    n_rows, n_cols = shape
+    X_coords = np.asarray(X_coords, dtype=float)
+    Y_coords = np.asarray(Y_coords, dtype=float)
+
+    cols = ((X_coords - xmin) / (xmax - xmin) * n_cols).astype(np.int64)
+    rows = ((Y_coords - ymin) / (ymax - ymin) * n_rows).astype(np.int64)
+    np.clip(cols, 0, n_cols - 1, out=cols)
+    np.clip(rows, 0, n_rows - 1, out=rows)
+
+    pixels = rows * n_cols + cols
+
+    if labels is None:
+        return np.bincount(pixels, minlength=n_rows * n_cols).reshape(shape)
+
+    labels = np.asarray(labels, dtype=np.int64)
+    n_labels = labels.max() + 1 if labels.size else 0
+    counts = np.bincount(
+        labels * n_rows * n_cols + pixels,
+        minlength=n_labels * n_rows * n_cols,
+    )
+
+    return counts.reshape(n_labels, n_rows, n_cols)
+
+
+def _raster_shape(X_coords, Y_coords, figsize, dpi):
+    """Extent of the points and pixel grid matching the figure resolution."""
+    extent = (
+        np.min(X_coords),
+        np.max(X_coords),
+        np.min(Y_coords),
+        np.max(Y_coords),
+    )
+    shape = (int(figsize[1] * dpi), int(figsize[0] * dpi))
+
+    return extent, shape
+
+
+def plot_crime_incidents(
+    X_coords,
+    Y_coords,
+    region,
+    crs="EPSG:4326",
+    figsize=(8, 6),
+    raster_threshold=RASTER_POINT_THRESHOLD,
+    dpi=300,
+):
     """Plot crime incidents.
 
+    Above ``raster_threshold`` points the incidents are binned to the pixel grid of
+    the saved figure and drawn as a single image, with the colour encoding the
+    number of incidents per pixel.
+
     Parameters:
     -----------
     X_coords: numpy.ndarray
@@ -69,6 +169,10 @@ def plot_crime_incidents(X_coords, Y_coords, region, crs="EPSG:4326", figsize=(8
         Coordinate reference system of the region.
     figsize: tuple
         Size of the figure.
+    raster_threshold: int
+        Number of points above which the raster mode is used. None disables it.
+    dpi: int
+        Resolution the figure is saved with, used to size the pixel grid.
 
     Returns:
     --------
@@ -80,17 +184,56 @@ def plot_crime_incidents(X_coords, Y_coords, region, crs="EPSG:4326", figsize=(8
     """
     fig, ax = plt.subplots(figsize=figsize)
 
-    ax.scatter(X_coords, Y_coords, s=5, c="saddlebrown", linewidth=0.3, ec="sandybrown")
-    region.to_crs(crs).plot(ax=ax, fc="None", alpha=1, ec="k", linewidth=1)
+    if raster_threshold is not None and len(X_coords) > raster_threshold:
+        extent, shape = _raster_shape(X_coords, Y_coords, figsize, dpi)
+        counts = bin_points_to_pixels(X_coords, Y_coords, extent, shape)
+
+        ax.imshow(
+            np.ma.masked_equal(counts, 0),
+            extent=extent,
+            origin="lower",
+            aspect="auto",
+            interpolation="nearest",
+            cmap=LinearSegmentedColormap.from_list(
+                "incidents",
+                ["sandybrown", "saddlebrown"],
+            ),
+            norm=LogNorm(vmin=1),
+        )
+
+    else:
+        ax.scatter(
+            X_coords,
+            Y_coords,
+            s=5,
+            c="saddlebrown",
+            linewidth=0.3,
+            ec="sandybrown",
+        )
+
+    _reproject(region, crs).plot(ax=ax, fc="None", alpha=1, ec="k", linewidth=1)
 
     plt.axis(False)
 
     return fig, ax
 
 
-def plot_dbscan_clusters(data, labels, region, crs="EPSG:4326", figsize=(8, 6)):
+def plot_dbscan_clusters(
+    data,
+    labels,
+    region,
+    crs="EPSG:4326",
+    figsize=(8, 6),
+    raster_threshold=RASTER_POINT_THRESHOLD,
+    dpi=300,
+):
     """Plot DBSCAN clusters.
 
+    All points are coloured in one vectorised pass and drawn with a single scatter.
+    Above ``raster_threshold`` points they are binned per cluster to the pixel grid
+    of the saved figure instead, and every pixel takes the colour of the cluster
+    with most points in it.
+
     Parameters:
     -----------
     data: pandas.DataFrame
@@ -103,6 +246,10 @@ def plot_dbscan_clusters(data, labels, region, crs="EPSG:4326", figsize=(8, 6)):
         Coordinate reference system of the region.
     figsize: tuple
         Size of the figure.
+    raster_threshold: int
+        Number of points above which the raster mode is used. None disables it.
+    dpi: int
+        Resolution the figure is saved with, used to size the pixel grid.
 
     Returns:
     --------
@@ -114,37 +261,60 @@ def plot_dbscan_clusters(data, labels, region, crs="EPSG:4326", figsize=(8, 6)):
     """
     fig, ax = plt.subplots(figsize=figsize)
 
-    ax.set_prop_cycle(cycler("color", ["c", "m", "y", "k"]))
-
-    for lbl in sorted(np.unique(labels)):
-
-        if lbl != -1:
-            ax.scatter(
-                data.loc[labels == lbl, "Longitude"],
-                data.loc[labels == lbl, "Latitude"],
-                s=9,
-                linewidth=0.5,
-                ec="gray",
-                zorder=0,
-                label=f"Cluster {lbl}",
-            )
-
-        else:
-            ## noise
-            ax.scatter(
-                data.loc[labels == lbl, "Longitude"],
-                data.loc[labels == lbl, "Latitude"],
-                c="lightgray",
-                s=9,
-                linewidth=0.5,
-                ec="gray",
-                zorder=0,
-                label="Noise",
-            )
+    X_coords = data["Longitude"].to_numpy()
+    Y_coords = data["Latitude"].to_numpy()
+
+    ## Colour clusters in the order of their labels, noise is always light gray.
+    unique_labels, codes = np.unique(labels, return_inverse=True)
+    cluster_colors = cycle(["c", "m", "y", "k"])
+    colors = to_rgba_array(
+        ["lightgray" if lbl == -1 else next(cluster_colors) for lbl in unique_labels],
+    )
+
+    if raster_threshold is not None and len(X_coords) > raster_threshold:
+        extent, shape = _raster_shape(X_coords, Y_coords, figsize, dpi)
+        counts = bin_points_to_pixels(X_coords, Y_coords, extent, shape, codes)
+
+        image = colors[counts.argmax(axis=0)]
+        image[counts.sum(axis=0) == 0, 3] = 0
+
+        ax.imshow(
+            image,
+            extent=extent,
+            origin="lower",
+            aspect="auto",
+            interpolation="nearest",
+            zorder=0,
+        )
+
+    else:
+        ## Stable sort so later labels are drawn on top, as with one scatter per label.
+        order = np.argsort(codes, kind="stable")
+        ax.scatter(
+            X_coords[order],
+            Y_coords[order],
+            c=colors[codes[order]],
+            s=9,
+            linewidth=0.5,
+            ec="gray",
+            zorder=0,
+        )
+
+    ## Empty scatters act as legend entries.
+    for lbl, color in zip(unique_labels, colors):
+        ax.scatter(
+            [],
+            [],
+            color=color,
+            s=9,
+            linewidth=0.5,
+            ec="gray",
+            label="Noise" if lbl == -1 else f"Cluster {lbl}",
+        )
 
     ax.legend()
 
-    region.to_crs(crs).plot(ax=ax, fc="None", alpha=1, ec="k", linewidth=1)
+    _reproject(region, crs).plot(ax=ax, fc="None", alpha=1, ec="k", linewidth=1)
 
     plt.axis(False)
 
@@ -156,6 +326,7 @@ def plot_choropleth_map(
     column_name,
     figsize=(8, 6),
     choropleth_kwds=None,
+    dpi=None,
     **kwargs,
 ):
     """Plot regional level data on to a choropleth map.
@@ -177,6 +348,11 @@ def plot_choropleth_map(
     figsize: tuple
         Size of the figure.
 
+    dpi: int
+        Resolution of the saved figure. If given and the region is in a projected
+        CRS, its polygons are simplified to the level of detail visible at this
+        resolution, see `boundaries.select_tolerance`.
+
     Returns:
     --------
     fig, ax: matplotlib.pyplot.figure, matplotlib.pyplot.axes
@@ -185,6 +361,16 @@ def plot_choropleth_map(
     """
     fig, ax = plt.subplots(figsize=figsize)
 
+    if dpi is not None and region.crs is not None and region.crs.is_projected:
+        tolerance = boundaries.select_tolerance(
+            region.total_bounds,
+            region.crs,
+            figsize,
+            dpi,
+        )
+        if tolerance:
+            region = boundaries.simplify_coverage(region, tolerance)
+
     if choropleth_kwds is None:
         choropleth_kwds = {}
 
@@ -202,9 +388,54 @@ def plot_choropleth_map(
     return fig, ax
 
 
-def plot_weights_matrix(region, weights_matrix, figsize=(8, 6)):
+def weights_matrix_segments(region, weights_matrix):
+    """Build the line segments of all neighbour pairs of a weights matrix.
+
+    Parameters:
+    -----------
+    region: geopandas.GeoDataFrame
+        GeoDataFrame containing the regions, indexed by the ids of the weights matrix.
+    weights_matrix: libpysal.weights.weights.W
+        Weights matrix whose neighbour pairs are drawn.
+
+    Returns:
+    --------
+    segments: numpy.ndarray
+        Array of shape (n_edges, 2, 2) containing the centroids of both regions of
+        every neighbour pair. Each pair is included once, even if it is symmetric.
+        Raises a KeyError if ids of the weights matrix are not in ``region``.
+
+    """
+    positions = region.index.get_indexer(weights_matrix.id_order)
+    if (positions < 0).any():
+        missing = [
+            id_ for id_, position in zip(weights_matrix.id_order, positions)
+            if position < 0
+        ]
+        raise KeyError(f"Ids of the weights matrix not in the region index: {missing}")
+
+    centroids = region.geometry.centroid
+    xy = np.column_stack([centroids.x.to_numpy(), centroids.y.to_numpy()])[positions]
+
+    adjacency = weights_matrix.sparse.tocoo()
+    adjacency = (adjacency + adjacency.T).tocoo()
+    upper = adjacency.row < adjacency.col
+    rows, cols = adjacency.row[upper], adjacency.col[upper]
+
+    return np.stack([xy[rows], xy[cols]], axis=1)
+
+
+def plot_weights_matrix(
+    region,
+    weights_matrix,
+    figsize=(8, 6),
+    max_edges=None,
+    random_state=0,
+):
     """Plot weights matrix.
 
+    All neighbour edges are drawn as a single line collection.
+
     Parameters:
     -----------
     region: geopandas.GeoDataFrame
@@ -213,6 +444,11 @@ def plot_weights_matrix(region, weights_matrix, figsize=(8, 6)):
         Weights matrix to be plotted.
     figsize: tuple
         Size of the figure.
+    max_edges: int
+        Maximum number of edges to draw, a random subsample is drawn if there are
+        more. None draws every edge.
+    random_state: int
+        Seed of the edge subsampling.
 
     Returns:
     --------
@@ -224,11 +460,15 @@ def plot_weights_matrix(region, weights_matrix, figsize=(8, 6)):
 
     region.plot(ax=ax, edgecolor="grey", facecolor="w")
 
-    weights_matrix.plot(
-        region,
-        ax=ax,
-        edge_kws={"color": "darkorange", "linestyle": ":", "linewidth": 1.3},
-        node_kws={"marker": ""},
+    segments = weights_matrix_segments(region, weights_matrix)
+
+    if max_edges is not None and len(segments) > max_edges:
+        rng = np.random.default_rng(random_state)
+        keep = rng.choice(len(segments), max_edges, replace=False)
+        segments = segments[np.sort(keep)]
+
+    ax.add_collection(
+        LineCollection(segments, colors="darkorange", linestyles=":", linewidths=1.3),
     )
 
     ax.set_axis_off()
@@ -0,0 +1,271 @@
+"""Engine rendering many figures in parallel with shared base layers."""
+
+import hashlib
+import inspect
+import json
+import multiprocessing
+import os
+import sys
+from pathlib import Path
+
+import matplotlib
+import matplotlib.pyplot as plt
+from pyproj import CRS
+
+import crime_patterns.utilities as utils
+from crime_patterns.data_management import boundaries
+from crime_patterns.final import plotting
+
+## Base layers of the current worker process, set by `_init_worker`.
+_BASE_LAYERS = {}
+
+
+def load_base_layers(paths, crs_list):
+    """Load base layers once and project them to every required CRS.
+
+    Parameters:
+    -----------
+    paths: dict
+        Dictionary mapping the name of each base layer to the path of its file, to
+        a list of paths of the same layer cached in different CRS, or to a
+        dictionary mapping simplification tolerances in metres to such paths, see
+        `boundaries.lod_cache_paths`.
+    crs_list: list
+        List of coordinate reference systems the layers are needed in.
+
+    Returns:
+    --------
+    base_layers: dict
+        Dictionary mapping the name of each layer to a dictionary mapping each CRS
+        to a dictionary mapping each tolerance to the projected
+        geopandas.GeoDataFrame. Layers given by a single path have the tolerance 0.
+        Layers are only reprojected if no file in the requested CRS is given.
+
+    """
+    base_layers = {}
+
+    for name, layer_paths in paths.items():
+        base_layers[name] = {crs: {} for crs in crs_list}
+
+        for tolerance, level_paths in _as_levels(layer_paths).items():
+            layers = [boundaries.read_boundary_file(path) for path in level_paths]
+
+            for crs in crs_list:
+                crs_layers = [
+                    layer for layer in layers if layer.crs == CRS.from_user_input(crs)
+                ]
+                base_layers[name][crs][tolerance] = (
+                    crs_layers[0] if crs_layers else layers[0].to_crs(crs)
+                )
+
+    return base_layers
+
+
+def get_base_layer(base_layers, name, crs, figsize=None, dpi=None):
+    """Get a base layer in the requested CRS and level of detail.
+
+    Parameters:
+    -----------
+    base_layers: dict
+        Base layers as returned by `load_base_layers`.
+    name: str
+        Name of the base layer.
+    crs: str or pyproj.CRS
+        Coordinate reference system the layer is needed in.
+    figsize: tuple
+        Size of the figure the layer is plotted in. If given together with ``dpi``,
+        the most simplified level invisible at this resolution is returned, see
+        `boundaries.select_tolerance`. Otherwise the exact layer is returned.
+    dpi: int
+        Resolution of the saved figure.
+
+    Returns:
+    --------
+    layer: geopandas.GeoDataFrame
+        The base layer. It is only reprojected if it was not loaded in ``crs``.
+
+    """
+    crs = CRS.from_user_input(crs)
+
+    levels = next(
+        (levels for levels in base_layers[name].values() if levels[0].crs == crs),
+        None,
+    )
+    reproject = levels is None
+    if reproject:
+        levels = next(iter(base_layers[name].values()))
+
+    tolerance = 0
+    if figsize is not None and dpi is not None:
+        tolerance = boundaries.select_tolerance(
+            levels[0].total_bounds,
+            levels[0].crs,
+            figsize,
+            dpi,
+            tolerances=list(levels),
+        )
+
+    return levels[tolerance].to_crs(crs) if reproject else levels[tolerance]
+
+
+def hash_figure(figure, base_layers_paths, dpi):
+    """Hash everything a figure depends on.
+
+    Parameters:
+    -----------
+    figure: dict
+        Figure specification, see `render_figures`.
+    base_layers_paths: dict
+        Dictionary mapping the name of each base layer to its path or paths.
+    dpi: int
+        Resolution of the saved figure.
+
+    Returns:
+    --------
+    str
+        Hex digest of the builder, the source code of its module and of the plotting
+        module, its parameters, the content of its input files and base layers and
+        the resolution.
+
+    """
+    builder = figure["builder"]
+    state = {
+        "builder": f"{builder.__module__}.{builder.__qualname__}",
+        "source": {
+            module.__name__: utils.hash_file(inspect.getsourcefile(module))
+            for module in [sys.modules[builder.__module__], plotting]
+        },
+        "params": figure.get("params", {}),
+        "dpi": dpi,
+        "inputs": {
+            key: utils.hash_file(path) for key, path in figure.get("inputs", {}).items()
+        },
+        "base_layers": {
+            key: {
+                tolerance: [utils.hash_file(path) for path in level_paths]
+                for tolerance, level_paths in _as_levels(paths).items()
+            }
+            for key, paths in base_layers_paths.items()
+        },
+    }
+    state = json.dumps(state, sort_keys=True, default=str)
+
+    return hashlib.sha256(state.encode()).hexdigest()
+
+
+def render_figures(
+    figures,
+    base_layers_paths,
+    crs_list,
+    cache_path=None,
+    n_workers=None,
+    dpi=300,
+):
+    """Render figures in a process pool, skipping those whose inputs did not change.
+
+    Parameters:
+    -----------
+    figures: list
+        List of figure specifications. Each one is a dictionary with the keys:
+        - "builder": module level function called as
+          ``builder(base_layers, inputs, **params)`` returning a
+          matplotlib.figure.Figure. Builders with a ``dpi`` argument also get the
+          resolution, e.g. to choose the level of detail of the base layers.
+        - "inputs": dictionary of paths to the files the figure is built from
+        - "params": dictionary of additional keyword arguments for the builder
+        - "output": path the figure is saved to
+    base_layers_paths: dict
+        Dictionary mapping the name of each base layer to its path, a list of paths
+        in different CRS or a dictionary of such paths per simplification
+        tolerance, see `load_base_layers`.
+        The layers are loaded and projected once and shared with every worker.
+    crs_list: list
+        List of coordinate reference systems the base layers are needed in.
+    cache_path: str or pathlib.Path
+        Path of the JSON file storing the hash of every rendered figure. If None,
+        every figure is rendered.
+    n_workers: int
+        Number of worker processes, defaults to the number of CPUs.
+    dpi: int
+        Resolution of the saved figures.
+
+    Returns:
+    --------
+    rendered: list
+        List of the output paths of the figures which were rendered.
+
+    """
+    cache = {}
+    if cache_path is not None and os.path.isfile(cache_path):
+        with open(cache_path) as stream:
+            cache = json.load(stream)
+
+    hashes = {
+        str(figure["output"]): hash_figure(figure, base_layers_paths, dpi)
+        for figure in figures
+    }
+    outdated = [
+        {**figure, "dpi": dpi}
+        for figure in figures
+        if cache.get(str(figure["output"])) != hashes[str(figure["output"])]
+        or not os.path.isfile(figure["output"])
+    ]
+
+    if outdated:
+        base_layers = load_base_layers(base_layers_paths, crs_list)
+
+        if n_workers is None:
+            n_workers = min(len(outdated), os.cpu_count() or 1)
+
+        with utils.process_pool(
+            n_workers=n_workers,
+            initializer=_init_worker,
+            initargs=(base_layers,),
+        ) as map_func:
+            rendered = map_func(_render_figure, outdated)
+
+    else:
+        rendered = []
+
+    if cache_path is not None:
+        Path(cache_path).parent.mkdir(parents=True, exist_ok=True)
+        with open(cache_path, "w") as stream:
+            json.dump({**cache, **hashes}, stream, indent=2, sort_keys=True)
+
+    return rendered
+
+
+def _init_worker(base_layers):
+    """Select the non-interactive backend and store the shared base layers."""
+    ## Leave the backend of the calling process alone if rendering runs in-process.
+    if multiprocessing.parent_process() is not None:
+        matplotlib.use("Agg")
+
+    _BASE_LAYERS.clear()
+    _BASE_LAYERS.update(base_layers)
+
+
+def _render_figure(figure):
+    """Build, save and close a single figure."""
+    params = figure.get("params", {})
+    if "dpi" in inspect.signature(figure["builder"]).parameters:
+        params = {"dpi": figure["dpi"], **params}
+
+    fig = figure["builder"](_BASE_LAYERS, figure.get("inputs", {}), **params)
+    fig.savefig(figure["output"], dpi=figure["dpi"], bbox_inches="tight")
+    plt.close(fig)
+
+    return figure["output"]
+
+
+def _as_list(paths):
+    """Wrap a single path into a list."""
+    return list(paths) if isinstance(paths, (list, tuple)) else [paths]
+
+
+def _as_levels(paths):
+    """Map every simplification tolerance to a list of paths, 0 for a single level."""
+    if isinstance(paths, dict):
+        return {tolerance: _as_list(level) for tolerance, level in paths.items()}
+
+    return {0: _as_list(paths)}
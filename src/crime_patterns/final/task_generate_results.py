@@ -1,18 +1,13 @@
-"""Tasks plotting the point patterns analysis results."""
+"""Tasks plotting the analysis results and creating the tables."""
 #%%
 
 import os
 
-import geopandas as gpd
-import matplotlib.pyplot as plt
-import pandas as pd
 import pytask
-import xarray as xr
 
 import crime_patterns.config as config
 import crime_patterns.utilities as utils
-from crime_patterns.analysis import spatial_regression
-from crime_patterns.final import plotting
+from crime_patterns.data_management import boundaries
 
 ## define paths
 src = config.SRC
@@ -24,315 +19,312 @@ models_dir = bld / "python" / "models"
 plots_dir = bld / "python" / "figures"
 tables_dir = bld / "python" / "tables"
 
-#%%
-@pytask.mark.depends_on(
-    {
-        "scripts": ["plotting.py"],
-        "crime_incidences": os.path.join(
-            data_clean,
-            r"city-of-london-burglaries-2019-cleaned.csv",
-        ),
-        "densities": os.path.join(results_dir, "kernel_density_estimates.nc"),
-        "dbscan_clusters": os.path.join(models_dir, "dbscan_clusters.pickle"),
-        "london_borough": os.path.join(
-            data_raw,
-            "statistical-gis-boundaries-london",
-            "statistical-gis-boundaries-london",
-            "ESRI",
-            "London_Borough_Excluding_MHW.shp",
-        ),
-    },
-)
-@pytask.mark.produces(
-    {
-        "burglary_incidents": os.path.join(plots_dir, "burglary_incidents.png"),
-        "burglary_hotspots": os.path.join(plots_dir, "burglary_hotspots.png"),
-        "burglary_clusters": os.path.join(plots_dir, "burglary_clusters.png"),
-    },
-)
-def task_plot_point_patterns(depends_on, produces):
-    """Task for plotting the point patterns analysis results."""
-    ## Load data
-    crime_incidences = pd.read_csv(depends_on["crime_incidences"])
-    london_borough = gpd.read_file(depends_on["london_borough"])
-
-    with xr.open_dataset(depends_on["densities"]) as densities:
+data_info = config.read_data_info()
+years = data_info["crime_years"]
 
-        densities.load()
-    X_coords, Y_coords, densities = (
-        densities["lon"].to_numpy(),
-        densities["lat"].to_numpy(),
-        densities["densities"].to_numpy(),
-    )
-
-    dbscan_clusters = utils.load_object_from_pickle(depends_on["dbscan_clusters"])
-    labels = dbscan_clusters.labels_
-
-    # Setup figure and axis
-    height = 8
-    width = height * 0.75
-
-    fig, ax = plotting.plot_crime_incidents(
-        crime_incidences["Longitude"],
-        crime_incidences["Latitude"],
-        london_borough,
-        figsize=(height, width),
-    )
-
-    ## Plot all crime incidences
-    plt.suptitle("Burglary Incidences 2019")
-    fig.savefig(produces["burglary_incidents"], dpi=300, bbox_inches="tight")
-
-    ## Plot hotspots
-    fig, ax, cbar = plotting.plot_hotspots(
-        X_coords,
-        Y_coords,
-        densities,
-        london_borough,
-        figsize=(height, width),
-    )
-
-    cbar.ax.get_yaxis().labelpad = 15
-    cbar.ax.set_ylabel("Density (KDE)", rotation=270)
-
-    plt.suptitle("Burglary Hotspots")
-    fig.savefig(produces["burglary_hotspots"], dpi=300, bbox_inches="tight")
-
-    ## Plot clusters
-    fig, ax = plotting.plot_dbscan_clusters(
-        crime_incidences,
-        labels,
-        london_borough,
-        figsize=(height, width),
-    )
-
-    ax.legend(bbox_to_anchor=(0, 0.5))
-    plt.suptitle("Clustered Burglary Incidences (DBCAN)")
-
-    fig.savefig(produces["burglary_clusters"], dpi=300, bbox_inches="tight")
+#%%
+## Every level of detail of the boundary layers, figures pick one by resolution.
+base_layers_paths = {
+    f"london_{name}": {
+        tolerance: [
+            boundaries.boundary_cache_path(name, crs, tolerance=tolerance)
+            for crs in boundaries.CACHE_CRS
+        ]
+        for tolerance in boundaries.LOD_TOLERANCES
+    }
+    for name in ["borough", "ward"]
+}
 
 
 @pytask.mark.depends_on(
     {
-        "scripts": ["plotting.py"],
-        "london_borough": os.path.join(
-            data_raw,
-            "statistical-gis-boundaries-london",
-            "statistical-gis-boundaries-london",
-            "ESRI",
-            "London_Borough_Excluding_MHW.shp",
-        ),
+        "scripts": ["plotting.py", "figures.py", "rendering.py"],
         "imd_ward": os.path.join(data_clean, r"IMD_Ward_2019.shp"),
         "imd_lsoa": os.path.join(data_clean, r"IMD_LSOA_2019.shp"),
-        "burglary_ward": os.path.join(data_clean, r"MPS_Ward_Level_burglary_2019.shp"),
+        "weights_matrix_ward": os.path.join(models_dir, "weights_matrix_ward.pickle"),
+        **base_layers_paths,
     },
 )
 @pytask.mark.produces(
     {
         "imd_scores_lsoa": os.path.join(plots_dir, "imd_scores_lsoa.png"),
         "imd_scores_ward": os.path.join(plots_dir, "imd_scores_ward.png"),
-        "burglary_ward": os.path.join(plots_dir, "burglary_ward.png"),
-    },
-)
-def task_plot_cleaned_data(depends_on, produces):
-    """Task for plotting the cleaned data."""
-    ## Load Data
-    london_borough = gpd.read_file(depends_on["london_borough"])
-
-    imd_ward = gpd.read_file(depends_on["imd_ward"])
-    imd_lsoa = gpd.read_file(depends_on["imd_lsoa"])
-    burglary_ward = gpd.read_file(depends_on["burglary_ward"])
-
-    # Setup figure and axis
-    height = 8
-    width = height * 0.75
-
-    ### Plot LSOA level IMD scores
-    choropleth_kwds = {"scheme": "natural_breaks", "cmap": "viridis_r"}
-
-    fig, ax = plotting.plot_choropleth_map(
-        region=imd_lsoa,
-        column_name="IMDScore",
-        figsize=(height, width),
-        choropleth_kwds=choropleth_kwds,
-    )
-
-    london_borough.to_crs(imd_lsoa.crs).plot(ax=ax, fc="None")
-
-    ax.set_axis_off()
-    ax.set_title("IMD Score by LSOA")
-    fig.savefig(produces["imd_scores_lsoa"], dpi=300, bbox_inches="tight")
-
-    ### Plot Ward level IMD scores
-    fig, ax = plotting.plot_choropleth_map(
-        region=imd_ward,
-        column_name="IMDScore",
-        figsize=(height, width),
-        choropleth_kwds=choropleth_kwds,
-    )
-
-    london_borough.to_crs(imd_ward.crs).plot(ax=ax, fc="None")
-
-    ax.set_axis_off()
-    ax.set_title("IMD Score by Ward")
-    fig.savefig(produces["imd_scores_ward"], dpi=300, bbox_inches="tight")
-
-    ### Plot Ward level burglary counts
-    choropleth_kwds = {"scheme": "natural_breaks", "cmap": "Reds"}
-
-    fig, ax = plotting.plot_choropleth_map(
-        region=burglary_ward,
-        column_name="2019_total",
-        figsize=(height, width),
-        choropleth_kwds=choropleth_kwds,
-    )
-
-    london_borough.to_crs(burglary_ward.crs).plot(ax=ax, fc="None")
-
-    ax.set_axis_off()
-    ax.set_title("No. of Burglaries by Ward")
-    fig.savefig(produces["burglary_ward"], dpi=300, bbox_inches="tight")
-
-
-# %%
-@pytask.mark.depends_on(
-    {
-        "scripts": ["plotting.py"],
-        "moran": os.path.join(models_dir, "moran.pickle"),
-        "weights_matrix_ward": os.path.join(models_dir, "weights_matrix_ward.pickle"),
-        "london_ward": os.path.join(
-            data_raw,
-            "statistical-gis-boundaries-london",
-            "statistical-gis-boundaries-london",
-            "ESRI",
-            "London_Ward.shp",
-        ),
-        "london_borough": os.path.join(
-            data_raw,
-            "statistical-gis-boundaries-london",
-            "statistical-gis-boundaries-london",
-            "ESRI",
-            "London_Borough_Excluding_MHW.shp",
-        ),
-        "burglary_ward_lag": os.path.join(results_dir, "burglary_ward_lag.shp"),
-    },
-)
-@pytask.mark.produces(
-    {
-        "moran_scatter": os.path.join(plots_dir, "moran_scatter.png"),
-        "moran_distribution": os.path.join(plots_dir, "moran_distribution.png"),
-        "burglary_ward_lag": os.path.join(plots_dir, "burglary_ward_lag.png"),
         "weights_matrix_ward": os.path.join(plots_dir, "weights_matrix_ward.png"),
     },
 )
-def task_plot_spatial_autocorrelation(depends_on, produces):
-    """Task for plotting the spatial autocorrelation."""
-    ## Load Data
-    moran = utils.load_object_from_pickle(depends_on["moran"])
-    burglary_ward_lag = gpd.read_file(depends_on["burglary_ward_lag"])
-    london_borough = gpd.read_file(depends_on["london_borough"])
-    london_ward = gpd.read_file(depends_on["london_ward"])
+def task_plot_static_figures(depends_on, produces):
+    """Task for rendering the figures shared by all years."""
+    from crime_patterns.final import figures, rendering
 
-    # Setup figure and axis
+    # Setup figure size
     height = 8
     width = height * 0.75
-
-    ## Plot Moran's I Scatter
-    fig, ax = plotting.plot_moran_scatter(moran)
-
-    ax.set_xlabel("Burglary, 2019")
-    ax.set_ylabel("Burglary - Spatial Lag, 2019")
-    fig.savefig(produces["moran_scatter"], dpi=300, bbox_inches="tight")
-
-    ## Plot Moran's I Distribution
-    fig, ax = plotting.plot_moran_distribution(moran)
-    fig.savefig(produces["moran_distribution"], dpi=300, bbox_inches="tight")
-
-    ## Plot Burglary Spatial Lag
-    fig, ax = plotting.plot_choropleth_map(
-        region=burglary_ward_lag,
-        column_name="lag",
-        figsize=(height, width),
+    figsize = (height, width)
+
+    imd_choropleth_kwds = {"scheme": "natural_breaks", "cmap": "viridis_r"}
+
+    figure_specs = [
+        {
+            "builder": figures.choropleth_with_boroughs,
+            "inputs": {"region": depends_on["imd_lsoa"]},
+            "params": {
+                "column_name": "IMDScore",
+                "title": "IMD Score by LSOA",
+                "choropleth_kwds": imd_choropleth_kwds,
+                "figsize": figsize,
+            },
+            "output": produces["imd_scores_lsoa"],
+        },
+        {
+            "builder": figures.choropleth_with_boroughs,
+            "inputs": {"region": depends_on["imd_ward"]},
+            "params": {
+                "column_name": "IMDScore",
+                "title": "IMD Score by Ward",
+                "choropleth_kwds": imd_choropleth_kwds,
+                "figsize": figsize,
+            },
+            "output": produces["imd_scores_ward"],
+        },
+        {
+            "builder": figures.weights_matrix,
+            "inputs": {"weights_matrix": depends_on["weights_matrix_ward"]},
+            "params": {"figsize": (8, 6)},
+            "output": produces["weights_matrix_ward"],
+        },
+    ]
+
+    rendering.render_figures(
+        figure_specs,
+        base_layers_paths=base_layers_paths,
+        crs_list=boundaries.CACHE_CRS,
+        cache_path=plots_dir / ".figure_hashes.json",
+        dpi=300,
     )
 
-    london_borough.to_crs(burglary_ward_lag.crs).plot(ax=ax, fc="None")
-
-    ax.set_title("Burglary 2019 - Spatial Lag")
-    ax.set_axis_off()
-    fig.savefig(produces["burglary_ward_lag"], dpi=300, bbox_inches="tight")
-
-    ## Plot Spatial Weights Matrix
-    w_knn_8_ward = utils.load_object_from_pickle(depends_on["weights_matrix_ward"])
-    fig, ax = plotting.plot_weights_matrix(london_ward, w_knn_8_ward, figsize=(8, 6))
-    fig.savefig(produces["weights_matrix_ward"], dpi=300, bbox_inches="tight")
 
-
-# %%
-@pytask.mark.depends_on(
-    {
-        "model_spatial_ols": os.path.join(models_dir, "model_spatial_ols.pickle"),
-        "model_spatial_ml_lag": os.path.join(models_dir, "model_spatial_ml_lag.pickle"),
-        "model_spatial_ml_error": os.path.join(
-            models_dir,
-            "model_spatial_ml_error.pickle",
-        ),
-    },
-)
-@pytask.mark.produces(
-    {
-        "summary_spatial_ols_tex": os.path.join(
-            tables_dir,
-            "model_spatial_ols_summary.tex",
-        ),
-        "spat_diag_ols_tex": os.path.join(
-            tables_dir,
-            "spat_diag_ols_tex.tex",
-        ),
-        "summary_spatial_ml_lag_tex": os.path.join(
-            tables_dir,
-            "model_spatial_ml_lag_summary.tex",
-        ),
-        "summary_spatial_ml_error_tex": os.path.join(
-            tables_dir,
-            "model_spatial_ml_error_summary.tex",
-        ),
-        "ml_lag_stats_tex": os.path.join(
-            tables_dir,
-            "ml_lag_stats.tex",
-        ),
-        "ml_error_stats_tex": os.path.join(
-            tables_dir,
-            "ml_error_stats.tex",
-        ),
-    },
-)
-def task_create_latex_tables(depends_on, produces):
-    """Task for creating latex tables."""
-    ## Load models
-    model_ols = utils.load_object_from_pickle(depends_on["model_spatial_ols"])
-    model_ml_lag = utils.load_object_from_pickle(depends_on["model_spatial_ml_lag"])
-    model_ml_error = utils.load_object_from_pickle(depends_on["model_spatial_ml_error"])
-
-    ## Save summaries
-    spatial_regression.get_reg_summary(model_ols, "OLS").to_latex(
-        produces["summary_spatial_ols_tex"],
+for year in years:
+
+    @pytask.mark.depends_on(
+        {
+            "scripts": ["plotting.py", "figures.py", "rendering.py"],
+            "crime_incidences": os.path.join(
+                data_clean,
+                f"city-of-london-burglaries-{year}-cleaned.csv",
+            ),
+            "densities": os.path.join(
+                results_dir,
+                year,
+                "kernel_density_estimates.nc",
+            ),
+            "dbscan_clusters": os.path.join(models_dir, year, "dbscan_clusters.pickle"),
+            "burglary_ward": os.path.join(
+                data_clean,
+                f"MPS_Ward_Level_burglary_{year}.shp",
+            ),
+            "moran": os.path.join(models_dir, year, "moran.pickle"),
+            "burglary_ward_lag": os.path.join(
+                results_dir,
+                year,
+                "burglary_ward_lag.shp",
+            ),
+            **base_layers_paths,
+        },
     )
-    spatial_regression.get_reg_summary(model_ml_lag, "ML_Lag").to_latex(
-        produces["summary_spatial_ml_lag_tex"],
+    @pytask.mark.produces(
+        {
+            "burglary_incidents": os.path.join(
+                plots_dir,
+                year,
+                "burglary_incidents.png",
+            ),
+            "burglary_hotspots": os.path.join(plots_dir, year, "burglary_hotspots.png"),
+            "burglary_clusters": os.path.join(plots_dir, year, "burglary_clusters.png"),
+            "burglary_ward": os.path.join(plots_dir, year, "burglary_ward.png"),
+            "moran_scatter": os.path.join(plots_dir, year, "moran_scatter.png"),
+            "moran_distribution": os.path.join(
+                plots_dir,
+                year,
+                "moran_distribution.png",
+            ),
+            "burglary_ward_lag": os.path.join(plots_dir, year, "burglary_ward_lag.png"),
+        },
     )
-    spatial_regression.get_reg_summary(model_ml_error, "ML_Error").to_latex(
-        produces["summary_spatial_ml_error_tex"],
-    )
-
-    ## Save spatial diagnostics
-    spatial_regression.get_spatial_diagnostics(model_ols).to_latex(
-        produces["spat_diag_ols_tex"],
-    )
-
-    ## Save model stats
-    spatial_regression.get_model_stats(model_ml_lag).to_latex(
-        produces["ml_lag_stats_tex"],
+    @pytask.mark.task(id=year, kwargs={"year": year})
+    def task_plot_figures(depends_on, produces, year):
+        """Task for rendering all figures of a year in parallel.
+
+        The base layers are loaded once and figures whose inputs did not change since
+        the last run are skipped.
+
+        """
+        from crime_patterns.final import figures, rendering
+
+        # Setup figure size
+        height = 8
+        width = height * 0.75
+        figsize = (height, width)
+
+        figure_specs = [
+            ## Point patterns
+            {
+                "builder": figures.burglary_incidents,
+                "inputs": {"crime_incidences": depends_on["crime_incidences"]},
+                "params": {"title": f"Burglary Incidences {year}", "figsize": figsize},
+                "output": produces["burglary_incidents"],
+            },
+            {
+                "builder": figures.burglary_hotspots,
+                "inputs": {"densities": depends_on["densities"]},
+                "params": {"title": "Burglary Hotspots", "figsize": figsize},
+                "output": produces["burglary_hotspots"],
+            },
+            {
+                "builder": figures.burglary_clusters,
+                "inputs": {
+                    "crime_incidences": depends_on["crime_incidences"],
+                    "dbscan_clusters": depends_on["dbscan_clusters"],
+                },
+                "params": {
+                    "title": "Clustered Burglary Incidences (DBCAN)",
+                    "figsize": figsize,
+                },
+                "output": produces["burglary_clusters"],
+            },
+            ## Cleaned data
+            {
+                "builder": figures.choropleth_with_boroughs,
+                "inputs": {"region": depends_on["burglary_ward"]},
+                "params": {
+                    "column_name": f"{year}_total",
+                    "title": "No. of Burglaries by Ward",
+                    "choropleth_kwds": {"scheme": "natural_breaks", "cmap": "Reds"},
+                    "figsize": figsize,
+                },
+                "output": produces["burglary_ward"],
+            },
+            ## Spatial autocorrelation
+            {
+                "builder": figures.moran_scatter,
+                "inputs": {"moran": depends_on["moran"]},
+                "params": {
+                    "xlabel": f"Burglary, {year}",
+                    "ylabel": f"Burglary - Spatial Lag, {year}",
+                },
+                "output": produces["moran_scatter"],
+            },
+            {
+                "builder": figures.moran_distribution,
+                "inputs": {"moran": depends_on["moran"]},
+                "output": produces["moran_distribution"],
+            },
+            {
+                "builder": figures.choropleth_with_boroughs,
+                "inputs": {"region": depends_on["burglary_ward_lag"]},
+                "params": {
+                    "column_name": "lag",
+                    "title": f"Burglary {year} - Spatial Lag",
+                    "figsize": figsize,
+                },
+                "output": produces["burglary_ward_lag"],
+            },
+        ]
+
+        ## Every year keeps its own cache, so years can be rendered concurrently.
+        rendering.render_figures(
+            figure_specs,
+            base_layers_paths=base_layers_paths,
+            crs_list=boundaries.CACHE_CRS,
+            cache_path=plots_dir / year / ".figure_hashes.json",
+            dpi=300,
+        )
+
+    # %%
+    @pytask.mark.depends_on(
+        {
+            "model_spatial_ols": os.path.join(
+                models_dir,
+                year,
+                "model_spatial_ols.pickle",
+            ),
+            "model_spatial_ml_lag": os.path.join(
+                models_dir,
+                year,
+                "model_spatial_ml_lag.pickle",
+            ),
+            "model_spatial_ml_error": os.path.join(
+                models_dir,
+                year,
+                "model_spatial_ml_error.pickle",
+            ),
+        },
     )
-    spatial_regression.get_model_stats(model_ml_error).to_latex(
-        produces["ml_error_stats_tex"],
+    @pytask.mark.produces(
+        {
+            "summary_spatial_ols_tex": os.path.join(
+                tables_dir,
+                year,
+                "model_spatial_ols_summary.tex",
+            ),
+            "spat_diag_ols_tex": os.path.join(
+                tables_dir,
+                year,
+                "spat_diag_ols_tex.tex",
+            ),
+            "summary_spatial_ml_lag_tex": os.path.join(
+                tables_dir,
+                year,
+                "model_spatial_ml_lag_summary.tex",
+            ),
+            "summary_spatial_ml_error_tex": os.path.join(
+                tables_dir,
+                year,
+                "model_spatial_ml_error_summary.tex",
+            ),
+            "ml_lag_stats_tex": os.path.join(
+                tables_dir,
+                year,
+                "ml_lag_stats.tex",
+            ),
+            "ml_error_stats_tex": os.path.join(
+                tables_dir,
+                year,
+                "ml_error_stats.tex",
+            ),
+        },
     )
+    @pytask.mark.task(id=year)
+    def task_create_latex_tables(depends_on, produces):
+        """Task for creating latex tables."""
+        from crime_patterns.analysis import spatial_regression
+
+        ## Load models
+        model_ols = utils.load_object_from_pickle(depends_on["model_spatial_ols"])
+        model_ml_lag = utils.load_object_from_pickle(depends_on["model_spatial_ml_lag"])
+        model_ml_error = utils.load_object_from_pickle(
+            depends_on["model_spatial_ml_error"],
+        )
+
+        ## Save summaries
+        spatial_regression.get_reg_summary(model_ols, "OLS").to_latex(
+            produces["summary_spatial_ols_tex"],
+        )
+        spatial_regression.get_reg_summary(model_ml_lag, "ML_Lag").to_latex(
+            produces["summary_spatial_ml_lag_tex"],
+        )
+        spatial_regression.get_reg_summary(model_ml_error, "ML_Error").to_latex(
+            produces["summary_spatial_ml_error_tex"],
+        )
+
+        ## Save spatial diagnostics
+        spatial_regression.get_spatial_diagnostics(model_ols).to_latex(
+            produces["spat_diag_ols_tex"],
+        )
+
+        ## Save model stats
+        spatial_regression.get_model_stats(model_ml_lag).to_latex(
+            produces["ml_lag_stats_tex"],
+        )
+        spatial_regression.get_model_stats(model_ml_error).to_latex(
+            produces["ml_error_stats_tex"],
+        )
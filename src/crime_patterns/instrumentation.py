@@ -0,0 +1,292 @@
+"""Runtime and peak-memory ledger of tasks and the major function calls inside them.
+
+Every tracked call appends one JSON record to the ledger. Compare the latest run
+with the previous ones by typing
+
+    python -m crime_patterns.instrumentation --window 5 --threshold 1.2
+
+"""
+import argparse
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+import crime_patterns.config as config
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+LEDGER_PATH = config.BLD / "instrumentation" / "ledger.jsonl"
+
+## All processes of one pytask run share the id, workers inherit it from the
+## environment of the main process.
+RUN_ID = os.environ.setdefault(
+    "CRIME_PATTERNS_RUN_ID",
+    datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S") + f"-{os.getpid()}",
+)
+
+## Seconds between two samples of the resident set size of a tracked block.
+RSS_SAMPLE_SECONDS = 0.05
+
+## Names of the calls currently being tracked in this process.
+_STACK = []
+
+
+def peak_rss_mb():
+    """High-water mark of the resident set size of the process in MB.
+
+    The mark covers the lifetime of the process, so it is not attributable to a
+    single block. None if unavailable.
+
+    """
+    if resource is None:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    ## Reported in bytes on macOS and in kilobytes elsewhere.
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def current_rss_mb():
+    """Current resident set size of the process in MB, None if unavailable."""
+    try:
+        with open("/proc/self/statm") as stream:
+            pages = int(stream.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+
+    return pages * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+@contextmanager
+def _block_peak_rss():
+    """Track the peak resident set size while the block runs.
+
+    The current RSS is sampled in a background thread. Spikes between two samples
+    are still caught when they raise the high-water mark of the process.
+
+    """
+    peak = {"mb": None}
+    high_water_start = peak_rss_mb()
+    stop = threading.Event()
+
+    def sample():
+        while True:
+            rss = current_rss_mb()
+            if rss is not None and (peak["mb"] is None or rss > peak["mb"]):
+                peak["mb"] = rss
+            if stop.wait(RSS_SAMPLE_SECONDS):
+                break
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    try:
+        yield peak
+    finally:
+        stop.set()
+        sampler.join()
+
+        high_water = peak_rss_mb()
+        if high_water is not None and high_water > high_water_start:
+            peak["mb"] = max(peak["mb"] or 0, high_water)
+
+
+@contextmanager
+def track(name, rows=None, ledger_path=None):
+    """Record wall time, CPU time, peak RSS and rows processed of a block.
+
+    The peak RSS of the record is the peak while the block runs, the high-water
+    mark of the process is stored separately as ``process_peak_rss_mb``.
+
+    Parameters:
+    -----------
+    name: str
+        Name of the tracked block. Nested blocks are stored with their parent.
+    rows: int
+        Number of rows processed. It can also be set later through the yielded
+        record, e.g. ``record["rows"] = len(df)``.
+    ledger_path: str or pathlib.Path
+        Path of the ledger, defaults to `LEDGER_PATH`.
+
+    Returns:
+    --------
+    record: dict
+        The record which is appended to the ledger when the block exits.
+
+    """
+    record = {
+        "run_id": RUN_ID,
+        "name": name,
+        "parent": "/".join(_STACK) or None,
+        "started": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "rows": rows,
+    }
+    _STACK.append(name)
+
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        with _block_peak_rss() as peak:
+            yield record
+    finally:
+        record["wall_seconds"] = time.perf_counter() - wall_start
+        record["cpu_seconds"] = time.process_time() - cpu_start
+        record["peak_rss_mb"] = peak["mb"]
+        record["process_peak_rss_mb"] = peak_rss_mb()
+        _STACK.pop()
+
+        _append_record(record, ledger_path or LEDGER_PATH)
+
+
+def instrument(func=None, *, name=None, ledger_path=None):
+    """Decorator recording every call of a function in the ledger.
+
+    The number of rows processed is taken from the length of the return value, if
+    it has one.
+
+    Parameters:
+    -----------
+    func: callable
+        The decorated function.
+    name: str
+        Name of the record, defaults to the name of the function.
+    ledger_path: str or pathlib.Path
+        Path of the ledger, defaults to `LEDGER_PATH`.
+
+    Returns:
+    --------
+    wrapper: callable
+        The instrumented function.
+
+    """
+    if func is None:
+        return functools.partial(instrument, name=name, ledger_path=ledger_path)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with track(name or func.__name__, ledger_path=ledger_path) as record:
+            out = func(*args, **kwargs)
+            if hasattr(out, "__len__"):
+                record["rows"] = len(out)
+
+        return out
+
+    return wrapper
+
+
+def read_ledger(ledger_path=None):
+    """Read all records of the ledger.
+
+    Parameters:
+    -----------
+    ledger_path: str or pathlib.Path
+        Path of the ledger, defaults to `LEDGER_PATH`.
+
+    Returns:
+    --------
+    records: list
+        List of records in the order they were written.
+
+    """
+    ledger_path = Path(ledger_path or LEDGER_PATH)
+    if not ledger_path.is_file():
+        return []
+
+    with open(ledger_path) as stream:
+        return [json.loads(line) for line in stream if line.strip()]
+
+
+def compare_runs(records, window=5, threshold=1.2):
+    """Compare the latest run with the rolling median of the previous runs.
+
+    Parameters:
+    -----------
+    records: list
+        Records of the ledger.
+    window: int
+        Number of previous runs of each call forming the baseline.
+    threshold: float
+        Ratio of wall time to the baseline above which a call is flagged as slower.
+
+    Returns:
+    --------
+    report: list
+        One dictionary per call of the latest run with its name, wall time,
+        baseline, ratio and whether it was flagged.
+
+    """
+    if not records:
+        return []
+
+    latest_run = records[-1]["run_id"]
+    history = {}
+    for record in records:
+        if record["run_id"] != latest_run:
+            key = (record["parent"], record["name"])
+            history.setdefault(key, []).append(record["wall_seconds"])
+
+    report = []
+    for record in records:
+        if record["run_id"] != latest_run:
+            continue
+
+        previous = history.get((record["parent"], record["name"]), [])[-window:]
+        baseline = sorted(previous)[len(previous) // 2] if previous else None
+        ratio = record["wall_seconds"] / baseline if baseline else None
+
+        report.append(
+            {
+                "name": "/".join(filter(None, [record["parent"], record["name"]])),
+                "wall_seconds": record["wall_seconds"],
+                "cpu_seconds": record["cpu_seconds"],
+                "peak_rss_mb": record["peak_rss_mb"],
+                "rows": record["rows"],
+                "baseline_seconds": baseline,
+                "ratio": ratio,
+                "slower": ratio is not None and ratio > threshold,
+            },
+        )
+
+    return report
+
+
+def _append_record(record, ledger_path):
+    ledger_path = Path(ledger_path)
+    ledger_path.parent.mkdir(parents=True, exist_ok=True)
+
+    with open(ledger_path, "a") as stream:
+        stream.write(json.dumps(record) + "\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ledger", type=Path, default=LEDGER_PATH)
+    parser.add_argument("--window", type=int, default=5)
+    parser.add_argument("--threshold", type=float, default=1.2)
+    args = parser.parse_args(argv)
+
+    report = compare_runs(read_ledger(args.ledger), args.window, args.threshold)
+
+    for row in report:
+        baseline = row["baseline_seconds"]
+        baseline = "no baseline" if baseline is None else f"{row['ratio']:.2f}x"
+        flag = "SLOWER" if row["slower"] else ""
+        print(
+            f"{row['name']:<72} {row['wall_seconds']:9.2f} s "
+            f"{row['cpu_seconds']:9.2f} s cpu {baseline:>12} {flag}",
+        )
+
+    return 1 if any(row["slower"] for row in report) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
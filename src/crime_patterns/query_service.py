@@ -0,0 +1,529 @@
+"""Local HTTP service answering hotspot queries from the precomputed results.
+
+The service memory-maps the kernel density surface, indexes the wards in an
+STRtree and the DBSCAN core samples in a KD-tree, and reloads them whenever the
+analysis tasks write new results to ``bld/``. Start it by typing
+
+    python -m crime_patterns.query_service --port 8765
+
+and query it with e.g.
+
+    curl "http://127.0.0.1:8765/point?lon=-0.12&lat=51.5&year=2019"
+    curl "http://127.0.0.1:8765/bbox?xmin=-0.2&ymin=51.45&xmax=-0.1&ymax=51.55"
+    curl -d '{"points": [[-0.12, 51.5], [-0.1, 51.52]]}' http://127.0.0.1:8765/batch
+
+"""
+import argparse
+import asyncio
+import json
+import os
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import pandas as pd
+import shapely
+from scipy.spatial import cKDTree
+
+import crime_patterns.config as config
+import crime_patterns.utilities as utils
+from crime_patterns.analysis import point_patterns
+from crime_patterns.data_management import boundaries
+
+CACHE_DIR = config.BLD / "python" / "service"
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Not Allowed"}
+
+
+def artifact_paths(year, bld=None):
+    """Paths of the results of one year the service is built from.
+
+    Parameters:
+    -----------
+    year: str
+        Year of the crime data.
+    bld: str or pathlib.Path
+        Build directory, defaults to `config.BLD`.
+
+    Returns:
+    --------
+    paths: dict
+        Dictionary mapping each artifact to its path.
+
+    """
+    bld = Path(bld or config.BLD)
+
+    return {
+        "densities": bld / "python" / "results" / year / "kernel_density_estimates.nc",
+        "dbscan_clusters": bld / "python" / "models" / year / "dbscan_clusters.pickle",
+        "crime_incidences": bld
+        / "python"
+        / "data"
+        / f"city-of-london-burglaries-{year}-cleaned.csv",
+        "wards": boundaries.boundary_cache_path(
+            "ward",
+            "EPSG:4326",
+            bld / "python" / "data" / "boundaries",
+        ),
+        "lisa": bld / "python" / "results" / year / "burglary_ward_lisa.csv",
+    }
+
+
+class QueryIndex:
+    """Read-only index answering point and bounding box queries of one year.
+
+    Parameters:
+    -----------
+    lon, lat: numpy.ndarray
+        1-D axes of the kernel density grid.
+    densities: numpy.ndarray
+        Kernel density estimates of shape (len(lon), len(lat)), e.g. memory-mapped.
+    ward_geometries: numpy.ndarray
+        Ward polygons in EPSG:4326.
+    ward_codes, ward_names: numpy.ndarray
+        GSS codes and names of the wards.
+    lisa_classes: numpy.ndarray
+        LISA class of every ward, None if unknown.
+    core_lonlat: numpy.ndarray
+        Coordinates (lon, lat) of the DBSCAN core samples, shape (n, 2).
+    core_labels: numpy.ndarray
+        Cluster labels of the core samples.
+    eps: float
+        DBSCAN radius in radians.
+
+    """
+
+    def __init__(
+        self,
+        lon,
+        lat,
+        densities,
+        ward_geometries,
+        ward_codes,
+        ward_names,
+        lisa_classes,
+        core_lonlat,
+        core_labels,
+        eps,
+    ):
+        self.lon, self.lat, self.densities = lon, lat, densities
+        self.ward_tree = shapely.STRtree(ward_geometries)
+        self.ward_codes, self.ward_names = ward_codes, ward_names
+        self.lisa_classes = lisa_classes
+        self.core_tree = cKDTree(_to_unit_sphere(core_lonlat))
+        self.core_labels = core_labels
+        ## Chord length on the unit sphere of the DBSCAN radius.
+        self.chord_eps = 2 * np.sin(eps / 2)
+
+    def query_points(self, lon, lat):
+        """Density, ward, LISA class and cluster of every point.
+
+        Parameters:
+        -----------
+        lon, lat: array-like
+            Coordinates of the points in EPSG:4326.
+
+        Returns:
+        --------
+        results: list
+            One dictionary per point. Points outside the grid have no density,
+            points outside all wards no ward, and points farther than the DBSCAN
+            radius from every core sample get the noise label -1.
+
+        """
+        lon = np.atleast_1d(np.asarray(lon, dtype=float))
+        lat = np.atleast_1d(np.asarray(lat, dtype=float))
+
+        densities = self._interpolate_densities(lon, lat)
+
+        ward_index = np.full(len(lon), -1)
+        points, wards = self.ward_tree.query(
+            shapely.points(lon, lat),
+            predicate="intersects",
+        )
+        ward_index[points] = wards
+
+        distances, nearest = self.core_tree.query(
+            _to_unit_sphere(np.column_stack([lon, lat])),
+            distance_upper_bound=self.chord_eps,
+        )
+        found = np.isfinite(distances)
+        clusters = np.full(len(lon), -1)
+        clusters[found] = self.core_labels[nearest[found]]
+
+        return [
+            {
+                "lon": float(lon[i]),
+                "lat": float(lat[i]),
+                "density": None if np.isnan(densities[i]) else float(densities[i]),
+                "ward_code": self._ward_field(self.ward_codes, ward_index[i]),
+                "ward_name": self._ward_field(self.ward_names, ward_index[i]),
+                "lisa_class": self._ward_field(self.lisa_classes, ward_index[i]),
+                "cluster": int(clusters[i]),
+            }
+            for i in range(len(lon))
+        ]
+
+    def query_bbox(self, xmin, ymin, xmax, ymax):
+        """Density summary, wards and clusters within a bounding box.
+
+        Parameters:
+        -----------
+        xmin, ymin, xmax, ymax: float
+            Bounding box in EPSG:4326.
+
+        Returns:
+        --------
+        result: dict
+            Maximum and mean density of the grid nodes in the box, the wards
+            intersecting it with their LISA class and the number of core samples
+            per cluster inside it.
+
+        """
+        lon_slice = slice(
+            np.searchsorted(self.lon, xmin, side="left"),
+            np.searchsorted(self.lon, xmax, side="right"),
+        )
+        lat_slice = slice(
+            np.searchsorted(self.lat, ymin, side="left"),
+            np.searchsorted(self.lat, ymax, side="right"),
+        )
+        window = np.asarray(self.densities[lon_slice, lat_slice])
+        has_density = window.size and not np.isnan(window).all()
+
+        wards = self.ward_tree.query(shapely.box(xmin, ymin, xmax, ymax))
+        wards = np.sort(wards)
+
+        ## Core samples are indexed on the sphere, so filter them by coordinates.
+        core = self.core_tree.data
+        core_lonlat = _from_unit_sphere(core)
+        inside = (
+            (core_lonlat[:, 0] >= xmin)
+            & (core_lonlat[:, 0] <= xmax)
+            & (core_lonlat[:, 1] >= ymin)
+            & (core_lonlat[:, 1] <= ymax)
+        )
+        labels, counts = np.unique(self.core_labels[inside], return_counts=True)
+
+        return {
+            "bbox": [xmin, ymin, xmax, ymax],
+            "max_density": float(np.nanmax(window)) if has_density else None,
+            "mean_density": float(np.nanmean(window)) if has_density else None,
+            "wards": [
+                {
+                    "ward_code": self._ward_field(self.ward_codes, i),
+                    "ward_name": self._ward_field(self.ward_names, i),
+                    "lisa_class": self._ward_field(self.lisa_classes, i),
+                }
+                for i in wards
+            ],
+            "clusters": {str(label): int(n) for label, n in zip(labels, counts)},
+        }
+
+    def _interpolate_densities(self, lon, lat):
+        """Bilinear interpolation of the density grid, NaN outside of it."""
+        ## Fractional grid positions of the points.
+        fx = np.interp(lon, self.lon, np.arange(len(self.lon)), np.nan, np.nan)
+        fy = np.interp(lat, self.lat, np.arange(len(self.lat)), np.nan, np.nan)
+        inside = ~(np.isnan(fx) | np.isnan(fy))
+
+        densities = np.full(len(lon), np.nan)
+        fx, fy = fx[inside], fy[inside]
+        x0 = np.minimum(fx.astype(int), len(self.lon) - 2)
+        y0 = np.minimum(fy.astype(int), len(self.lat) - 2)
+        wx, wy = fx - x0, fy - y0
+
+        grid = self.densities
+        densities[inside] = (
+            grid[x0, y0] * (1 - wx) * (1 - wy)
+            + grid[x0 + 1, y0] * wx * (1 - wy)
+            + grid[x0, y0 + 1] * (1 - wx) * wy
+            + grid[x0 + 1, y0 + 1] * wx * wy
+        )
+
+        return densities
+
+    @staticmethod
+    def _ward_field(values, index):
+        if index < 0 or values is None or pd.isna(values[index]):
+            return None
+
+        return str(values[index])
+
+
+def build_query_index(paths, cache_dir):
+    """Build the index of one year from the analysis results.
+
+    The density grid and the DBSCAN core samples are written to ``cache_dir`` as
+    ``.npy`` files and memory-mapped, so several service processes share them.
+
+    Parameters:
+    -----------
+    paths: dict
+        Paths of the results, see `artifact_paths`.
+    cache_dir: str or pathlib.Path
+        Directory of the memory-mapped arrays.
+
+    Returns:
+    --------
+    index: QueryIndex
+        Index of the results.
+
+    """
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+
+    with point_patterns.open_hotspots(paths["densities"]) as ds:
+        arrays = {
+            "lon": ds["lon"].to_numpy(),
+            "lat": ds["lat"].to_numpy(),
+            "densities": ds["densities"].to_numpy(),
+        }
+
+    dbscan = utils.load_object_from_pickle(paths["dbscan_clusters"])
+    incidents = pd.read_csv(
+        paths["crime_incidences"],
+        usecols=["Longitude", "Latitude"],
+    )
+    core = dbscan.core_sample_indices_
+    arrays["core_lonlat"] = incidents[["Longitude", "Latitude"]].to_numpy()[core]
+    arrays["core_labels"] = dbscan.labels_[core]
+
+    ## Write atomically, a running service may map the previous arrays.
+    for name, array in arrays.items():
+        tmp_path = cache_dir / f"{name}.{os.getpid()}.tmp.npy"
+        np.save(tmp_path, array)
+        os.replace(tmp_path, cache_dir / f"{name}.npy")
+    arrays = {
+        name: np.load(cache_dir / f"{name}.npy", mmap_mode="r") for name in arrays
+    }
+
+    wards = boundaries.read_boundary_file(paths["wards"])
+    lisa_classes = None
+    if Path(paths["lisa"]).is_file():
+        lisa = pd.read_csv(paths["lisa"]).set_index("GSS_CODE")["lisa_class"]
+        lisa_classes = lisa.reindex(wards["GSS_CODE"]).to_numpy()
+
+    return QueryIndex(
+        lon=arrays["lon"],
+        lat=arrays["lat"],
+        densities=arrays["densities"],
+        ward_geometries=wards.geometry.values,
+        ward_codes=wards["GSS_CODE"].to_numpy(),
+        ward_names=wards["NAME"].to_numpy(),
+        lisa_classes=lisa_classes,
+        core_lonlat=arrays["core_lonlat"],
+        core_labels=arrays["core_labels"],
+        eps=dbscan.eps,
+    )
+
+
+class QueryService:
+    """Serve the indexes of several years over HTTP and reload them on change.
+
+    Parameters:
+    -----------
+    paths: dict
+        Dictionary mapping each year to the paths of its results, see
+        `artifact_paths`.
+    default_year: str
+        Year queried if a request does not name one.
+    cache_dir: str or pathlib.Path
+        Directory of the memory-mapped arrays, defaults to `CACHE_DIR`.
+
+    """
+
+    def __init__(self, paths, default_year, cache_dir=None):
+        self.paths = paths
+        self.default_year = default_year
+        self.cache_dir = Path(cache_dir or CACHE_DIR)
+        self.indexes = {}
+        self._mtimes = {}
+
+    def reload_if_changed(self):
+        """Rebuild the index of every year whose results changed.
+
+        Returns:
+        --------
+        reloaded: list
+            Years whose index was rebuilt. Years with missing results are skipped.
+
+        """
+        reloaded = []
+
+        for year, paths in self.paths.items():
+            required = {key: path for key, path in paths.items() if key != "lisa"}
+            if not all(Path(path).is_file() for path in required.values()):
+                continue
+
+            mtimes = {
+                key: os.stat(path).st_mtime_ns
+                for key, path in paths.items()
+                if Path(path).is_file()
+            }
+            if mtimes != self._mtimes.get(year):
+                ## Swap the index in one assignment, queries never see a partial one.
+                self.indexes[year] = build_query_index(paths, self.cache_dir / year)
+                self._mtimes[year] = mtimes
+                reloaded.append(year)
+
+        return reloaded
+
+    def dispatch(self, method, target, body=b""):
+        """Answer a request.
+
+        Parameters:
+        -----------
+        method: str
+            HTTP method.
+        target: str
+            Request target, e.g. "/point?lon=-0.12&lat=51.5".
+        body: bytes
+            Request body, a JSON object with a "points" list for "/batch".
+
+        Returns:
+        --------
+        status: int
+            HTTP status code.
+        payload: dict
+            JSON serializable response.
+
+        """
+        url = urlsplit(target)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+
+        if url.path == "/health":
+            return 200, {"years": sorted(self.indexes)}
+
+        routes = {"/point": "GET", "/bbox": "GET", "/batch": "POST"}
+        if url.path not in routes:
+            return 404, {"error": f"Unknown path {url.path}."}
+        if method != routes[url.path]:
+            return 405, {"error": f"Use {routes[url.path]} for {url.path}."}
+
+        year = query.get("year", self.default_year)
+        if year not in self.indexes:
+            return 404, {"error": f"No results loaded for year {year}."}
+        index = self.indexes[year]
+
+        try:
+            if url.path == "/point":
+                lon, lat = float(query["lon"]), float(query["lat"])
+                return 200, index.query_points(lon, lat)[0]
+
+            if url.path == "/bbox":
+                bbox = [float(query[key]) for key in ["xmin", "ymin", "xmax", "ymax"]]
+                return 200, index.query_bbox(*bbox)
+
+            points = np.asarray(json.loads(body)["points"], dtype=float).reshape(-1, 2)
+            return 200, {"results": index.query_points(points[:, 0], points[:, 1])}
+
+        except (KeyError, ValueError, TypeError) as error:
+            return 400, {"error": f"Invalid request: {error!r}."}
+
+    async def handle_connection(self, reader, writer):
+        """Answer the HTTP/1.1 requests of one connection."""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, target, _ = request_line.decode("latin-1").split(" ", 2)
+
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    key, _, value = line.decode("latin-1").partition(":")
+                    headers[key.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+                status, payload = self.dispatch(method, target, body)
+                content = json.dumps(payload).encode()
+                writer.write(
+                    f"HTTP/1.1 {status} {_REASONS[status]}\r\n"
+                    "Content-Type: application/json\r\n"
+                    f"Content-Length: {len(content)}\r\n\r\n".encode() + content,
+                )
+                await writer.drain()
+
+                if headers.get("connection", "").lower() == "close":
+                    break
+
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+
+        finally:
+            writer.close()
+
+    async def watch(self, interval=2.0):
+        """Poll the results and reload the indexes whose files changed."""
+        while True:
+            await asyncio.sleep(interval)
+            await asyncio.to_thread(self.reload_if_changed)
+
+    async def serve(self, host="127.0.0.1", port=8765, unix_path=None, interval=2.0):
+        """Load the indexes and serve requests until cancelled.
+
+        Parameters:
+        -----------
+        host: str
+            Host to listen on.
+        port: int
+            Port to listen on.
+        unix_path: str or pathlib.Path
+            Listen on this Unix socket instead of host and port.
+        interval: float
+            Seconds between two checks for new results.
+
+        """
+        await asyncio.to_thread(self.reload_if_changed)
+
+        if unix_path is not None:
+            server = await asyncio.start_unix_server(self.handle_connection, unix_path)
+        else:
+            server = await asyncio.start_server(self.handle_connection, host, port)
+
+        watcher = asyncio.create_task(self.watch(interval))
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            watcher.cancel()
+
+
+def _to_unit_sphere(lonlat):
+    """Convert (lon, lat) in degrees to cartesian coordinates on the unit sphere."""
+    lon, lat = np.radians(np.asarray(lonlat, dtype=float)).T
+
+    return np.column_stack(
+        [np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)],
+    )
+
+
+def _from_unit_sphere(xyz):
+    """Convert cartesian coordinates on the unit sphere to (lon, lat) in degrees."""
+    x, y, z = np.asarray(xyz).T
+
+    return np.degrees(np.column_stack([np.arctan2(y, x), np.arcsin(np.clip(z, -1, 1))]))
+
+
+def main(argv=None):
+    data_info = utils.read_yaml(config.SRC / "data_management" / "data_info.yaml")
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", type=Path, default=None)
+    parser.add_argument("--years", nargs="+", default=data_info["crime_years"])
+    parser.add_argument("--default-year", default=data_info["report_year"])
+    parser.add_argument("--interval", type=float, default=2.0)
+    args = parser.parse_args(argv)
+
+    service = QueryService(
+        {year: artifact_paths(year) for year in args.years},
+        default_year=args.default_year,
+    )
+    asyncio.run(service.serve(args.host, args.port, args.unix, args.interval))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Scalable synthetic inputs for the benchmarks and tests."""
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+from shapely import box
+
+## Approximate extent of Greater London in EPSG:4326 and EPSG:27700.
+LONDON_BOUNDS_LONLAT = (-0.51, 51.28, 0.33, 51.69)
+LONDON_BOUNDS_BNG = (503_500, 155_800, 561_900, 200_900)
+
+
+def make_crime_incidents(n, seed=0, n_hotspots=25):
+    """Generate clustered crime incidents shaped like the raw police data.
+
+    Parameters:
+    -----------
+    n: int
+        Number of incidents.
+    seed: int
+        Seed of the random number generator.
+    n_hotspots: int
+        Number of Gaussian hotspots, a fifth of the incidents is spread uniformly.
+
+    Returns:
+    --------
+    incidents: pd.DataFrame
+        Incidents with the columns of the raw monthly crime data files.
+
+    """
+    rng = np.random.default_rng(seed)
+    xmin, ymin, xmax, ymax = LONDON_BOUNDS_LONLAT
+
+    centers = rng.uniform((xmin, ymin), (xmax, ymax), size=(n_hotspots, 2))
+    n_uniform = n // 5
+    hotspot = rng.integers(0, n_hotspots, size=n - n_uniform)
+    clustered = centers[hotspot] + rng.normal(scale=0.02, size=(n - n_uniform, 2))
+    uniform = rng.uniform((xmin, ymin), (xmax, ymax), size=(n_uniform, 2))
+    coords = np.clip(np.vstack([clustered, uniform]), (xmin, ymin), (xmax, ymax))
+
+    months = rng.integers(1, 13, size=n)
+    crime_types = np.array(["Burglary", "Robbery", "Vehicle crime", "Shoplifting"])
+
+    return pd.DataFrame(
+        {
+            "Crime ID": [f"{i:064x}" for i in range(n)],
+            "Month": [f"2019-{month:02d}" for month in months],
+            "Reported by": "Metropolitan Police Service",
+            "Falls within": "Metropolitan Police Service",
+            "Longitude": coords[:, 0],
+            "Latitude": coords[:, 1],
+            "Location": "On or near Synthetic Street",
+            "LSOA code": [f"E0100{i % 4835:04d}" for i in range(n)],
+            "LSOA name": "Synthetic 001A",
+            "Crime type": crime_types[rng.integers(0, len(crime_types), size=n)],
+            "Last outcome category": "Status update unavailable",
+            "Context": np.nan,
+        },
+    )
+
+
+def make_polygon_grid(n, seed=0, crs="EPSG:27700"):
+    """Generate a square grid of about ``n`` polygons covering Greater London.
+
+    Parameters:
+    -----------
+    n: int
+        Approximate number of polygons, the grid has ``ceil(sqrt(n))**2`` cells.
+    seed: int
+        Seed of the random number generator.
+    crs: str
+        Coordinate reference system of the grid.
+
+    Returns:
+    --------
+    grid: gpd.GeoDataFrame
+        Grid with crime, population and deprivation score columns like the ward data.
+
+    """
+    rng = np.random.default_rng(seed)
+    xmin, ymin, xmax, ymax = LONDON_BOUNDS_BNG
+    side = int(np.ceil(np.sqrt(n)))
+
+    xs = np.linspace(xmin, xmax, side + 1)
+    ys = np.linspace(ymin, ymax, side + 1)
+    x0, y0 = np.meshgrid(xs[:-1], ys[:-1])
+    x1, y1 = np.meshgrid(xs[1:], ys[1:])
+    geometry = box(x0.ravel(), y0.ravel(), x1.ravel(), y1.ravel())
+    size = len(geometry)
+
+    grid = pd.DataFrame(
+        {
+            "ID": [f"E05{i:06d}" for i in range(size)],
+            "crime_count": rng.integers(100, 350, size=size),
+            "pop_count": rng.integers(15000, 45000, size=size),
+            "EmpScore": rng.uniform(0.039, 0.0667, size=size),
+            "IncScore": rng.uniform(0.054, 0.0937, size=size),
+            "BHSScore": rng.uniform(23.68, 26.58, size=size),
+        },
+    )
+    grid["crime_rate"] = grid["crime_count"] / grid["pop_count"]
+
+    return gpd.GeoDataFrame(grid, geometry=geometry, crs=crs)
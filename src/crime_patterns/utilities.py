@@ -1,7 +1,12 @@
 """Utilities used in various parts of the project."""
 
+import hashlib
+import multiprocessing
 import os
 import pickle
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
 from urllib.request import urlretrieve
 from zipfile import ZipFile
 
@@ -73,8 +78,9 @@ def unzip_folder(zip_file, output_dir, subset=False, startswith=None):
         The path to the folder where the zip file should be unzipped.
     subset: bool
         Whether to unzip only a subset of the files in the zip file.
-    startswith: str
-        The string that the files to be unzipped should start with.
+    startswith: str or tuple
+        The string, or tuple of strings, that the files to be unzipped should start
+        with.
 
     Returns:
     --------
@@ -141,3 +147,109 @@ def load_object_from_pickle(source):
         obj = pickle.load(f)
 
     return obj
+
+
+@contextmanager
+def process_pool(n_workers=None, initializer=None, initargs=()):
+    """Context manager providing a ``map`` function backed by a process pool.
+
+    Parameters:
+    -----------
+    n_workers: int
+        The number of worker processes. Defaults to the number of CPUs. With a
+        single worker everything runs in the current process, which avoids the
+        start-up cost of the pool for small problems and in tests. Workers are
+        spawned rather than forked, as forking a process running BLAS or numba
+        threads can deadlock, and to behave the same on every platform.
+    initializer: callable
+        Function called once in every worker before any task, e.g. to receive
+        large shared inputs once instead of with every task.
+    initargs: tuple
+        The arguments passed to the initializer.
+
+    Returns:
+    --------
+    map_func: callable
+        Function with the signature of ``map`` returning the results as a list in
+        the order of the inputs.
+
+    """
+    if n_workers == 1:
+        if initializer is not None:
+            initializer(*initargs)
+
+        yield lambda func, iterable: list(map(func, iterable))
+
+    else:
+        with ProcessPoolExecutor(
+            max_workers=n_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=initializer,
+            initargs=initargs,
+        ) as executor:
+            yield lambda func, iterable: list(executor.map(func, iterable))
+
+
+def save_to_chunked_netcdf(ds, path, chunks, complevel=4):
+    """Function to write a dataset to a chunked, compressed NetCDF4 file.
+
+    Parameters:
+    -----------
+    ds: xarray.Dataset
+        The dataset to be written.
+    path: str
+        The path of the NetCDF file.
+    chunks: dict
+        The chunk size per dimension, dimensions not listed get chunks of size 1.
+    complevel: int
+        The zlib compression level.
+
+    Returns:
+    --------
+    path: str
+        The path of the NetCDF file.
+
+    """
+    encoding = {}
+    for name, variable in ds.data_vars.items():
+        encoding[name] = {
+            "zlib": True,
+            "shuffle": True,
+            "complevel": complevel,
+            "chunksizes": tuple(
+                min(chunks.get(dim, 1), size)
+                for dim, size in zip(variable.dims, variable.shape)
+            ),
+        }
+
+    ds.to_netcdf(path, mode="w", format="NETCDF4", engine="netcdf4", encoding=encoding)
+
+    return path
+
+
+def hash_file(path):
+    """Function to hash the content of a file.
+
+    Parameters:
+    -----------
+    path: str or pathlib.Path
+        The path to the file. The sidecar files of a shapefile are included.
+
+    Returns:
+    --------
+    str
+        The hex digest of the SHA-256 hash of the content.
+
+    """
+    path = Path(path)
+    paths = [path]
+    if path.suffix == ".shp":
+        paths = sorted(path.parent.glob(f"{path.stem}.*"))
+
+    digest = hashlib.sha256()
+    for file_path in paths:
+        with open(file_path, "rb") as stream:
+            for block in iter(lambda: stream.read(2**20), b""):
+                digest.update(block)
+
+    return digest.hexdigest()
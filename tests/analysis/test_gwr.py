@@ -0,0 +1,68 @@
+"""Tests for the geographically weighted regression module."""
+#%%
+import numpy as np
+import pytest
+from crime_patterns.analysis import gwr
+
+
+@pytest.fixture()
+def varying_slope_grid(synthetic_polygon_grid):
+    grid = synthetic_polygon_grid(400)
+    rng = np.random.default_rng(0)
+    centroids = grid.centroid
+    east = (centroids.x - centroids.x.min()) / (centroids.x.max() - centroids.x.min())
+
+    grid["x1"] = rng.normal(size=len(grid))
+    grid["x2"] = rng.normal(size=len(grid))
+    grid["slope"] = 3 * east
+    grid["y"] = 1 + grid["slope"] * grid["x1"] - grid["x2"]
+    grid["y"] += rng.normal(scale=0.5, size=len(grid))
+
+    return grid
+
+
+#%%
+def test_local_fits_match_weighted_least_squares(varying_slope_grid):
+    result = gwr.fit_gwr(
+        varying_slope_grid,
+        "y",
+        ["x1", "x2"],
+        bandwidth=50,
+        ID_col_name="ID",
+    )
+    y, x, coords = gwr.gwr_design(varying_slope_grid, "y", ["x1", "x2"])
+
+    for focal in [0, 123, 399]:
+        distances = np.linalg.norm(coords - coords[focal], axis=1)
+        neighbours = np.argsort(distances, kind="stable")[:50]
+        weights = (1 - (distances[neighbours] / distances[neighbours].max()) ** 2) ** 2
+        expected = np.linalg.lstsq(
+            x[neighbours] * np.sqrt(weights)[:, None],
+            y[neighbours] * np.sqrt(weights),
+            rcond=None,
+        )[0]
+
+        np.testing.assert_allclose(
+            result.iloc[focal][["CONSTANT", "x1", "x2"]].to_numpy(dtype=float),
+            expected,
+        )
+
+    assert result.attrs["bandwidth"] == 50
+    assert result["local_r2"].between(0, 1).all()
+
+
+#%%
+@pytest.mark.parametrize("n_workers", [1, 2])
+def test_bandwidth_search_recovers_varying_slope(varying_slope_grid, n_workers):
+    result = gwr.fit_gwr(
+        varying_slope_grid,
+        "y",
+        ["x1", "x2"],
+        ID_col_name="ID",
+        n_workers=n_workers,
+    )
+    aicc_curve = result.attrs["aicc_curve"]
+
+    assert result.attrs["bandwidth"] == min(aicc_curve, key=aicc_curve.get)
+    assert 20 < result.attrs["bandwidth"] < 400
+    assert np.corrcoef(result["x1"], varying_slope_grid["slope"])[0, 1] > 0.9
@@ -0,0 +1,111 @@
+"""Tests for the hotspot forecast module."""
+#%%
+import geopandas as gpd
+import numpy as np
+import pytest
+from crime_patterns.analysis import hotspot_forecast, space_time_cube
+from scipy import ndimage
+from shapely import box
+
+
+@pytest.fixture()
+def mock_cube():
+    rng = np.random.default_rng(0)
+    months = [f"2019-{month:02d}" for month in range(1, 9)]
+
+    ## A persistent hotspot on top of uniform background incidents.
+    x, y, month_labels = [], [], []
+    for month in months:
+        n_hotspot, n_background = 60, 40
+        x.append(rng.normal(300, 60, size=n_hotspot))
+        y.append(rng.normal(700, 60, size=n_hotspot))
+        x.append(rng.uniform(0, 1000, size=n_background))
+        y.append(rng.uniform(0, 1000, size=n_background))
+        month_labels += [month] * (n_hotspot + n_background)
+
+    return space_time_cube.build_incident_cube(
+        np.concatenate(x),
+        np.concatenate(y),
+        np.array(month_labels),
+        np.full(len(month_labels), "Burglary"),
+        cell_size=50,
+        bounds=(0, 0, 1000, 1000),
+    )
+
+
+#%%
+def test_update_surface_matches_decayed_counts():
+    rng = np.random.default_rng(1)
+    counts = rng.poisson(1, size=(3, 20, 30))
+    decay = 0.6
+
+    surface = None
+    for month_counts in counts:
+        surface = hotspot_forecast.update_surface(surface, month_counts, 1.5, decay)
+
+    decayed = (decay ** np.arange(2, -1, -1))[:, None, None] * counts
+    expected = ndimage.gaussian_filter(decayed.sum(axis=0), 1.5, mode="constant")
+    np.testing.assert_allclose(surface, expected)
+
+
+#%%
+def test_hit_rate_curve():
+    hit_rate, pai = hotspot_forecast.hit_rate_curve(
+        forecast=np.array([3.0, 2.0, 1.0, 0.0]),
+        observed=np.array([1, 0, 2, 1]),
+        area_fractions=[0.25, 0.5, 0.75, 1],
+    )
+
+    np.testing.assert_allclose(hit_rate, [0.25, 0.25, 0.75, 1])
+    np.testing.assert_allclose(pai, [1, 0.5, 1, 1])
+
+
+#%%
+def test_forecast_hotspots(mock_cube):
+    forecast = hotspot_forecast.forecast_hotspots(mock_cube, bandwidth=100, decay=0.5)
+
+    assert forecast.dims == ("month", "x", "y")
+    np.testing.assert_allclose(forecast.sum(["x", "y"]), 1)
+    peak = forecast.isel(month=-1).stack(cell=["x", "y"]).idxmax("cell").item()
+    assert abs(peak[0] - 300) <= 100 and abs(peak[1] - 700) <= 100
+
+
+#%%
+@pytest.mark.parametrize(
+    "window",
+    [None, gpd.GeoDataFrame(geometry=[box(0, 0, 1000, 500)])],
+)
+def test_backtest_hotspot_forecasts(mock_cube, window):
+    backtest = hotspot_forecast.backtest_hotspot_forecasts(
+        mock_cube,
+        bandwidth=100,
+        decay=0.5,
+        area_fractions=[0.05, 0.5, 1],
+        window=window,
+        warmup=3,
+    )
+    forecast = hotspot_forecast.forecast_hotspots(mock_cube, bandwidth=100, decay=0.5)
+    counts = hotspot_forecast.monthly_counts(mock_cube)
+    inside = (
+        np.ones((20, 20), dtype=bool)
+        if window is None
+        else (counts["y"] < 500).to_numpy()[None, :].repeat(20, axis=0)
+    )
+
+    assert backtest["month"].values.tolist() == mock_cube["month"].values[3:].tolist()
+    for i, month in enumerate(backtest["month"].values):
+        hit_rate, pai = hotspot_forecast.hit_rate_curve(
+            forecast.isel(month=i + 2).to_numpy()[inside],
+            counts.sel(month=month).to_numpy()[inside],
+            [0.05, 0.5, 1],
+        )
+        np.testing.assert_allclose(backtest["hit_rate"].sel(month=month), hit_rate)
+        np.testing.assert_allclose(backtest["pai"].sel(month=month), pai)
+        assert backtest["incidents"].sel(month=month) == np.sum(
+            counts.sel(month=month).to_numpy()[inside],
+        )
+
+    np.testing.assert_allclose(backtest["hit_rate"].sel(area_fraction=1), 1)
+    if window is None:
+        ## The persistent hotspot is forecast far better than by chance.
+        assert (backtest["pai"].sel(area_fraction=0.05) > 5).all()
@@ -0,0 +1,94 @@
+"""Tests for the kernel density module."""
+#%%
+import numpy as np
+import pytest
+from crime_patterns.analysis import kernel_density
+from scipy import stats
+
+
+@pytest.fixture()
+def clustered_points():
+    rng = np.random.default_rng(0)
+    dense = rng.normal([0, 0], [0.05, 0.03], size=(400, 2))
+    sparse = rng.uniform(-1, 1, size=(100, 2))
+
+    return np.vstack([dense, sparse]).T
+
+
+@pytest.fixture()
+def grid():
+    X, Y = np.meshgrid(np.linspace(-2, 2, 81), np.linspace(-2, 2, 81), indexing="ij")
+
+    return np.vstack([X.ravel(), Y.ravel()])
+
+
+#%%
+def test_truncated_kde_matches_gaussian_kde(clustered_points, grid):
+    expected = stats.gaussian_kde(clustered_points)(grid)
+
+    exact = kernel_density.truncated_kde(clustered_points, grid, rtol=0)
+    truncated = kernel_density.truncated_kde(clustered_points, grid, rtol=1e-6)
+
+    np.testing.assert_allclose(exact, expected, rtol=1e-10)
+    assert np.abs(truncated - expected).max() <= 1e-6 * expected.max()
+
+
+#%%
+def test_truncated_kde_parallel_tiles(clustered_points, grid):
+    serial = kernel_density.truncated_kde(clustered_points, grid, adaptive=True)
+    parallel = kernel_density.truncated_kde(
+        clustered_points,
+        grid,
+        adaptive=True,
+        n_workers=2,
+    )
+
+    np.testing.assert_allclose(parallel, serial)
+
+
+#%%
+def test_adaptive_kde_sharpens_dense_areas(clustered_points, grid):
+    fixed = kernel_density.truncated_kde(clustered_points, grid)
+    adaptive = kernel_density.truncated_kde(clustered_points, grid, adaptive=True)
+    cell_area = (4 / 80) ** 2
+
+    assert adaptive.max() > fixed.max()
+    assert adaptive.sum() * cell_area == pytest.approx(1, abs=0.02)
+
+
+#%%
+@pytest.mark.parametrize("method", ["lscv", "lcv"])
+def test_binned_cv_matches_exact_cv(clustered_points, method):
+    factors = np.geomspace(0.2, 1, 5)
+    n = clustered_points.shape[1]
+    cholesky = np.linalg.cholesky(np.cov(clustered_points))
+    points = np.linalg.solve(cholesky, clustered_points).T
+    squared_distances = ((points[:, None] - points[None]) ** 2).sum(axis=2)
+    det = np.prod(np.diag(cholesky))
+
+    def kernel_sums(sd):
+        return np.exp(-squared_distances / (2 * sd**2)) / (2 * np.pi * sd**2)
+
+    expected = []
+    for factor in factors:
+        pairs = kernel_sums(factor)
+        leave_one_out = (pairs.sum(axis=1) - pairs[0, 0]) / (n - 1)
+        if method == "lscv":
+            squared_integral = kernel_sums(np.sqrt(2) * factor).sum() / n**2
+            expected.append((squared_integral - 2 * leave_one_out.mean()) / det)
+        else:
+            expected.append(np.log(leave_one_out).mean() - np.log(det))
+
+    scores = kernel_density.cv_scores(clustered_points, factors, method=method)
+
+    np.testing.assert_allclose(scores, expected, rtol=1e-2)
+
+
+#%%
+def test_select_bandwidth_in_parallel(clustered_points):
+    factor, factors, scores = kernel_density.select_bandwidth(clustered_points)
+    parallel = kernel_density.select_bandwidth(clustered_points, n_workers=2)
+
+    assert factor == factors[np.argmin(scores)]
+    assert factor < kernel_density.bandwidth_factor("scott", 500)
+    np.testing.assert_allclose(parallel[2], scores)
@@ -1,11 +1,18 @@
 """Tests for the point patterns module."""
 #%%
+import geopandas as gpd
 import numpy as np
 import pytest
 from crime_patterns.analysis.point_patterns import (
     cluster_crime_incidents_dbscan,
     evaluate_hotspots,
+    knox_near_repeat,
+    month_to_period,
+    open_hotspots,
+    ripley_functions,
+    save_hotspots,
 )
+from shapely import box
 
 DESIRED_PRECISION = 10e-2
 
@@ -31,6 +38,49 @@ def test_evaluate_hotspots(mock_crime_points, mock_crime_polygons):
     )
 
 
+#%%
+def test_save_and_open_hotspots(mock_crime_points, mock_crime_polygons, tmp_path):
+    ds = evaluate_hotspots(
+        longitudes=mock_crime_points["points"].x,
+        latitudes=mock_crime_points["points"].y,
+        region=mock_crime_polygons,
+        crs="EPSG:4326",
+    )
+    path = save_hotspots(ds, tmp_path / "kde.nc", chunks={"lon": 32, "lat": 32})
+
+    assert ds["lon"].ndim == 1
+    assert ds["lat"].ndim == 1
+
+    bbox = (-0.3, -0.3, 0.1, 0.1)
+    with open_hotspots(path, bbox=bbox) as window:
+        assert window["lon"].size > 0
+        assert window["densities"].encoding["zlib"]
+        assert window["densities"].encoding["chunksizes"] == (32, 32)
+        assert float(window["lon"].min()) >= bbox[0]
+        assert float(window["lat"].max()) <= bbox[3]
+        np.testing.assert_array_equal(
+            window["densities"].to_numpy(),
+            ds["densities"].sel(lon=slice(-0.3, 0.1), lat=slice(-0.3, 0.1)),
+        )
+
+
+#%%
+def test_evaluate_hotspots_records_cv_curve(mock_crime_points, mock_crime_polygons):
+    ds = evaluate_hotspots(
+        longitudes=mock_crime_points["points"].x,
+        latitudes=mock_crime_points["points"].y,
+        region=mock_crime_polygons,
+        crs="EPSG:4326",
+        bandwidth="lscv",
+    )
+
+    assert ds.attrs["bandwidth"] == "lscv"
+    assert ds["cv_score"].dims == ("bandwidth_factor",)
+    assert ds.attrs["bandwidth_factor"] == float(
+        ds["bandwidth_factor"][ds["cv_score"].argmin()],
+    )
+
+
 #%%
 def test_cluster_crime_incidents_dbscan(mock_crime_points):
     cluster_labels = cluster_crime_incidents_dbscan(
@@ -41,3 +91,114 @@ def test_cluster_crime_incidents_dbscan(mock_crime_points):
     )
 
     assert set(cluster_labels.labels_) == {-1, 0, 1, 2}
+
+
+#%%
+def test_month_to_period():
+    np.testing.assert_array_equal(
+        month_to_period(["2019-01", "2019-12", "2020-01"]) - 12 * 2019,
+        [0, 11, 12],
+    )
+
+
+#%%
+@pytest.mark.parametrize("n_workers", [1, 2])
+def test_knox_near_repeat(n_workers):
+    rng = np.random.default_rng(0)
+    n = 300
+    x, y = rng.uniform(0, 10_000, size=(2, n))
+    t = rng.integers(0, 12, size=n)
+
+    ## Plant near repeats: a follow-up incident 50 m away in the same month.
+    x = np.concatenate([x, x[:100] + 50])
+    y = np.concatenate([y, y[:100]])
+    t = np.concatenate([t, t[:100]])
+
+    ds = knox_near_repeat(
+        x,
+        y,
+        t,
+        distance_bands=[0, 100, 1000],
+        time_bands=[0, 1, 3],
+        permutations=19,
+        n_workers=n_workers,
+        seed=0,
+    )
+
+    ## Pair counts match brute force
+    d = np.hypot(x[:, None] - x, y[:, None] - y)
+    dt = np.abs(t[:, None] - t)
+    upper = np.triu(np.ones_like(d, dtype=bool), k=1)
+    assert ds["observed"].sel(distance_band="0-100", time_band="0-1") == np.sum(
+        upper & (d < 100) & (dt < 1),
+    )
+    assert ds["observed"].sel(distance_band="100-1000", time_band="1-3") == np.sum(
+        upper & (d >= 100) & (d < 1000) & (dt >= 1) & (dt < 3),
+    )
+
+    near_repeat = ds.sel(distance_band="0-100", time_band="0-1")
+    assert float(near_repeat["knox_ratio"]) > 2
+    assert float(near_repeat["p_value"]) == pytest.approx(0.05)
+
+
+#%%
+def test_knox_near_repeat_more_workers_than_permutations():
+    rng = np.random.default_rng(0)
+    x, y = rng.uniform(0, 1000, size=(2, 200))
+    t = rng.integers(0, 12, size=200)
+
+    ds = knox_near_repeat(
+        x,
+        y,
+        t,
+        distance_bands=[0, 100, 1000],
+        time_bands=[0, 1, 3, 6],
+        permutations=3,
+        n_workers=4,
+        seed=0,
+    )
+
+    assert ds["expected"].shape == (2, 3)
+    assert ds["p_value"].notnull().all()
+
+
+#%%
+def test_ripley_functions_under_csr():
+    rng = np.random.default_rng(0)
+    x, y = rng.uniform(0, 1000, size=(2, 2000))
+    window = gpd.GeoSeries([box(0, 0, 1000, 1000)])
+    radii = np.arange(10, 101, 10)
+
+    ds = ripley_functions(x, y, window, radii, simulations=19, seed=0)
+
+    np.testing.assert_allclose(ds["K"], np.pi * radii**2, rtol=0.05)
+    np.testing.assert_allclose(ds["L"], radii, rtol=0.03)
+    np.testing.assert_allclose(ds["g"], 1, atol=0.1)
+    assert ((ds["K"] >= ds["K_lower"]) & (ds["K"] <= ds["K_upper"])).all()
+    assert ds.attrs["edge_correction"] == "border"
+
+
+#%%
+@pytest.mark.parametrize(("envelope", "n_workers"), [("csr", 1), ("ipp", 2)])
+def test_ripley_functions_detect_clustering(envelope, n_workers):
+    rng = np.random.default_rng(0)
+    centers = rng.uniform(100, 900, size=(10, 2))
+    x, y = (centers[rng.integers(0, 10, 1000)] + rng.normal(scale=15, size=(1000, 2))).T
+    window = gpd.GeoSeries([box(0, 0, 1000, 1000)])
+    radii = np.arange(5, 51, 5)
+
+    ds = ripley_functions(
+        x,
+        y,
+        window,
+        radii,
+        envelope=envelope,
+        simulations=9,
+        n_workers=n_workers,
+        seed=0,
+    )
+
+    assert (ds["L"] > ds["L_upper"]).all()
+    assert (ds["g"] > 1).all()
+    ## Patterns from the intensity of the clustered points are clustered as well.
+    assert (ds["L_lower"] > radii).all() == (envelope == "ipp")
@@ -0,0 +1,78 @@
+"""Tests for the space-time cube module."""
+#%%
+import numpy as np
+import pytest
+from crime_patterns.analysis import space_time_cube
+
+
+@pytest.fixture()
+def mock_cube():
+    rng = np.random.default_rng(0)
+    n = 1000
+    x, y = rng.uniform(0, 1000, size=(2, n))
+    months = rng.choice(["2019-01", "2019-02", "2019-03"], size=n)
+    crime_types = rng.choice(["Burglary", "Robbery"], size=n)
+
+    cube = space_time_cube.build_incident_cube(
+        x,
+        y,
+        months,
+        crime_types,
+        cell_size=100,
+        bounds=(0, 0, 1000, 1000),
+    )
+
+    return cube, x, y, months, crime_types
+
+
+#%%
+def test_build_incident_cube(mock_cube):
+    cube, x, y, months, crime_types = mock_cube
+
+    assert cube["counts"].dims == ("x", "y", "month", "crime_type")
+    assert cube["counts"].shape == (10, 10, 3, 2)
+    assert int(cube["counts"].sum()) == len(x)
+
+    in_cell = (
+        (x >= 200)
+        & (x < 300)
+        & (y >= 500)
+        & (y < 600)
+        & (months == "2019-02")
+        & (crime_types == "Robbery")
+    )
+    assert cube["counts"].sel(
+        x=250,
+        y=550,
+        month="2019-02",
+        crime_type="Robbery",
+    ) == np.sum(in_cell)
+
+
+#%%
+def test_coarsen_cube(mock_cube):
+    cube = mock_cube[0]
+
+    coarse = space_time_cube.coarsen_cube(cube, factor=3)
+
+    assert coarse["counts"].shape == (4, 4, 3, 2)
+    np.testing.assert_array_equal(coarse["x"], [150, 450, 750, 1050])
+    assert coarse.attrs["cell_size"] == 300
+    assert int(coarse["counts"].sum()) == int(cube["counts"].sum())
+    assert int(coarse["counts"].isel(x=0, y=0).sum()) == int(
+        cube["counts"].isel(x=slice(0, 3), y=slice(0, 3)).sum(),
+    )
+
+
+#%%
+def test_save_and_open_incident_cube(mock_cube, tmp_path):
+    cube = mock_cube[0]
+    path = space_time_cube.save_incident_cube(cube, tmp_path / "cube.nc")
+
+    with space_time_cube.open_incident_cube(path) as stored:
+        assert stored["counts"].encoding["chunksizes"] == (10, 10, 1, 1)
+        monthly = stored["counts"].sel(month="2019-01").sum("crime_type").load()
+        np.testing.assert_array_equal(
+            monthly,
+            cube["counts"].sel(month="2019-01").sum("crime_type"),
+        )
@@ -0,0 +1,76 @@
+"""Tests for the spatial cross-validation module."""
+#%%
+import numpy as np
+import pandas as pd
+import pytest
+from crime_patterns.analysis import spatial_cv
+
+
+@pytest.fixture()
+def grid_with_columns(synthetic_polygon_grid):
+    grid = synthetic_polygon_grid(100)
+    grid["crime_rate"] = grid["crime_count"] / grid["pop_count"]
+    ## Five vertical strips of two columns each.
+    grid["strip"] = np.floor((grid.centroid.x - grid.total_bounds[0]) / 11_680).astype(
+        int,
+    )
+
+    return grid
+
+
+#%%
+def test_spatial_folds_with_buffer(grid_with_columns):
+    folds = spatial_cv.spatial_folds(grid_with_columns, grid_with_columns["strip"])
+    buffered = spatial_cv.spatial_folds(
+        grid_with_columns,
+        grid_with_columns["strip"],
+        buffer=1,
+    )
+
+    assert [name for name, _, _ in folds] == [0, 1, 2, 3, 4]
+    for (name, train, test), (_, buffered_train, buffered_test) in zip(folds, buffered):
+        assert len(train) + len(test) == 100
+        np.testing.assert_array_equal(test, buffered_test)
+        ## The neighbouring column on either side of the strip is excluded.
+        n_neighbouring_columns = 1 if name in (0, 4) else 2
+        assert len(buffered_train) == len(train) - 10 * n_neighbouring_columns
+
+
+#%%
+@pytest.mark.parametrize("n_workers", [1, 2])
+def test_cross_validate_spatial_regression(grid_with_columns, n_workers):
+    folds = spatial_cv.spatial_folds(grid_with_columns, grid_with_columns["strip"])
+
+    fold_metrics, fold_coefficients = spatial_cv.cross_validate_spatial_regression(
+        grid_with_columns,
+        "crime_rate",
+        ["EmpScore", "IncScore", "BHSScore"],
+        folds,
+        ID_col_name="ID",
+        n_workers=n_workers,
+    )
+    stability = spatial_cv.get_coefficient_stability(fold_coefficients)
+
+    assert len(fold_metrics) == 5 * 3
+    assert (fold_metrics["n_test"] == 20).all()
+    assert (fold_metrics["rmse"] >= fold_metrics["mae"]).all()
+    assert stability.loc[("ML_Lag", "W_crime_rate"), "max"] == pytest.approx(
+        fold_coefficients.query("variable == 'W_crime_rate'")["coefficient"].max(),
+    )
+    assert stability["sign_agreement"].between(0, 1).all()
+
+    ## A fold fitted on its own gives the same coefficients.
+    _, single = spatial_cv.cross_validate_spatial_regression(
+        grid_with_columns,
+        "crime_rate",
+        ["EmpScore", "IncScore", "BHSScore"],
+        [folds[0]],
+        methods=("OLS",),
+        ID_col_name="ID",
+    )
+    pd.testing.assert_frame_equal(
+        single,
+        fold_coefficients.query("fold == 0 and method == 'OLS'").reset_index(
+            drop=True,
+        ),
+    )
@@ -39,11 +39,48 @@ def test_calculate_morans_I(mock_crime_polygons, mock_weights_matrix):
                 [[0.04413], [0.07255359], [-0.07540317], [-0.00131914], [-0.26720614]],
             ),
         ),
+        (
+            "GM_Lag",
+            np.array(
+                [
+                    [0.04207430],
+                    [0.10210421],
+                    [-0.08812841],
+                    [-0.00132228],
+                    [0.16434121],
+                ],
+            ),
+        ),
+        (
+            "GM_Error",
+            np.array(
+                [
+                    [0.02259271],
+                    [0.15376610],
+                    [-0.10720662],
+                    [-0.00124596],
+                    [0.98998346],
+                ],
+            ),
+        ),
+        (
+            "GM_Combo",
+            np.array(
+                [
+                    [0.04004125],
+                    [0.09346600],
+                    [-0.08765395],
+                    [-0.00139062],
+                    [0.61726594],
+                    [-0.40732740],
+                ],
+            ),
+        ),
         ("REG", pytest.raises(ValueError)),
     ],
 )
 def test_perform_spatial_regression(mock_crime_polygons, method, expected_betas):
-    if method in ["OLS", "ML_Lag", "ML_Error"]:
+    if method != "REG":
         model = spatial_regression.perform_spatial_regression(
             db=mock_crime_polygons,
             y_var_name="crime_rate",
@@ -61,3 +98,97 @@ def test_perform_spatial_regression(mock_crime_polygons, method, expected_betas)
                 x_var_names=["EmpScore", "IncScore", "BHSScore"],
                 method=method,
             )
+
+
+#%%
+@pytest.mark.parametrize(
+    ("method", "variables"),
+    [
+        ("GM_Lag", ["W_crime_rate"]),
+        ("GM_Error", ["lambda"]),
+        ("GM_Combo", ["W_crime_rate", "lambda"]),
+    ],
+)
+def test_gm_summary_and_stats(mock_crime_polygons, method, variables):
+    model = spatial_regression.perform_spatial_regression(
+        db=mock_crime_polygons,
+        y_var_name="crime_rate",
+        x_var_names=["EmpScore", "IncScore", "BHSScore"],
+        method=method,
+    )
+
+    reg_summary = spatial_regression.get_reg_summary(model, method)
+    model_stats = spatial_regression.get_model_stats(model)
+
+    assert reg_summary["Independent Variable"].tolist() == [
+        "CONSTANT",
+        "EmpScore",
+        "IncScore",
+        "BHSScore",
+        *variables,
+    ]
+    np.testing.assert_array_equal(reg_summary["Coefficient"], model.betas.ravel())
+    ## No inference on lambda, every other coefficient has a z-statistic
+    has_lambda = reg_summary["Independent Variable"] == "lambda"
+    assert reg_summary.loc[has_lambda, "z-Statistic"].isna().all()
+    assert reg_summary.loc[~has_lambda, "z-Statistic"].notna().all()
+    assert np.isclose(model_stats.loc["Pseudo R-squared"].iloc[0], model.pr2)
+    assert model_stats.loc[["Log likelihood", "Schwarz criterion"]].isna().all(None)
+
+
+#%%
+def test_perform_spatial_regression_with_shared_weights(mock_crime_polygons):
+    shared_w = spatial_regression.create_weights_matrix(
+        mock_crime_polygons,
+        method="knn",
+        k=8,
+        ids="ID",
+    )
+    shuffled = mock_crime_polygons.sample(frac=1, random_state=0)
+
+    model = spatial_regression.perform_spatial_regression(
+        db=shuffled,
+        y_var_name="crime_rate",
+        x_var_names=["EmpScore", "IncScore", "BHSScore"],
+        method="ML_Lag",
+        w=shared_w,
+        ID_col_name="ID",
+    )
+    expected = spatial_regression.perform_spatial_regression(
+        db=shuffled,
+        y_var_name="crime_rate",
+        x_var_names=["EmpScore", "IncScore", "BHSScore"],
+        method="ML_Lag",
+    )
+
+    ## Ties between equidistant neighbours of the grid may be broken differently.
+    np.testing.assert_array_almost_equal(model.betas, expected.betas, decimal=2)
+
+
+#%%
+def test_subset_weights_matrix(mock_weights_matrix):
+    ids = [3, 1, 2]
+
+    w = spatial_regression.subset_weights_matrix(mock_weights_matrix, ids)
+
+    assert w.id_order == ids
+    for i in ids:
+        assert set(w.neighbors[i]) == set(mock_weights_matrix.neighbors[i]) & set(ids)
+
+
+#%%
+def test_calculate_local_morans_I(mock_crime_polygons, mock_weights_matrix):
+    lisa = spatial_regression.calculate_local_morans_I(
+        mock_crime_polygons,
+        "crime_count",
+        mock_weights_matrix,
+        ID_column_name="ID",
+        permutations=99,
+        seed=0,
+    )
+
+    assert lisa["ID"].tolist() == mock_crime_polygons["ID"].tolist()
+    assert set(lisa["lisa_class"]) <= {"HH", "LH", "LL", "HL", "ns"}
+    assert (lisa.loc[lisa["p_sim"] >= 0.05, "lisa_class"] == "ns").all()
+    ## The local statistics average to the global Moran's I
+    assert np.isclose(lisa["local_I"].mean(), -0.125, atol=pytest.DESIRED_PRECISION)
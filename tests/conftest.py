@@ -2,6 +2,7 @@ import geopandas as gpd
 import numpy as np
 import pandas as pd
 import pytest
+from crime_patterns import synthetic
 from crime_patterns.config import TEST_DIR
 from crime_patterns.utilities import read_yaml
 from libpysal.weights import KNN
@@ -99,3 +100,15 @@ def mock_weights_matrix(mock_crime_polygons):
 @pytest.fixture()
 def raw_data_info():
     return read_yaml(TEST_DIR / "data" / "sample_raw_data_info.yaml")
+
+
+@pytest.fixture()
+def synthetic_crime_incidents():
+    """Factory generating ``n`` clustered incidents shaped like the raw data."""
+    return synthetic.make_crime_incidents
+
+
+@pytest.fixture()
+def synthetic_polygon_grid():
+    """Factory generating a grid of about ``n`` polygons covering Greater London."""
+    return synthetic.make_polygon_grid
@@ -0,0 +1,141 @@
+"""Tests for the boundaries module."""
+#%%
+import numpy as np
+import pytest
+import shapely
+from crime_patterns.data_management import boundaries
+
+
+@pytest.fixture()
+def boundaries_cache(mock_crime_polygons, tmp_path):
+    shapefiles_dir = tmp_path / "shapefiles"
+    shapefiles_dir.mkdir()
+    mock_crime_polygons.to_crs("EPSG:27700").to_file(
+        shapefiles_dir / boundaries.BOUNDARY_FILES["ward"],
+    )
+
+    cache_dir = tmp_path / "boundaries"
+    paths = boundaries.cache_boundaries(shapefiles_dir, cache_dir, names=["ward"])
+
+    return cache_dir, paths
+
+
+#%%
+def test_cache_boundaries(boundaries_cache, mock_crime_polygons):
+    cache_dir, paths = boundaries_cache
+
+    assert set(paths) == {("ward", crs) for crs in boundaries.CACHE_CRS}
+
+    for crs in boundaries.CACHE_CRS:
+        layer = boundaries.load_boundary("ward", crs, cache_dir)
+
+        assert layer.crs == crs
+        assert layer.has_sindex
+        assert layer["ID"].tolist() == mock_crime_polygons["ID"].tolist()
+
+
+#%%
+def test_load_boundary_shares_geometries(boundaries_cache):
+    cache_dir = boundaries_cache[0]
+
+    first = boundaries.load_boundary("ward", cache_dir=cache_dir)
+    first["ID"] = "changed"
+    second = boundaries.load_boundary("ward", cache_dir=cache_dir)
+
+    assert second.geometry.values is first.geometry.values
+    assert (second["ID"] != "changed").all()
+
+
+#%%
+def test_load_boundary_reloads_changed_file(boundaries_cache, mock_crime_polygons):
+    cache_dir, paths = boundaries_cache
+    path = paths["ward", "EPSG:4326"]
+
+    first = boundaries.load_boundary("ward", "EPSG:4326", cache_dir)
+    mock_crime_polygons.iloc[:3].to_parquet(path)
+
+    assert len(boundaries.load_boundary("ward", "EPSG:4326", cache_dir)) == 3
+    assert len(first) == len(mock_crime_polygons)
+
+
+#%%
+def test_load_boundary_errors(boundaries_cache):
+    cache_dir = boundaries_cache[0]
+
+    with pytest.raises(ValueError):
+        boundaries.load_boundary("county", cache_dir=cache_dir)
+
+    with pytest.raises(FileNotFoundError):
+        boundaries.load_boundary("borough", cache_dir=cache_dir)
+
+
+#%%
+def test_load_outline(boundaries_cache, mock_crime_polygons):
+    cache_dir, paths = boundaries_cache
+
+    outline = boundaries.load_outline("ward", dissolve_name="Area", cache_dir=cache_dir)
+    simplified = boundaries.load_outline("ward", tolerance=100, cache_dir=cache_dir)
+
+    assert len(outline) == 1
+    assert outline["NAME"].iloc[0] == "Area"
+    assert np.isclose(
+        outline.area.iloc[0],
+        mock_crime_polygons.to_crs("EPSG:27700").area.sum(),
+    )
+    assert len(simplified.geometry.iloc[0].exterior.coords) <= len(
+        outline.geometry.iloc[0].exterior.coords,
+    )
+    assert len(list(cache_dir.glob("ward_outline_*.parquet"))) == 1
+
+    ## A new version of the layer gets its own outline
+    mock_crime_polygons.iloc[:3].to_crs("EPSG:27700").to_parquet(
+        paths["ward", "EPSG:27700"],
+    )
+    outline = boundaries.load_outline("ward", crs="EPSG:4326", cache_dir=cache_dir)
+
+    assert outline.crs == "EPSG:4326"
+    assert len(list(cache_dir.glob("ward_outline_*.parquet"))) == 2
+    assert np.isclose(outline.area.iloc[0], mock_crime_polygons.area.iloc[:3].sum())
+
+
+
+#%%
+def test_simplify_coverage_keeps_shared_edges(synthetic_polygon_grid):
+    ## Collinear vertices along every edge, which simplification removes.
+    grid = synthetic_polygon_grid(100)
+    grid = grid.set_geometry(grid.geometry.segmentize(100))
+
+    simplified = boundaries.simplify_coverage(grid, 50)
+
+    assert shapely.coverage_is_valid(simplified.geometry.values)
+    assert (
+        shapely.get_num_coordinates(simplified.geometry.values).sum()
+        < shapely.get_num_coordinates(grid.geometry.values).sum()
+    )
+    assert simplified.area.sum() == pytest.approx(grid.area.sum())
+
+
+#%%
+def test_cache_boundaries_writes_levels_of_detail(boundaries_cache):
+    cache_dir = boundaries_cache[0]
+
+    for crs in boundaries.CACHE_CRS:
+        paths = boundaries.lod_cache_paths("ward", crs, cache_dir)
+
+        assert list(paths) == boundaries.LOD_TOLERANCES
+        assert all(path.is_file() for path in paths.values())
+        assert paths[0] == boundaries.boundary_cache_path("ward", crs, cache_dir)
+
+
+#%%
+@pytest.mark.parametrize(
+    ("crs", "bounds", "figsize", "dpi", "expected"),
+    [
+        ("EPSG:27700", (0, 0, 48_000, 36_000), (8, 6), 300, 10),
+        ("EPSG:27700", (0, 0, 48_000, 36_000), (8, 6), 100, 25),
+        ("EPSG:27700", (0, 0, 1_000, 1_000), (8, 6), 300, 0),
+        ("EPSG:4326", (-0.5, 51.3, 0.3, 51.7), (8, 6), 300, 10),
+    ],
+)
+def test_select_tolerance(crs, bounds, figsize, dpi, expected):
+    assert boundaries.select_tolerance(bounds, crs, figsize, dpi) == expected
@@ -1,3 +1,6 @@
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
 import pytest
 from crime_patterns.data_management import clean_data
 
@@ -18,3 +21,142 @@ def test_clean_monthly_crime_data(raw_data_info):
         cleaned_sample[raw_data_info["outcome_column"]].unique()[0]
         == raw_data_info["crime_type"]
     )
+
+
+@pytest.fixture()
+def wide_regional_crime_csv(tmp_path):
+    rng = np.random.default_rng(0)
+    months = [f"{year}{month:02d}" for year in [2018, 2019] for month in range(1, 13)]
+    rows = [
+        (f"E0100{i}", f"Area {i}", "Camden", major, minor)
+        for i in range(5)
+        for major, minor in [
+            ("Burglary", "Burglary in a Dwelling"),
+            ("Burglary", "Burglary in Other Buildings"),
+            ("Robbery", "Personal Property"),
+        ]
+    ]
+    wide = pd.DataFrame(
+        rows,
+        columns=["LSOA Code", "LSOA Name", "Borough", "Major Category", "Minor Category"],
+    )
+    wide[months] = rng.integers(0, 10, size=(len(wide), len(months)))
+
+    path = tmp_path / "lsoa_crime.csv"
+    wide.to_csv(path, index=False)
+
+    return path
+
+
+def test_read_regional_crime_data(wide_regional_crime_csv, tmp_path):
+    path = clean_data.convert_regional_crime_data_to_long(
+        wide_regional_crime_csv,
+        tmp_path / "lsoa_crime.parquet",
+    )
+
+    ## One row group per year and major category
+    assert pq.ParquetFile(path).num_row_groups == 4
+
+    burglary = clean_data.read_regional_crime_data(
+        path,
+        crime_year="2019",
+        crime_major_category="Burglary",
+    )
+    expected = clean_data.clean_regional_burglary_data(
+        pd.read_csv(wide_regional_crime_csv),
+        columns_to_keep=["LSOA Code"],
+        ID_column_name="LSOA Code",
+        crime_year="2019",
+        crime_major_category="Burglary",
+    )
+
+    pd.testing.assert_frame_equal(
+        burglary.drop(columns=["LSOA Name", "Borough", "Major Category"]),
+        expected,
+        check_dtype=False,
+        check_names=False,
+    )
+    assert burglary["Borough"].eq("Camden").all()
+
+
+@pytest.fixture()
+def imd_shapefile(mock_crime_polygons, tmp_path):
+    imd = mock_crime_polygons.rename(columns={"ID": "lsoa11cd", "pop_count": "TotPop"})
+    path = tmp_path / "IMD.shp"
+    imd[["lsoa11cd", "TotPop", "EmpScore", "geometry"]].to_file(path)
+
+    return path
+
+
+def test_read_imd_data(imd_shapefile, mock_crime_polygons):
+    london = mock_crime_polygons.iloc[:4].to_crs("EPSG:27700")
+
+    by_bbox = clean_data.read_imd_data(imd_shapefile, bbox=london)
+    by_codes = clean_data.read_imd_data(
+        imd_shapefile,
+        bbox=london,
+        lsoa_codes=london["ID"],
+    )
+    attributes = clean_data.read_imd_data(
+        imd_shapefile,
+        lsoa_codes=london["ID"],
+        columns=["lsoa11cd", "TotPop"],
+        ignore_geometry=True,
+    )
+
+    assert set(london["ID"]) < set(by_bbox["lsoa11cd"])
+    assert len(by_bbox) < len(mock_crime_polygons)
+    assert sorted(by_codes["lsoa11cd"]) == sorted(london["ID"])
+    assert list(attributes.columns) == ["lsoa11cd", "TotPop"]
+    assert sorted(attributes["lsoa11cd"]) == sorted(london["ID"])
+
+    deprived = clean_data.read_imd_data(imd_shapefile, where="EmpScore > 0.05")
+    assert (deprived["EmpScore"] > 0.05).all()
+    assert len(deprived) == (mock_crime_polygons["EmpScore"] > 0.05).sum()
+
+
+@pytest.mark.parametrize("method", ["unary", "coverage"])
+def test_dissolve_gdf_polygons(mock_crime_polygons, method):
+    columns = list(mock_crime_polygons.columns)
+
+    dissolved = clean_data.dissolve_gdf_polygons(
+        mock_crime_polygons,
+        dissolve_name="Area",
+        method=method,
+    )
+
+    assert list(mock_crime_polygons.columns) == columns
+    assert len(dissolved) == 1
+    assert dissolved["NAME"].iloc[0] == "Area"
+    assert np.isclose(dissolved.area.iloc[0], mock_crime_polygons.area.sum())
+
+
+#%%
+def test_concat_crime_data_keeps_compact_dtypes(raw_data_info, tmp_path):
+    monthly = []
+    for month in ["01", "02"]:
+        raw = pd.read_csv(pytest.sample_raw_data_path)
+        raw["Month"] = f"2019-{month}"
+        raw["Crime type"] = "Burglary"
+        raw.to_csv(tmp_path / f"{month}.csv", index=False)
+
+        monthly.append(
+            clean_data.clean_monthly_crime_data(
+                crime_incidence_filepath=tmp_path / f"{month}.csv",
+                year="2019",
+                month=month,
+                crime_type="Burglary",
+                columns_to_drop=raw_data_info["columns_to_drop"],
+                coordinate_dtype="float32",
+            ),
+        )
+    monthly.append(pd.DataFrame())
+
+    crime_data = clean_data.concat_crime_data(monthly)
+
+    assert len(crime_data) == sum(len(df) for df in monthly)
+    assert list(crime_data.columns) == list(monthly[0].columns)
+    assert crime_data["Month"].dtype == "category"
+    assert crime_data["Month"].cat.categories.tolist() == ["2019-01", "2019-02"]
+    assert crime_data["LSOA code"].dtype == "category"
+    assert crime_data["Longitude"].dtype == "float32"
@@ -0,0 +1,69 @@
+"""Tests for the incident index module."""
+#%%
+import numpy as np
+import pandas as pd
+import pytest
+from crime_patterns.data_management import incident_index
+
+
+@pytest.fixture()
+def indexed_incidents(synthetic_crime_incidents, tmp_path):
+    incidents = synthetic_crime_incidents(5_000)
+    incident_index.build_incident_index(incidents, tmp_path / "index")
+
+    return incidents, tmp_path / "index"
+
+
+#%%
+def test_morton_keys_interleave_bits():
+    keys = incident_index.morton_keys(
+        np.array([0, 1, 0, 3, 65535]),
+        np.array([0, 0, 1, 3, 65535]),
+    )
+
+    assert keys.tolist() == [0, 1, 2, 15, 2**32 - 1]
+
+
+#%%
+@pytest.mark.parametrize(
+    "bbox",
+    [(-0.2, 51.45, -0.05, 51.55), (-0.11, 51.5, -0.1, 51.51), (1.0, 52.0, 2.0, 53.0)],
+)
+def test_query_matches_full_scan(indexed_incidents, bbox):
+    incidents, index_dir = indexed_incidents
+    xmin, ymin, xmax, ymax = bbox
+    months = ["2019-03", "2019-04"]
+
+    expected = incidents[
+        incidents["Longitude"].between(xmin, xmax)
+        & incidents["Latitude"].between(ymin, ymax)
+        & incidents["Month"].isin(months)
+        & incidents["Crime type"].isin(["Burglary"])
+    ]
+    result = incident_index.query_incident_index(
+        index_dir,
+        bbox=bbox,
+        months=months,
+        crime_types=["Burglary"],
+    )
+
+    assert result.index.tolist() == expected.index.tolist()
+    pd.testing.assert_frame_equal(
+        result.astype(object).reset_index(drop=True),
+        expected.astype(object).reset_index(drop=True),
+        check_dtype=False,
+    )
+
+
+#%%
+def test_query_without_filters_returns_all_rows(indexed_incidents):
+    incidents, index_dir = indexed_incidents
+
+    result = incident_index.query_incident_index(
+        index_dir,
+        columns=["Longitude", "Crime type"],
+    )
+
+    assert list(result.columns) == ["Longitude", "Crime type"]
+    assert isinstance(result["Crime type"].dtype, pd.CategoricalDtype)
+    np.testing.assert_array_equal(result["Longitude"], incidents["Longitude"])
@@ -0,0 +1,99 @@
+"""Tests for the plotting module."""
+#%%
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+import pytest
+from crime_patterns.final import plotting
+from libpysal.weights import W
+from matplotlib.image import AxesImage
+
+
+@pytest.fixture()
+def mock_clustered_points(mock_crime_points):
+    return pd.DataFrame(
+        {
+            "Longitude": mock_crime_points["points"].x,
+            "Latitude": mock_crime_points["points"].y,
+        },
+    )
+
+
+#%%
+def test_bin_points_to_pixels():
+    x = np.array([0.0, 0.1, 0.9, 1.0, 0.6])
+    y = np.array([0.0, 0.2, 0.9, 1.0, 0.1])
+    labels = np.array([0, 0, 1, 1, 1])
+
+    counts = plotting.bin_points_to_pixels(x, y, (0, 1, 0, 1), (2, 2))
+    counts_by_label = plotting.bin_points_to_pixels(x, y, (0, 1, 0, 1), (2, 2), labels)
+
+    np.testing.assert_array_equal(counts, [[2, 1], [0, 2]])
+    np.testing.assert_array_equal(counts_by_label.sum(axis=0), counts)
+    np.testing.assert_array_equal(counts_by_label[0], [[2, 0], [0, 0]])
+
+
+#%%
+@pytest.mark.parametrize(("raster_threshold", "rasterized"), [(None, False), (10, True)])
+def test_plot_dbscan_clusters(
+    mock_clustered_points,
+    mock_crime_polygons,
+    raster_threshold,
+    rasterized,
+):
+    labels = np.repeat([-1, 0, 1], len(mock_clustered_points) // 3)
+
+    fig, ax = plotting.plot_dbscan_clusters(
+        mock_clustered_points,
+        labels,
+        mock_crime_polygons,
+        raster_threshold=raster_threshold,
+        dpi=20,
+    )
+
+    drawn_points = [len(c.get_offsets()) for c in ax.collections[:-1]]
+    legend_labels = [text.get_text() for text in ax.get_legend().get_texts()]
+
+    assert legend_labels == ["Noise", "Cluster 0", "Cluster 1"]
+    assert any(isinstance(image, AxesImage) for image in ax.images) == rasterized
+    assert sorted(drawn_points, reverse=True)[0] == (0 if rasterized else 300)
+    plt.close(fig)
+
+
+#%%
+@pytest.mark.parametrize(("max_edges", "expected_edges"), [(None, None), (10, 10)])
+def test_plot_weights_matrix(
+    mock_crime_polygons,
+    mock_weights_matrix,
+    max_edges,
+    expected_edges,
+):
+    segments = plotting.weights_matrix_segments(
+        mock_crime_polygons,
+        mock_weights_matrix,
+    )
+    pairs = {
+        frozenset((i, j))
+        for i, neighbors in mock_weights_matrix.neighbors.items()
+        for j in neighbors
+    }
+
+    fig, ax = plotting.plot_weights_matrix(
+        mock_crime_polygons,
+        mock_weights_matrix,
+        max_edges=max_edges,
+    )
+
+    assert len(segments) == len(pairs)
+    assert len(ax.collections[-1].get_segments()) == (expected_edges or len(pairs))
+    plt.close(fig)
+
+
+#%%
+def test_weights_matrix_segments_missing_ids(mock_crime_polygons):
+    ids = list("abcde")
+    w = W({i: [j for j in ids if j != i] for i in ids})
+
+    ## The ids are not in the RangeIndex of the regions.
+    with pytest.raises(KeyError, match="'a', 'b', 'c', 'd', 'e'"):
+        plotting.weights_matrix_segments(mock_crime_polygons.iloc[:5], w)
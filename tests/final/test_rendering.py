@@ -0,0 +1,145 @@
+"""Tests for the rendering module."""
+#%%
+import importlib
+
+import matplotlib.pyplot as plt
+import pytest
+from crime_patterns.final import rendering
+
+
+def _plot_layer(base_layers, inputs, title):
+    fig, ax = plt.subplots()
+    rendering.get_base_layer(base_layers, "polygons", "EPSG:4326").plot(ax=ax)
+    ax.set_title(title)
+
+    return fig
+
+
+@pytest.fixture()
+def base_layers_paths(mock_crime_polygons, tmp_path):
+    path = tmp_path / "polygons.shp"
+    mock_crime_polygons.to_file(path)
+
+    return {"polygons": path}
+
+
+#%%
+@pytest.mark.parametrize("n_workers", [1, 2])
+def test_render_figures(base_layers_paths, tmp_path, n_workers):
+    figure_specs = [
+        {
+            "builder": _plot_layer,
+            "params": {"title": title},
+            "output": tmp_path / f"{title}.png",
+        }
+        for title in ["a", "b"]
+    ]
+
+    rendered = rendering.render_figures(
+        figure_specs,
+        base_layers_paths=base_layers_paths,
+        crs_list=["EPSG:4326"],
+        n_workers=n_workers,
+        dpi=20,
+    )
+
+    assert rendered == [spec["output"] for spec in figure_specs]
+    assert all(spec["output"].is_file() for spec in figure_specs)
+
+
+#%%
+def test_render_figures_skips_unchanged(base_layers_paths, tmp_path):
+    cache_path = tmp_path / "hashes.json"
+    figure_spec = {
+        "builder": _plot_layer,
+        "params": {"title": "a"},
+        "output": tmp_path / "a.png",
+    }
+    kwargs = {
+        "base_layers_paths": base_layers_paths,
+        "crs_list": ["EPSG:4326"],
+        "cache_path": cache_path,
+        "n_workers": 1,
+        "dpi": 20,
+    }
+
+    assert rendering.render_figures([figure_spec], **kwargs) == [tmp_path / "a.png"]
+    assert rendering.render_figures([figure_spec], **kwargs) == []
+
+    figure_spec["params"]["title"] = "b"
+    assert rendering.render_figures([figure_spec], **kwargs) == [tmp_path / "a.png"]
+
+
+#%%
+def test_render_figures_reruns_changed_builder(
+    base_layers_paths,
+    tmp_path,
+    monkeypatch,
+):
+    module_path = tmp_path / "builders_under_test.py"
+    module_source = (
+        "import matplotlib.pyplot as plt\n\n\n"
+        "def builder(base_layers, inputs):\n"
+        "    fig, ax = plt.subplots()\n"
+        "    ax.plot([0, 1], [0, 1], color='{}')\n\n"
+        "    return fig\n"
+    )
+    module_path.write_text(module_source.format("red"))
+    monkeypatch.syspath_prepend(tmp_path)
+    builders = importlib.import_module("builders_under_test")
+
+    cache_path = tmp_path / "hashes.json"
+    kwargs = {
+        "base_layers_paths": base_layers_paths,
+        "crs_list": ["EPSG:4326"],
+        "cache_path": cache_path,
+        "n_workers": 1,
+        "dpi": 20,
+    }
+    figure_spec = {"builder": builders.builder, "output": tmp_path / "a.png"}
+
+    assert rendering.render_figures([figure_spec], **kwargs) == [tmp_path / "a.png"]
+    assert rendering.render_figures([figure_spec], **kwargs) == []
+
+    module_path.write_text(module_source.format("blue"))
+    builders = importlib.reload(builders)
+    figure_spec["builder"] = builders.builder
+    assert rendering.render_figures([figure_spec], **kwargs) == [tmp_path / "a.png"]
+
+
+#%%
+def test_load_base_layers_prefers_cached_crs(mock_crime_polygons, tmp_path):
+    paths = []
+    for crs in ["EPSG:4326", "EPSG:27700"]:
+        paths.append(tmp_path / f"polygons_{crs[5:]}.parquet")
+        mock_crime_polygons.to_crs(crs).to_parquet(paths[-1])
+
+    base_layers = rendering.load_base_layers(
+        {"polygons": paths},
+        crs_list=["EPSG:27700", "EPSG:3857"],
+    )
+
+    assert base_layers["polygons"]["EPSG:27700"][0].crs == "EPSG:27700"
+    assert base_layers["polygons"]["EPSG:3857"][0].crs == "EPSG:3857"
+    assert base_layers["polygons"]["EPSG:27700"][0].has_sindex
+
+
+#%%
+def test_get_base_layer_selects_level_of_detail(synthetic_polygon_grid, tmp_path):
+    grid = synthetic_polygon_grid(400).to_crs("EPSG:27700")
+    paths = {}
+    for tolerance in [0, 25]:
+        paths[tolerance] = tmp_path / f"grid_{tolerance}.parquet"
+        grid.to_parquet(paths[tolerance])
+
+    base_layers = rendering.load_base_layers({"grid": paths}, ["EPSG:27700"])
+    levels = base_layers["grid"]["EPSG:27700"]
+
+    ## The 58 x 45 km grid has 75 m pixels in a 4 x 3 inch figure at 200 dpi.
+    coarse = rendering.get_base_layer(base_layers, "grid", "EPSG:27700", (4, 3), 200)
+    fine = rendering.get_base_layer(base_layers, "grid", "EPSG:27700", (8, 6), 300)
+    exact = rendering.get_base_layer(base_layers, "grid", "EPSG:4326")
+
+    assert coarse is levels[25]
+    assert fine is levels[0]
+    assert exact.crs == "EPSG:4326"
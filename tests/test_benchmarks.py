@@ -0,0 +1,54 @@
+"""Tests for the benchmark suite."""
+#%%
+import tempfile
+
+import pytest
+from benchmarks import run_benchmarks
+
+
+#%%
+def test_run_benchmarks_and_history(tmp_path):
+    history_path = tmp_path / "history.jsonl"
+
+    records = run_benchmarks.run_benchmarks(
+        ["ingest", "create_weights_matrix", "perform_spatial_regression_ML_Lag"],
+        [10**3, 10**4],
+        repeats=1,
+    )
+    run_benchmarks.append_history(records, history_path)
+
+    assert [(r["benchmark"], r["scale"]) for r in records] == [
+        ("ingest", 10**3),
+        ("ingest", 10**4),
+        ("create_weights_matrix", 10**3),
+        ("create_weights_matrix", 10**4),
+        ("perform_spatial_regression_ML_Lag", 10**3),
+    ]
+    assert all(r["peak_memory_mb"] > 0 for r in records)
+    assert run_benchmarks.read_history(history_path) == records
+
+
+#%%
+def test_ingest_removes_its_input(tmp_path, monkeypatch):
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+
+    run_benchmarks.run_benchmark("ingest", 10**3, repeats=1, profile_memory=False)
+
+    assert list(tmp_path.iterdir()) == []
+
+
+#%%
+def test_find_regressions():
+    history = [
+        {"benchmark": "ingest", "scale": 1000, "machine": "a", "seconds": seconds}
+        for seconds in [1.0, 1.1, 0.9]
+    ]
+    records = [
+        {"benchmark": "ingest", "scale": 1000, "machine": "a", "seconds": 1.5},
+        {"benchmark": "ingest", "scale": 1000, "machine": "b", "seconds": 9.0},
+    ]
+
+    regressions = run_benchmarks.find_regressions(records, history, threshold=1.25)
+
+    assert len(regressions) == 1
+    assert regressions[0]["ratio"] == pytest.approx(1.5)
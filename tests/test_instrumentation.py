@@ -0,0 +1,78 @@
+"""Tests for the instrumentation module."""
+#%%
+import numpy as np
+import pytest
+from crime_patterns import instrumentation
+
+
+#%%
+def test_track_records_nested_calls(tmp_path):
+    ledger_path = tmp_path / "ledger.jsonl"
+
+    @instrumentation.instrument(ledger_path=ledger_path)
+    def task_example():
+        with instrumentation.track("inner", ledger_path=ledger_path) as record:
+            record["rows"] = 3
+
+        return [1, 2]
+
+    task_example()
+    inner, outer = instrumentation.read_ledger(ledger_path)
+
+    assert (inner["name"], inner["parent"], inner["rows"]) == ("inner", "task_example", 3)
+    assert (outer["name"], outer["parent"], outer["rows"]) == ("task_example", None, 2)
+    assert outer["wall_seconds"] >= inner["wall_seconds"] >= 0
+    assert outer["run_id"] == instrumentation.RUN_ID
+
+
+#%%
+@pytest.mark.skipif(
+    instrumentation.current_rss_mb() is None,
+    reason="The current RSS is not available on this platform.",
+)
+def test_track_attributes_peak_rss_to_the_block(tmp_path):
+    ledger_path = tmp_path / "ledger.jsonl"
+
+    with instrumentation.track("large", ledger_path=ledger_path):
+        np.ones(2**25).sum()
+    with instrumentation.track("small", ledger_path=ledger_path):
+        pass
+
+    large, small = instrumentation.read_ledger(ledger_path)
+
+    ## The 256 MB array of the first block does not count towards the second.
+    assert large["peak_rss_mb"] - small["peak_rss_mb"] > 200
+    assert small["process_peak_rss_mb"] - small["peak_rss_mb"] > 200
+
+
+#%%
+def test_compare_runs_flags_slowdowns():
+    def record(run_id, name, seconds):
+        return {
+            "run_id": run_id,
+            "name": name,
+            "parent": None,
+            "wall_seconds": seconds,
+            "cpu_seconds": seconds,
+            "peak_rss_mb": 100.0,
+            "rows": 10,
+        }
+
+    records = [
+        *[record(f"run-{i}", "task_a", 1.0 + 0.1 * i) for i in range(3)],
+        *[record(f"run-{i}", "task_b", 2.0) for i in range(3)],
+        record("latest", "task_a", 1.15),
+        record("latest", "task_b", 3.0),
+        record("latest", "task_c", 1.0),
+    ]
+
+    report = {
+        row["name"]: row
+        for row in instrumentation.compare_runs(records, window=5, threshold=1.2)
+    }
+
+    assert report["task_a"]["baseline_seconds"] == pytest.approx(1.1)
+    assert not report["task_a"]["slower"]
+    assert report["task_b"]["slower"]
+    assert report["task_b"]["ratio"] == pytest.approx(1.5)
+    assert report["task_c"]["baseline_seconds"] is None
@@ -0,0 +1,168 @@
+"""Tests for the query service module."""
+#%%
+import asyncio
+import json
+import os
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+from crime_patterns import query_service
+from crime_patterns.analysis import point_patterns
+from crime_patterns import utilities as utils
+from shapely.geometry import box
+
+
+@pytest.fixture()
+def artifacts(tmp_path):
+    paths = query_service.artifact_paths("2019", bld=tmp_path)
+    for path in paths.values():
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+    ## Density increasing linearly in lon, so bilinear interpolation is exact.
+    lon = np.linspace(-0.2, 0.0, 21)
+    lat = np.linspace(51.4, 51.6, 21)
+    densities = np.repeat(np.arange(21, dtype=float)[:, None], 21, axis=1)
+    ds = xr.DataArray(densities, coords={"lon": lon, "lat": lat}, dims=["lon", "lat"])
+    point_patterns.save_hotspots(ds.to_dataset(name="densities"), paths["densities"])
+
+    ## Two tight groups of incidents and one isolated incident.
+    rng = np.random.default_rng(0)
+    incidents = np.vstack(
+        [
+            [-0.15, 51.45] + rng.normal(0, 1e-4, (20, 2)),
+            [-0.05, 51.55] + rng.normal(0, 1e-4, (20, 2)),
+            [[-0.1, 51.5]],
+        ],
+    )
+    pd.DataFrame(incidents, columns=["Longitude", "Latitude"]).to_csv(
+        paths["crime_incidences"],
+        index=False,
+    )
+    dbscan = point_patterns.cluster_crime_incidents_dbscan(
+        incidents[:, 1],
+        incidents[:, 0],
+        epsilon=0.1,
+        min_samples=5,
+    )
+    utils.save_object_to_pickle(dbscan, paths["dbscan_clusters"])
+
+    wards = gpd.GeoDataFrame(
+        {"GSS_CODE": ["W1", "W2"], "NAME": ["West", "East"]},
+        geometry=[box(-0.2, 51.4, -0.1, 51.6), box(-0.1, 51.4, 0.0, 51.6)],
+        crs="EPSG:4326",
+    )
+    wards.to_parquet(paths["wards"])
+    pd.DataFrame({"GSS_CODE": ["W1", "W2"], "lisa_class": ["HH", "ns"]}).to_csv(
+        paths["lisa"],
+        index=False,
+    )
+
+    return paths
+
+
+@pytest.fixture()
+def service(artifacts, tmp_path):
+    service = query_service.QueryService(
+        {"2019": artifacts},
+        default_year="2019",
+        cache_dir=tmp_path / "service",
+    )
+    service.reload_if_changed()
+
+    return service
+
+
+#%%
+def test_query_points(service):
+    index = service.indexes["2019"]
+    west, east, outside = index.query_points(
+        [-0.15, -0.0505, 0.5],
+        [51.45, 51.5505, 51.5],
+    )
+
+    assert isinstance(index.densities, np.memmap)
+    assert west["density"] == pytest.approx(5.0)
+    assert (west["ward_code"], west["ward_name"], west["lisa_class"]) == (
+        "W1",
+        "West",
+        "HH",
+    )
+    assert (east["ward_code"], east["lisa_class"]) == ("W2", "ns")
+    assert west["cluster"] != east["cluster"]
+    assert min(west["cluster"], east["cluster"]) >= 0
+    assert outside["density"] is None
+    assert outside["ward_code"] is None
+    assert outside["cluster"] == -1
+
+
+#%%
+def test_query_bbox(service):
+    result = service.indexes["2019"].query_bbox(-0.2, 51.4, -0.1149, 51.6)
+
+    assert [ward["ward_code"] for ward in result["wards"]] == ["W1"]
+    assert result["max_density"] == pytest.approx(8.0)
+    assert result["mean_density"] == pytest.approx(4.0)
+    assert list(result["clusters"].values()) == [20]
+
+
+#%%
+def test_dispatch(service):
+    status, point = service.dispatch("GET", "/point?lon=-0.15&lat=51.45")
+    assert status == 200
+    assert point["ward_code"] == "W1"
+
+    body = json.dumps({"points": [[-0.15, 51.45], [-0.05, 51.55]]}).encode()
+    status, batch = service.dispatch("POST", "/batch", body)
+    assert status == 200
+    assert [row["ward_code"] for row in batch["results"]] == ["W1", "W2"]
+
+    assert service.dispatch("GET", "/point?lon=x&lat=51.5")[0] == 400
+    assert service.dispatch("GET", "/point?lon=0&lat=51.5&year=2018")[0] == 404
+    assert service.dispatch("GET", "/batch")[0] == 405
+    assert service.dispatch("GET", "/health") == (200, {"years": ["2019"]})
+
+
+#%%
+def test_reload_if_changed(service, artifacts):
+    assert service.reload_if_changed() == []
+
+    lisa = pd.DataFrame({"GSS_CODE": ["W1", "W2"], "lisa_class": ["LL", "ns"]})
+    lisa.to_csv(artifacts["lisa"], index=False)
+    os.utime(artifacts["lisa"], ns=(0, 10**18))
+
+    assert service.reload_if_changed() == ["2019"]
+    assert service.indexes["2019"].query_points(-0.15, 51.45)[0]["lisa_class"] == "LL"
+
+
+#%%
+def test_serve_keep_alive(service):
+    async def request_twice():
+        server = await asyncio.start_server(service.handle_connection, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+
+        async with server:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            responses = []
+            for connection in ["keep-alive", "close"]:
+                writer.write(
+                    "GET /point?lon=-0.15&lat=51.45 HTTP/1.1\r\n"
+                    f"Host: localhost\r\nConnection: {connection}\r\n\r\n".encode(),
+                )
+                status_line = await reader.readline()
+                headers = {}
+                while (line := await reader.readline()) != b"\r\n":
+                    key, _, value = line.decode().partition(":")
+                    headers[key.lower()] = value.strip()
+                body = await reader.readexactly(int(headers["content-length"]))
+                responses.append((status_line, json.loads(body)))
+            writer.close()
+
+        return responses
+
+    responses = asyncio.run(request_twice())
+
+    assert [status for status, _ in responses] == [b"HTTP/1.1 200 OK\r\n"] * 2
+    assert responses[1][1]["ward_code"] == "W1"
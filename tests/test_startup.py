@@ -0,0 +1,89 @@
+"""Tests for the startup time of the task modules."""
+#%%
+import json
+import subprocess
+import sys
+
+import crime_patterns.config as config
+import crime_patterns.data_management as dm
+import pytest
+from crime_patterns.data_management import clean_data
+
+TASK_MODULES = [
+    "crime_patterns.data_management.task_data_download",
+    "crime_patterns.data_management.task_data_management",
+    "crime_patterns.analysis.task_analysis",
+    "crime_patterns.final.task_generate_results",
+]
+
+## Imported by the task bodies only, never when collecting the tasks.
+HEAVY_MODULES = [
+    "geopandas",
+    "libpysal",
+    "matplotlib",
+    "pandas",
+    "pyproj",
+    "pysal",
+    "scipy",
+    "seaborn",
+    "shapely",
+    "sklearn",
+    "spreg",
+    "xarray",
+]
+
+## Seconds to import all task modules after pytask, about ten times the time
+## measured on a single core. The modules took about 3 s with eager imports.
+STARTUP_TARGET = 0.75
+
+IMPORT_TASK_MODULES = f"""
+import importlib, json, sys, time
+import pytask
+start = time.perf_counter()
+for module in {TASK_MODULES!r}:
+    importlib.import_module(module)
+seconds = time.perf_counter() - start
+heavy = [module for module in {HEAVY_MODULES!r} if module in sys.modules]
+print(json.dumps({{"seconds": seconds, "heavy": heavy}}))
+"""
+
+
+def _import_task_modules():
+    """Import the task modules in a fresh interpreter."""
+    result = subprocess.run(
+        [sys.executable, "-W", "ignore", "-c", IMPORT_TASK_MODULES],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+#%%
+def test_task_modules_defer_heavy_imports():
+    assert _import_task_modules()["heavy"] == []
+
+
+#%%
+def test_task_modules_startup_time():
+    ## The best of three runs, the first one may pay for a cold file cache.
+    seconds = min(_import_task_modules()["seconds"] for _ in range(3))
+
+    assert seconds < STARTUP_TARGET
+
+
+#%%
+def test_read_data_info_is_cached():
+    data_info = config.read_data_info()
+
+    assert config.read_data_info() is data_info
+    assert "crime_years" in data_info
+
+
+#%%
+def test_data_management_exports_resolve_lazily():
+    assert dm.read_crime_data is clean_data.read_crime_data
+    assert set(dm.__all__) <= set(dir(dm))
+    with pytest.raises(AttributeError):
+        dm.not_a_function
@@ -0,0 +1,14 @@
+"""Tests for the synthetic inputs."""
+#%%
+import pytest
+
+
+#%%
+def test_synthetic_inputs_scale(synthetic_crime_incidents, synthetic_polygon_grid):
+    incidents = synthetic_crime_incidents(1000)
+    grid = synthetic_polygon_grid(1000)
+
+    assert len(incidents) == 1000
+    assert incidents["Longitude"].between(pytest.minx, pytest.maxx).all()
+    assert len(grid) == 32**2
+    assert grid.crs == "EPSG:27700"